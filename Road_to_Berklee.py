@@ -1,1600 +1,4945 @@
-# deploy ping 2026-01-16
-
-st.caption("BUILD-ID: 2026-01-16-01")
-
-# ==============================
-# PART B1 — IMPORTS & CONFIG
-# ==============================
-
-import streamlit as st
-import random
-import time
-import datetime
-from datetime import timedelta
-import hashlib
-import os
-import re
-from dataclasses import dataclass
-from typing import List, Optional, Dict
-
-import pandas as pd
-import matplotlib.pyplot as plt
-
-try:
-    import gspread
-except Exception:
-    gspread = None
-
-try:
-    import extra_streamlit_components as stx
-except Exception:
-    stx = None
-
-
-# ------------------------------
-# App Config
-# ------------------------------
-st.set_page_config(
-    page_title="Road to Berklee",
-    page_icon="🎹",
-    layout="wide"
-)
-
-OWNER_USERNAME = st.secrets.get("OWNER_USERNAME", "") if hasattr(st, "secrets") else ""
-
-WS_USERS = "Users"
-WS_HISTORY = "History"
-WS_THEORY = "Theory"
-WS_CHECKLIST = "Checklist"
-WS_WEIGHTS = "QuizWeights"
-
-# ==============================
-# PART B2 — MUSIC UTILS & NORMALIZATION
-# ==============================
-
-# -------- normalize --------
-def normalize_user_input(s: str) -> str:
-    if s is None:
-        return ""
-    s = str(s).strip()
-    s = (s.replace("＋", "+")
-           .replace("－", "-")
-           .replace("–", "-")
-           .replace("—", "-")
-           .replace("♯", "#")
-           .replace("♭", "b")
-           .replace("𝄪", "##")
-           .replace("𝄫", "bb"))
-    s = re.sub(r"\s+", " ", s)
-    return s.strip()
-
-
-# -------- pitch / note --------
-NOTES = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
-NOTE_TO_IDX = {n: i for i, n in enumerate(NOTES)}
-ENH_PITCH = {'C#':'Db','D#':'Eb','F#':'Gb','G#':'Ab','A#':'Bb','Cb':'B','B#':'C','E#':'F','Fb':'E'}
-
-def norm_pitch(p: str) -> str:
-    s = normalize_user_input(p).replace(" ", "")
-    if not s:
-        return s
-    s = s[0].upper() + s[1:]
-    s = ENH_PITCH.get(s, s)
-    return s
-
-def pitch_idx(p: str) -> int:
-    return NOTE_TO_IDX.get(norm_pitch(p), -1)
-
-def idx_to_pitch(i: int) -> str:
-    return NOTES[i % 12]
-
-def transpose_pitch(p: str, semitones: int) -> str:
-    i = pitch_idx(p)
-    if i < 0:
-        return norm_pitch(p)
-    return idx_to_pitch(i + semitones)
-
-
-# -------- degree --------
-DEGREE_MAP = {
-    'I':0,'bII':1,'#I':1,'II':2,'bIII':3,'#II':3,'III':4,'bIV':4,
-    'IV':5,'#III':5,'bV':6,'#IV':6,'V':7,'bVI':8,'#V':8,
-    'VI':9,'bVII':10,'#VI':10,'VII':11,'bI':11
-}
-
-def degree_to_semitone(deg: str) -> int:
-    d = normalize_user_input(deg).replace(" ", "")
-    return DEGREE_MAP.get(d, 0)
-
-def degree_to_pitch_in_C(deg: str) -> str:
-    return transpose_pitch("C", degree_to_semitone(deg))
-
-
-# -------- interval --------
-def interval_to_semitones(q: str, n: int) -> int:
-    base = {1:0,2:2,3:4,4:5,5:7,6:9,7:11}
-    octs = (n - 1) // 7
-    deg = ((n - 1) % 7) + 1
-    semi = base[deg] + 12 * octs
-    if q == "m": return semi - 1
-    if q == "+": return semi + 1
-    if q == "-": return semi - 1
-    return semi
-
-def interval_to_pitch_from_C(itv: str) -> str:
-    itv = normalize_user_input(itv).replace(" ", "").replace("P.", "P")
-    if itv and itv[0] in ["+","-"] and itv[1:].isdigit():
-        return transpose_pitch("C", int(itv))
-    q = itv[0]
-    n = int(itv[1:]) if itv[1:].isdigit() else 1
-    return transpose_pitch("C", interval_to_semitones(q, n))
-
-
-# -------- circle of 5th --------
-CYCLE = ["C","G","D","A","E","B","Gb","Db","Ab","Eb","Bb","F"]
-CYCLE_INDEX = {p: i for i, p in enumerate(CYCLE)}
-_ENH_TO_CYCLE = {"F#":"Gb","C#":"Db","G#":"Ab","D#":"Eb","A#":"Bb","Cb":"B","B#":"C","E#":"F","Fb":"E"}
-
-def _to_cycle_pitch(p: str) -> str:
-    p = norm_pitch(p)
-    return _ENH_TO_CYCLE.get(p, p)
-
-def cycle_r_steps_to_pitch(p: str) -> int:
-    return CYCLE_INDEX.get(_to_cycle_pitch(p), 0)
-
-
-# -------- tension --------
-_TENSION_TO_SEMI = {"b9":1,"9":2,"#9":3,"11":5,"#11":6,"b13":8,"13":9}
-
-def tension_to_pitch_from_C(t: str) -> str:
-    t = normalize_user_input(t).replace(" ", "")
-    return transpose_pitch("C", _TENSION_TO_SEMI.get(t, 2))
-
-
-# -------- helpers --------
-def relative_minor(maj: str) -> str:
-    return transpose_pitch(maj, -3)
-
-def semitone_distance(a: str, b: str) -> int:
-    ia, ib = pitch_idx(a), pitch_idx(b)
-    if ia < 0 or ib < 0:
-        return 0
-    return (ib - ia) % 12
-# ==============================
-# PART B3 — DATA TABLES + QUESTION MODEL + GENERATORS
-# ==============================
-
-# tables
-DISTANCE_TO_DEGREE = {
-    1:['I'], 2:['#I','bII'], 3:['II'], 4:['#II','bIII'], 5:['III','bIV'], 6:['IV','#III'],
-    7:['#IV','bV'], 8:['V'], 9:['#V','bVI'], 10:['VI'], 11:['#VI','bVII'], 12:['VII','bI'], 13:['P8']
-}
-
-SOLFEGE = {
-    'I':'Do','II':'Re','III':'Mi','IV':'Fa','V':'Sol','VI':'La','VII':'Ti',
-    'bII':'Ra','bIII':'Me','bV':'Se','bVI':'Le','bVII':'Te',
-    '#I':'Di','#II':'Ri','#IV':'Fi','#V':'Si','#VI':'Li','bI':'Ti'
-}
-
-CHORD_FORMULAS = {
-    'maj7':[0,4,7,11],'mM7':[0,3,7,11],'6':[0,4,7,9],'m6':[0,3,7,9],
-    '7':[0,4,7,10],'m7':[0,3,7,10],'m7b5':[0,3,6,10],'dim7':[0,3,6,9],
-    'aug':[0,4,8],'aug7':[0,4,8,10],'7(b5)':[0,4,6,10],'+M7':[0,4,8,11],'7sus4':[0,5,7,10]
-}
-
-MAJOR_BY_FLATS = {0:"C",1:"F",2:"Bb",3:"Eb",4:"Ab",5:"Db",6:"Gb",7:"Cb"}
-MAJOR_BY_SHARPS = {0:"C",1:"G",2:"D",3:"A",4:"E",5:"B",6:"F#",7:"C#"}
-
-CATEGORY_INFO = {
-    'Enharmonics': ['Degrees', 'Number', 'Natural Form'],
-    'Warming up': ['Counting keys', 'Finding degrees', 'Chord tones', 'Key signatures', 'Solfege'],
-    'Intervals': ['Alternative', 'Tracking'],
-    'Chord Forms': ['Relationships', 'Extract (Degree)', '9 chord', 'Rootless'],
-    'Cycle of 5th': ['P5 down', 'P5 up', 'r calc', '2-5-1'],
-    'Locations': ['Deg->Pitch', 'Pitch->Deg'],
-    'Tritones': ['Pitch', 'Degree', 'Dom7', 'Dim7'],
-    'Modes': ['Alterations', 'Tensions', 'Chords(Deg)', 'Chords(Key)'],
-    'Minor': ['Chords', 'Tensions', 'Pitch'],
-    'Mastery': ['Functions', 'Degrees', 'Pitches', 'Avail Scales', 'Pivot', 'Similarities']
-}
-
-# Enharmonics
-ENH_DEGREE_PAIRS = [
-    ("#VII", "I"), ("#I", "bII"), ("#II", "bIII"), ("bIV", "III"),
-    ("IV", "#III"), ("#V", "bVI"), ("#VI", "bVII"), ("VII", "bI")
-]
-ENH_NUMBER_GROUPS = [
-    ["1","8","#7"], ["#1","b2","#8","b9"], ["2","9"], ["#2","b3","#9","b10"],
-    ["3","b4","10","b11"], ["4","#3","11","#10"], ["#4","b5","#11","b12"], ["5","12"],
-    ["#5","b6","#12","b13"], ["6","13"], ["#6","b7","#13","b14"], ["7","b8","14"]
-]
-ENH_INTERVAL_GROUPS = [
-    ["P1","+7","-2","P8","-9"], ["m2","+1","m9","+8"], ["M2","-3","M9","-10"],
-    ["m3","+2","m10","+9"], ["M3","-4","M10","-11"], ["P4","+3","P11","+10"],
-    ["+4","-5","+11","-12"], ["P5","-6","P12","-13"], ["m6","+5","m13","+12"],
-    ["M6","-7","M13","-14"], ["m7","+6","m14","+13"], ["M7","-8","M14"]
-]
-
-# Modes / Minor / Mastery
-MODE_ALTERATIONS = {
-    "Dorian": ["bIII","bVII"],
-    "Phrygian": ["bII","bIII","bVI","bVII"],
-    "Lydian": ["#IV"],
-    "Mixolydian": ["bVII"],
-    "Aeolian": ["bII","bIII","bVI","bVII"],
-    "Locrian": ["bII","bIII","bV","bVI","bVII"],
-}
-MODE_TENSIONS = {
-    "Ionian": ["9","13"],
-    "Dorian": ["9","11"],
-    "Phrygian": ["11"],
-    "Lydian": ["#4"],
-    "Mixolydian": ["9","13"],
-    "Aeolian": ["9","11"],
-    "Locrian": ["11","b13"],
-}
-MODE_7TH_CHORDS_DEG = {
-    "Ionian": ["Imaj7","IIm7","IIIm7","IVmaj7","V7","VIm7","VIIm7b5"],
-    "Dorian": ["Im7","IIm7","bIIImaj7","IV7","Vm7","VIm7b5","bVIImaj7"],
-    "Phrygian": ["Im7","bIImaj7","bIII7","IVm7","Vm7b5","bVImaj7","bVIIm7"],
-    "Lydian": ["Imaj7","II7","IIIm7","#IVm7b5","Vmaj7","VIm7","VIIm7"],
-    "Mixolydian": ["I7","IIm7","IIIm7b5","IVmaj7","Vm7","VIm7","bVIImaj7"],
-    "Aeolian": ["Im7","IIm7b5","bIIImaj7","IVm7","Vm7","bVImaj7","bVII7"],
-    "Locrian": ["Im7b5","bIImaj7","bIIIm7","IVm7","bVmaj7","bVI7","bVIIm7"],
-}
-
-MINOR_DEGREES = {
-    "Natural minor": ["I","II","bIII","IV","V","bVI","bVII"],
-    "Harmonic minor": ["I","II","bIII","IV","V","bVI","VII"],
-    "Melodic minor": ["I","II","bIII","IV","V","VI","VII"],
-}
-MINOR_CHORD_FORMS = {
-    "Natural minor": ["m7","m7b5","maj7","m7","m7","maj7","7"],
-    "Harmonic minor": ["mM7","m7b5","+M7","m7","7","maj7","dim7"],
-    "Melodic minor": ["mM7","m7","+M7","7","7","m7b5","m7b5"],
-}
-MINOR_TENSIONS = {
-    "Natural minor": [["9","11"],["11","b13"],["9","13"],["9","11"],["11"],["9","#11"],["9","13"]],
-    "Harmonic minor": [["9","11"],["11","13"],["9"],["9","#11"],["9","#11"],["9","b13"],["9","11"]],
-    "Melodic minor": [["9","11","13"],["11","13"],["9","#11","13"],["9","#11","13"],["9","b13"],["9","11","b13"],["11","b13"]],
-}
-
-FUNCTIONS = {
-    'T': set(['I','I6','Imaj7','IIIm7','VIm7','I7','IIIm7b5','III7']),
-    'Tm': set(['Im','Im6','Imb6','Im7','ImM7','bIIImaj7','bIII+M7','VIm7b5']),
-    'SD': set(['IV','IV6','IVmaj7','IIm7','IV7','bVII','bVIImaj7','VII7']),
-    'SDm': set(['IVm','IVm6','IVm7','IIm7b5','bVI6','bVImaj7','bVII7','bIImaj7','bVI7','IVmM7']),
-    'D': set(['V','V7','VIIm7b6','bII7','VIIdim7']),
-    'Dm': set(['Vm','Vm7']),
-}
-FUNCTION_OVERRIDES = {'#IVm7b5':['T','SD'], 'bVImaj7':['SDm','Tm']}
-
-SCALE_DEGREES = {
-    "Ionian": ["I","II","III","IV","V","VI","VII"],
-    "Dorian": ["I","II","bIII","IV","V","VI","bVII"],
-    "Phrygian": ["I","bII","bIII","IV","V","bVI","bVII"],
-    "Lydian": ["I","II","III","#IV","V","VI","VII"],
-    "Mixolydian": ["I","II","III","IV","V","VI","bVII"],
-    "Aeolian": ["I","bII","bIII","IV","V","bVI","bVII"],
-    "Locrian": ["I","bII","bIII","IV","bV","bVI","bVII"],
-    "Natural minor": ["I","II","bIII","IV","V","bVI","bVII"],
-    "Harmonic minor": ["I","II","bIII","IV","V","bVI","VII"],
-    "Melodic minor": ["I","II","bIII","IV","V","VI","VII"],
-}
-AVAILABLE_SCALES = {
-    "Ionian": ['I','I6','Imaj7'],
-    "Dorian": ['IVm','IVm6','IVm7','IIm7'],
-    "Phrygian": ['IIIm7'],
-    "Lydian": ['IV','IVmaj7','bVII','bVIImaj7','bVImaj7','bIImaj7','bIIImaj7'],
-    "Mixolydian": ['V','bVII7','V7/IV','V7/V','V7'],
-    "Aeolian": ['VIm7'],
-    "Locrian": ['VIIm7b5','#IVm7b5','IIm7b5'],
-    "All": ['I7'],
-    "Lydian b7": ['IV7','bVII7','bVI7','bII7','IV6'],
-    "Altered": ['VII7'],
-    "HmP5↓": ['V7'],
-    "Combination of Diminished": ['V7','bII7','bVII7'],
-}
-
-_ROMAN_RE = re.compile(r"^(b|#)?(I|II|III|IV|V|VI|VII)(.*)$")
-
-def degchord_to_pitchchord(key: str, degch: str) -> str:
-    m = _ROMAN_RE.match(degch)
-    if not m:
-        return f"{key}{degch}"
-    acc = m.group(1) or ""
-    roman = m.group(2)
-    qual = m.group(3) or ""
-    deg = f"{acc}{roman}"
-    root = transpose_pitch(key, degree_to_semitone(deg))
-    return f"{root}{qual}"
-
-def ord_suffix(n: int) -> str:
-    return {1:"Ist",2:"IInd",3:"IIIrd",4:"IVth",5:"Vth",6:"VIth",7:"VIIth"}.get(n, f"{n}th")
-
-def inv_degree_from_semi(semi: int) -> str:
-    semi %= 12
-    cands = [k for k,v in DEGREE_MAP.items() if v == semi]
-    return cands[0] if cands else "I"
-
-
-# model
-@dataclass
-class Question:
-    category: str
-    subcategory: str
-    prompt: str
-    answers: List[str]
-    kind: str
-    sep: Optional[str] = None
-    rule: str = ""
-
-
-def qbuild(cat: str, sub: str, prompt: str, answers: List[str], kind: str, sep: Optional[str] = None, rule: str = "") -> Question:
-    return Question(cat, sub, prompt, answers, kind, sep, rule)
-
-
-# generators
-def gen_enh_degrees() -> Question:
-    a, b = random.choice(ENH_DEGREE_PAIRS)
-    ask = random.choice([a, b])
-    ans = b if ask == a else a
-    return qbuild("Enharmonics", "Degrees", f"What is {ask}'s enharmonic?", [ans], "degree")
-
-def gen_enh_number() -> Question:
-    group = random.choice(ENH_NUMBER_GROUPS)
-    shown = random.choice(group)
-    expected = [x for x in group if x != shown]
-    return qbuild("Enharmonics", "Number", f"What are {shown}'s enharmonics?", expected, "number", sep=",")
-
-def gen_enh_interval() -> Question:
-    group = random.choice(ENH_INTERVAL_GROUPS)
-    shown = random.choice(group)
-    expected = [x for x in group if x != shown]
-    return qbuild("Enharmonics", "Natural Form", f"What are {shown}'s enharmonics?", expected, "interval", sep=",")
-
-def gen_warm_counting_keys() -> Question:
-    keynum = random.randint(1, 24)
-    d = ((keynum - 1) % 13) + 1
-    return qbuild("Warming up","Counting keys", f"What degree has {keynum}keys?", DISTANCE_TO_DEGREE.get(d, ["I"]), "degree")
-
-def gen_warm_finding_degrees() -> Question:
-    root = random.choice(NOTES)
-    deg = random.choice(list(DEGREE_MAP.keys()))
-    ans = transpose_pitch(root, degree_to_semitone(deg))
-    return qbuild("Warming up","Finding degrees", f"What pitch is {deg} of {root}Key?", [ans], "pitch")
-
-def gen_warm_chord_tones() -> Question:
-    root = random.choice(NOTES)
-    chord = random.choice(list(CHORD_FORMULAS.keys()))
-    tones = [transpose_pitch(root, s) for s in CHORD_FORMULAS[chord]]
-    return qbuild("Warming up","Chord tones", f"What are the Chord tones of {root}{chord}?", tones, "pitch", sep=",")
-
-def gen_warm_key_signatures() -> Question:
-    is_major = random.choice([True, False])
-    t = random.choice(["#", "b"])
-    n = random.randint(0, 7)
-    sig = (t * n) if n > 0 else ""
-    maj = MAJOR_BY_FLATS.get(n, "C") if t == "b" else MAJOR_BY_SHARPS.get(n, "C")
-    ans = maj if is_major else relative_minor(maj)
-    qtype = "major" if is_major else "minor"
-    return qbuild("Warming up","Key signatures", f"What {qtype} key has ({sig})?", [norm_pitch(ans)], "pitch")
-
-def gen_warm_solfege() -> Question:
-    deg = random.choice(list(SOLFEGE.keys()))
-    return qbuild("Warming up","Solfege", f"What is {deg}'s solfege?", [SOLFEGE[deg]], "solfege")
-
-def gen_cycle_r_calc() -> Question:
-    form = random.choice([1,2,3])
-    if form == 1:
-        deg = random.choice(list(DEGREE_MAP.keys()))
-        p = degree_to_pitch_in_C(deg)
-        ans = str(cycle_r_steps_to_pitch(p))
-        return qbuild("Cycle of 5th","r calc", f"How many 'r's do you need to get {deg}?", [ans], "number")
-    if form == 2:
-        itv = random.choice(["m2","M2","m3","M3","P4","P5","m6","M6","m7","M7","+11","-2","+7","-12"])
-        p = interval_to_pitch_from_C(itv)
-        ans = str(cycle_r_steps_to_pitch(p))
-        return qbuild("Cycle of 5th","r calc", f"How many 'r's do you need to get {itv}?", [ans], "number")
-    t = random.choice(list(_TENSION_TO_SEMI.keys()))
-    p = tension_to_pitch_from_C(t)
-    ans = str(cycle_r_steps_to_pitch(p))
-    return qbuild("Cycle of 5th","r calc", f"How many 'r's do you need to get {t}?", [ans], "number")
-
-def gen_modes_alterations() -> Question:
-    mode = random.choice(list(MODE_ALTERATIONS.keys()))
-    return qbuild("Modes","Alterations", f"What degree should be flatted or sharped in {mode} scale?", MODE_ALTERATIONS[mode], "degree", sep=",")
-
-def gen_modes_tensions() -> Question:
-    mode = random.choice(list(MODE_TENSIONS.keys()))
-    return qbuild("Modes","Tensions", f"What are the tension notes of {mode}?", MODE_TENSIONS[mode], "tension", sep=",")
-
-def gen_modes_chords_deg() -> Question:
-    mode = random.choice(list(MODE_7TH_CHORDS_DEG.keys()))
-    n = random.randint(1, 7)
-    ans = MODE_7TH_CHORDS_DEG[mode][n-1]
-    return qbuild("Modes","Chords(Deg)", f"What is {ord_suffix(n)} 7th chord in {mode}?", [ans], "degree")
-
-def gen_modes_chords_key() -> Question:
-    mode = random.choice(list(MODE_7TH_CHORDS_DEG.keys()))
-    key = random.choice(NOTES)
-    n = random.randint(1, 7)
-    degch = MODE_7TH_CHORDS_DEG[mode][n-1]
-    ans = degchord_to_pitchchord(key, degch)
-    return qbuild("Modes","Chords(Key)", f"What is {ord_suffix(n)} 7th chord in {key}{mode}?", [ans], "chord")
-
-def gen_mastery_pivot() -> Question:
-    chord_type = random.choice(["maj7","7","m7","m7b5"])
-    deg = random.choice(list(DEGREE_MAP.keys()))
-    semi = degree_to_semitone(deg)
-    outs: List[str] = []
-    if chord_type == "maj7":
-        outs = [inv_degree_from_semi(semi + 7), inv_degree_from_semi(semi)]
-    elif chord_type == "7":
-        outs = [inv_degree_from_semi(semi + 5)]
-    elif chord_type == "m7":
-        outs = [inv_degree_from_semi(semi + 10), inv_degree_from_semi(semi + 8), inv_degree_from_semi(semi + 3)]
-    else:
-        outs = [inv_degree_from_semi(semi + 1)]
-    outs = list(dict.fromkeys(outs))
-    return qbuild("Mastery","Pivot", f"What keys have {deg}{chord_type} chord as a pivot chord?", outs, "degree", sep=",")
-
-def gen_locations_deg_to_pitch() -> Question:
-    key = random.choice(NOTES)
-    deg = random.choice(list(DEGREE_MAP.keys()))
-    ans = transpose_pitch(key, degree_to_semitone(deg))
-    return qbuild("Locations", "Deg->Pitch", f"{key}Key에서 {deg}는 어떤 Pitch?", [ans], "pitch")
-
-def gen_locations_pitch_to_deg() -> Question:
-    key = random.choice(NOTES)
-    deg = random.choice(list(DEGREE_MAP.keys()))
-    pitch = transpose_pitch(key, degree_to_semitone(deg))
-    return qbuild("Locations", "Pitch->Deg", f"{key}Key에서 {pitch}는 어떤 Degree?", [deg], "degree")
-
-def gen_tritone_pitch() -> Question:
-    p = random.choice(NOTES)
-    ans = transpose_pitch(p, 6)
-    return qbuild("Tritones", "Pitch", f"What is the tritone of {p}?", [ans], "pitch")
-
-def gen_tritone_degree() -> Question:
-    deg = random.choice(list(DEGREE_MAP.keys()))
-    semi = (degree_to_semitone(deg) + 6) % 12
-    ans = inv_degree_from_semi(semi)
-    return qbuild("Tritones", "Degree", f"What is the tritone degree of {deg}?", [ans], "degree")
-
-def gen_tritone_dom7() -> Question:
-    root = random.choice(NOTES)
-    ans = f"{transpose_pitch(root, 6)}7"
-    return qbuild("Tritones", "Dom7", f"What is the tritone substitution of {root}7?", [ans], "chord")
-
-def gen_tritone_dim7() -> Question:
-    root = random.choice(NOTES)
-    ans = transpose_pitch(root, 6)
-    return qbuild("Tritones", "Dim7", f"In {root}dim7, what note is a tritone away from the root?", [ans], "pitch")
-
-def gen_cycle_p5_down() -> Question:
-    p = random.choice(NOTES)
-    ans = transpose_pitch(p, -7)
-    return qbuild("Cycle of 5th","P5 down", f"P5 down from {p} is?", [ans], "pitch")
-
-def gen_cycle_p5_up() -> Question:
-    p = random.choice(NOTES)
-    ans = transpose_pitch(p, +7)
-    return qbuild("Cycle of 5th","P5 up", f"P5 up from {p} is?", [ans], "pitch")
-
-def gen_cycle_251() -> Question:
-    key = random.choice(NOTES)
-    ii = degchord_to_pitchchord(key, "IIm7")
-    v = degchord_to_pitchchord(key, "V7")
-    i = degchord_to_pitchchord(key, "Imaj7")
-    return qbuild("Cycle of 5th","2-5-1", f"Write 2-5-1 in key of {key} (comma-separated)", [ii, v, i], "chord", sep=",")
-
-def gen_minor_chords() -> Question:
-    scale = random.choice(list(MINOR_CHORD_FORMS.keys()))
-    n = random.randint(1, 7)
-    deg = MINOR_DEGREES[scale][n-1]
-    form = MINOR_CHORD_FORMS[scale][n-1]
-    ans = f"{deg}{form}"
-    return qbuild("Minor","Chords", f"What is {ord_suffix(n)} chord in {scale}?", [ans], "degree")
-
-def gen_minor_tensions() -> Question:
-    scale = random.choice(list(MINOR_TENSIONS.keys()))
-    n = random.randint(1, 7)
-    ans = MINOR_TENSIONS[scale][n-1]
-    return qbuild("Minor","Tensions", f"What are the tensions of {ord_suffix(n)} chord in {scale}?", ans, "tension", sep=",")
-
-def gen_minor_pitch() -> Question:
-    scale = random.choice(list(MINOR_DEGREES.keys()))
-    key = random.choice(NOTES)
-    deg = random.choice(MINOR_DEGREES[scale])
-    ans = transpose_pitch(key, degree_to_semitone(deg))
-    return qbuild("Minor","Pitch", f"In {key}{scale}, what pitch is {deg}?", [ans], "pitch")
-
-def _interval_groups_for_alternative() -> List[List[str]]:
-    # 같은 음(동일 pitch class)을 만드는 서로 다른 표기들
-    return [
-        ["P1","+7","-2","P8","-9"],
-        ["m2","+1","m9","+8"],
-        ["M2","-3","M9","-10"],
-        ["m3","+2","m10","+9"],
-        ["M3","-4","M10","-11"],
-        ["P4","+3","P11","+10"],
-        ["+4","-5","+11","-12"],
-        ["P5","-6","P12","-13"],
-        ["m6","+5","m13","+12"],
-        ["M6","-7","M13","-14"],
-        ["m7","+6","m14","+13"],
-        ["M7","-8","M14"],
-    ]
-
-def gen_intervals_alternative() -> Question:
-    group = random.choice(_interval_groups_for_alternative())
-    shown = random.choice(group)
-    expected = [x for x in group if x != shown]
-    return qbuild("Intervals", "Alternative", f"What are {shown}'s alternative intervals? (comma-separated)", expected, "interval", sep=",")
-
-def gen_intervals_tracking() -> Question:
-    root = random.choice(NOTES)
-    q = random.choice(["m","M","P","+","-"])
-    n = random.choice([1,2,3,4,5,6,7,8,9,10,11,12,13,14])
-    itv = f"{q}{n}" if q in ["m","M","P"] else f"{q}{interval_to_semitones(q, n)}"
-    ans = transpose_pitch(root, semitone_distance("C", interval_to_pitch_from_C(itv)))
-    return qbuild("Intervals", "Tracking", f"From {root}, what is {itv}?", [ans], "pitch")
-
-CHORD_LIST = list(CHORD_FORMULAS.keys())
-
-def _chord_tones(root: str, form: str) -> List[str]:
-    return [transpose_pitch(root, s) for s in CHORD_FORMULAS[form]]
-
-def gen_chord_relationships() -> Question:
-    a, b = random.sample(CHORD_LIST, 2)
-    shared = set(CHORD_FORMULAS[a]).intersection(set(CHORD_FORMULAS[b]))
-    prompt = f"Do {a} and {b} share any common chord tones? (yes/no)"
-    ans = ["yes"] if len(shared) > 0 else ["no"]
-    return qbuild("Chord Forms", "Relationships", prompt, ans, "text")
-
-def gen_chord_extract_degree() -> Question:
-    form = random.choice(CHORD_LIST)
-    deg = random.choice(list(DEGREE_MAP.keys()))
-    root = degree_to_pitch_in_C(deg)
-    tones = _chord_tones(root, form)
-    return qbuild("Chord Forms", "Extract (Degree)", f"Chord tones of {deg}{form} in C (comma-separated)", tones, "pitch", sep=",")
-
-def gen_chord_9() -> Question:
-    root = random.choice(NOTES)
-    form = random.choice(["maj7","m7","7","m7b5"])
-    base = CHORD_FORMULAS[form]
-    ninth = 14  # 9th = 14 semitones from root
-    tones = [transpose_pitch(root, s) for s in (base + [ninth])]
-    return qbuild("Chord Forms", "9 chord", f"What are the chord tones of {root}{form}(9)? (comma-separated)", tones, "pitch", sep=",")
-
-def gen_chord_rootless() -> Question:
-    root = random.choice(NOTES)
-    form = random.choice(["7","m7","maj7","m7b5"])
-    tones = _chord_tones(root, form)
-    tones_no_root = [t for i, t in enumerate(tones) if i != 0]
-    return qbuild("Chord Forms", "Rootless", f"Rootless voicing tones of {root}{form} (comma-separated)", tones_no_root, "pitch", sep=",")
-
-def _function_of(ch: str) -> List[str]:
-    if ch in FUNCTION_OVERRIDES:
-        return FUNCTION_OVERRIDES[ch]
-    outs = []
-    for fn, s in FUNCTIONS.items():
-        if ch in s:
-            outs.append(fn)
-    return outs or ["T"]
-
-def gen_mastery_functions() -> Question:
-    ch = random.choice(sum([list(v) for v in FUNCTIONS.values()], []))
-    ans = _function_of(ch)
-    return qbuild("Mastery","Functions", f"What is the function of {ch}?", ans, "text", sep="," if len(ans) > 1 else None)
-
-def gen_mastery_degrees() -> Question:
-    scale = random.choice(list(SCALE_DEGREES.keys()))
-    n = random.randint(1, 7)
-    ans = SCALE_DEGREES[scale][n-1]
-    return qbuild("Mastery","Degrees", f"In {scale}, what is the {ord_suffix(n)} degree?", [ans], "degree")
-
-def gen_mastery_pitches() -> Question:
-    key = random.choice(NOTES)
-    scale = random.choice(list(SCALE_DEGREES.keys()))
-    deg = random.choice(SCALE_DEGREES[scale])
-    ans = transpose_pitch(key, degree_to_semitone(deg))
-    return qbuild("Mastery","Pitches", f"In {key}{scale}, what pitch is {deg}?", [ans], "pitch")
-
-def gen_mastery_avail_scales() -> Question:
-    scale = random.choice(list(AVAILABLE_SCALES.keys()))
-    ch = random.choice(AVAILABLE_SCALES[scale])
-    return qbuild("Mastery","Avail Scales", f"What scale includes chord {ch}?", [scale], "text")
-
-def gen_mastery_similarities() -> Question:
-    a, b = random.sample(list(SCALE_DEGREES.keys()), 2)
-    sa, sb = set(SCALE_DEGREES[a]), set(SCALE_DEGREES[b])
-    common = sorted(list(sa.intersection(sb)))
-    if not common:
-        common = ["(none)"]
-    return qbuild("Mastery","Similarities", f"Common degrees between {a} and {b}? (comma-separated)", common, "degree", sep="," if common != ["(none)"] else None)
-
-
-# dispatcher
-GEN_DISPATCH: Dict[tuple, callable] = {
-    ("Enharmonics","Degrees"): gen_enh_degrees,
-    ("Enharmonics","Number"): gen_enh_number,
-    ("Enharmonics","Natural Form"): gen_enh_interval,
-    ("Warming up","Counting keys"): gen_warm_counting_keys,
-    ("Warming up","Finding degrees"): gen_warm_finding_degrees,
-    ("Warming up","Chord tones"): gen_warm_chord_tones,
-    ("Warming up","Key signatures"): gen_warm_key_signatures,
-    ("Warming up","Solfege"): gen_warm_solfege,
-    ("Cycle of 5th","r calc"): gen_cycle_r_calc,
-    ("Modes","Alterations"): gen_modes_alterations,
-    ("Modes","Tensions"): gen_modes_tensions,
-    ("Modes","Chords(Deg)"): gen_modes_chords_deg,
-    ("Modes","Chords(Key)"): gen_modes_chords_key,
-    ("Mastery","Pivot"): gen_mastery_pivot,
-    ("Locations","Deg->Pitch"): gen_locations_deg_to_pitch,
-    ("Locations","Pitch->Deg"): gen_locations_pitch_to_deg,
-    ("Tritones","Pitch"): gen_tritone_pitch,
-    ("Tritones","Degree"): gen_tritone_degree,
-    ("Tritones","Dom7"): gen_tritone_dom7,
-    ("Tritones","Dim7"): gen_tritone_dim7,
-    ("Cycle of 5th","P5 down"): gen_cycle_p5_down,
-    ("Cycle of 5th","P5 up"): gen_cycle_p5_up,
-    ("Cycle of 5th","2-5-1"): gen_cycle_251,
-    ("Minor","Chords"): gen_minor_chords,
-    ("Minor","Tensions"): gen_minor_tensions,
-    ("Minor","Pitch"): gen_minor_pitch,
-    ("Intervals","Alternative"): gen_intervals_alternative,
-    ("Intervals","Tracking"): gen_intervals_tracking,
-    ("Chord Forms","Relationships"): gen_chord_relationships,
-    ("Chord Forms","Extract (Degree)"): gen_chord_extract_degree,
-    ("Chord Forms","9 chord"): gen_chord_9,
-    ("Chord Forms","Rootless"): gen_chord_rootless,
-    ("Mastery","Functions"): gen_mastery_functions,
-    ("Mastery","Degrees"): gen_mastery_degrees,
-    ("Mastery","Pitches"): gen_mastery_pitches,
-    ("Mastery","Avail Scales"): gen_mastery_avail_scales,
-    ("Mastery","Similarities"): gen_mastery_similarities,
-
-}
-
-def generate_question(cat: str, sub: str) -> Question:
-    fn = GEN_DISPATCH.get((cat, sub))
-    if fn:
-        return fn()
-    return qbuild(cat, sub, f"Determine the {sub}.", ["C"], "text")
-
-def _weights_map() -> Dict[tuple, float]:
-    base = {(c, s): 1.0 for c, subs in CATEGORY_INFO.items() for s in subs}
-    df = st.session_state.stat_mgr.load_weights_df() if "stat_mgr" in st.session_state else pd.DataFrame()
-    if df is None or df.empty:
-        return base
-    for _, r in df.iterrows():
-        c = str(r.get("category", ""))
-        s = str(r.get("subcategory", ""))
-        if (c, s) in base:
-            try:
-                base[(c, s)] = max(0.0, float(r.get("weight", 1.0)))
-            except Exception:
-                base[(c, s)] = 1.0
-    return base
-
-def generate_question_weighted() -> Question:
-    wm = _weights_map()
-    pairs = list(wm.keys())
-    ws = [wm[p] for p in pairs]
-    if sum(ws) <= 0:
-        cat, sub = random.choice(pairs)
-        return generate_question(cat, sub)
-    cat, sub = random.choices(pairs, weights=ws, k=1)[0]
-    return generate_question(cat, sub)
-
-# ==============================
-# PART B4 — GRADING + SMART KEYPAD
-# ==============================
-
-# -------- grading --------
-def tokenize_answer(s: str, sep: Optional[str]) -> List[str]:
-    s = normalize_user_input(s)
-    if not sep:
-        return [s]
-    parts = [p.strip() for p in s.split(sep)]
-    return [p for p in parts if p]
-
-def is_answer_correct(q: Question, user_input: str) -> bool:
-    user_tokens = tokenize_answer(user_input, q.sep)
-    exp = [normalize_user_input(a) for a in q.answers]
-
-    if q.sep:
-        return set(user_tokens) == set(exp)
-    return any(normalize_user_input(user_input) == e for e in exp)
-
-
-# -------- keypad sets --------
-KEYPAD_SETS = {
-    "pitch": [
-        ["♭","♯"], ["C","D","E","F"], ["G","A","B"], [","], ["⬅️","❌","✅"]
-    ],
-    "degree": [
-        ["♭","♯"], ["I","II","III"], ["IV","V","VI","VII"], [","], ["⬅️","❌","✅"]
-    ],
-    "number": [
-        ["+","-"], ["1","2","3","4","5"], ["6","7","8","9","0"], [","], ["⬅️","❌","✅"]
-    ],
-    "interval": [
-        ["+","-","m","M","P"], ["1","2","3","4","5"], ["6","7","8","9"], [","], ["⬅️","❌","✅"]
-    ],
-    "solfege": [
-        ["Do","Re","Mi","Fa"], ["Sol","La","Ti"],
-        ["Di","Ri","Fi","Si","Li"], ["Ra","Me","Se","Le","Te"], ["⬅️","❌","✅"]
-    ],
-    "tension": [
-        ["♭","♯"], ["b9","9","#9"], ["11","#11"], ["b13","13"], [","], ["⬅️","❌","✅"]
-    ],
-    "chord": [
-        ["♭","♯"], ["C","D","E","F"], ["G","A","B"],
-        ["maj7","m7","7","m7b5"], ["dim7","aug","+M7","sus4"],
-        ["/",","], ["⬅️","❌","✅"]
-    ],
-    "text": [
-        ["C","D","E","F","G","A","B"], ["⬅️","❌","✅"]
-    ]
-}
-
-def keypad_for_kind(kind: str):
-    return KEYPAD_SETS.get(kind, KEYPAD_SETS["text"])
-
-def add_input(k):
-    st.session_state.user_input_buffer += k
-
-def del_input():
-    st.session_state.user_input_buffer = st.session_state.user_input_buffer[:-1]
-
-def clear_input():
-    st.session_state.user_input_buffer = ""
-
-def render_keypad_for_question(q: Question) -> bool:
-    rows = keypad_for_kind(q.kind)
-    st.markdown(
-        "<style>.stButton>button{height:64px;font-size:18px;font-weight:600}</style>",
-        unsafe_allow_html=True
-    )
-    submit = False
-    for r in rows:
-        cols = st.columns(len(r))
-        for i, key in enumerate(r):
-            if key == "⬅️":
-                cols[i].button(key, on_click=del_input, use_container_width=True)
-            elif key == "❌":
-                cols[i].button(key, on_click=clear_input, use_container_width=True)
-            elif key == "✅":
-                submit = cols[i].button(key, type="primary", use_container_width=True)
-            else:
-                cols[i].button(key, on_click=add_input, args=(key,), use_container_width=True)
-    return submit
-# ==============================
-# PART B5 — STORAGE (StatManager) + STATS DATA
-# ==============================
-
-def now_iso() -> str:
-    return datetime.datetime.now().isoformat(timespec="seconds")
-
-class StatManager:
-    def __init__(self, key_file="service_account.json", sheet_name="Berklee_DB"):
-        self.connected = False
-        self.current_user = None
-        self.sh = None
-        self.ws_users = None
-        self.ws_history = None
-        self.ws_theory = None
-        self.ws_checklist = None
-
-        if gspread is None:
-            return
-        try:
-            if hasattr(st, "secrets") and "gcp_service_account" in st.secrets:
-                creds = dict(st.secrets["gcp_service_account"])
-                gc = gspread.service_account_from_dict(creds)
-            elif os.path.exists(key_file):
-                gc = gspread.service_account(filename=key_file)
-            else:
-                return
-
-            self.sh = gc.open(sheet_name)
-            self.ws_users = self.sh.worksheet(WS_USERS)
-            self.ws_history = self.sh.worksheet(WS_HISTORY)
-            self.ws_theory = self._ensure_ws(WS_THEORY, ["category","subcategory","content","updated_at","updated_by"])
-            self.ws_checklist = self._ensure_ws(WS_CHECKLIST, ["section","item","checked","updated_at","updated_by"])
-            self.ws_weights = self._ensure_ws(WS_WEIGHTS, ["category","subcategory","weight","updated_at","updated_by"])
-            self.connected = True
-        except Exception:
-            self.connected = False
-
-        self.data = []
-
-    def _ensure_ws(self, title: str, headers: List[str]):
-        try:
-            return self.sh.worksheet(title)
-        except Exception:
-            ws = self.sh.add_worksheet(title=title, rows=2000, cols=max(10, len(headers)+2))
-            ws.append_row(headers)
-            return ws
-
-    def login_user(self, username: str, password: str) -> bool:
-        if not self.connected:
-            return False
-        try:
-            cell = self.ws_users.find(username)
-            if not cell:
-                return False
-            stored = self.ws_users.cell(cell.row, 2).value
-            if stored == hashlib.sha256(password.encode()).hexdigest():
-                self.current_user = username
-                self.load_user_data()
-                return True
-            return False
-        except Exception:
-            return False
-
-    def auto_login(self, username: str) -> bool:
-        if not self.connected:
-            return False
-        try:
-            if username in self.ws_users.col_values(1):
-                self.current_user = username
-                self.load_user_data()
-                return True
-        except Exception:
-            pass
-        return False
-
-    def logout(self):
-        self.current_user = None
-        self.data = []
-
-    def load_user_data(self):
-        if not self.connected:
-            self.data = []
-            return
-        try:
-            rows = self.ws_history.get_all_records()
-            self.data = [r for r in rows if str(r.get("username")) == str(self.current_user)]
-        except Exception:
-            self.data = []
-
-    def record(self, category: str, subcategory: str, is_correct: bool, is_retry: bool):
-        if not self.connected or not self.current_user or is_retry:
-            return
-        now = datetime.datetime.now()
-        row = [
-            self.current_user,
-            float(now.timestamp()),
-            now.year, now.month, now.day,
-            category, subcategory,
-            1 if is_correct else 0,
-            1
-        ]
-        try:
-            self.ws_history.append_row(row)
-        except Exception:
-            pass
-
-    # Theory
-    def load_theory_df(self) -> pd.DataFrame:
-        cols = ["category","subcategory","content","updated_at","updated_by"]
-        if not self.connected:
-            return pd.DataFrame(columns=cols)
-        try:
-            df = pd.DataFrame(self.ws_theory.get_all_records())
-            for c in cols:
-                if c not in df.columns:
-                    df[c] = ""
-            return df[cols]
-        except Exception:
-            return pd.DataFrame(columns=cols)
-
-    def upsert_theory(self, cat: str, sub: str, content: str, by: str) -> bool:
-        if not self.connected:
-            return False
-        try:
-            rows = self.ws_theory.get_all_records()
-            ts = now_iso()
-            for i, r in enumerate(rows, start=2):
-                if str(r.get("category")) == str(cat) and str(r.get("subcategory")) == str(sub):
-                    self.ws_theory.update(f"C{i}:E{i}", [[content, ts, by]])
-                    return True
-            self.ws_theory.append_row([cat, sub, content, ts, by])
-            return True
-        except Exception:
-            return False
-
-    # Checklist
-    def load_checklist_df(self) -> pd.DataFrame:
-        cols = ["section","item","checked","updated_at","updated_by"]
-        if not self.connected:
-            return pd.DataFrame(columns=cols)
-        try:
-            df = pd.DataFrame(self.ws_checklist.get_all_records())
-            for c in cols:
-                if c not in df.columns:
-                    df[c] = ""
-            df["checked"] = pd.to_numeric(df["checked"], errors="coerce").fillna(0).astype(int)
-            return df[cols]
-        except Exception:
-            return pd.DataFrame(columns=cols)
-
-    def set_checklist_item(self, section: str, item: str, checked: int, by: str) -> bool:
-        if not self.connected:
-            return False
-        try:
-            rows = self.ws_checklist.get_all_records()
-            ts = now_iso()
-            for i, r in enumerate(rows, start=2):
-                if str(r.get("section")) == str(section) and str(r.get("item")) == str(item):
-                    self.ws_checklist.update(f"C{i}:E{i}", [[int(checked), ts, by]])
-                    return True
-            self.ws_checklist.append_row([section, item, int(checked), ts, by])
-            return True
-        except Exception:
-            return False
-
-    def delete_checklist_item(self, section: str, item: str) -> bool:
-        if not self.connected:
-            return False
-        try:
-            rows = self.ws_checklist.get_all_records()
-            for i, r in enumerate(rows, start=2):
-                if str(r.get("section")) == str(section) and str(r.get("item")) == str(item):
-                    self.ws_checklist.delete_rows(i)
-                    return True
-            return False
-        except Exception:
-            return False
-
-    # Weights
-    def load_weights_df(self) -> pd.DataFrame:
-        cols = ["category","subcategory","weight","updated_at","updated_by"]
-        if not self.connected:
-            return pd.DataFrame(columns=cols)
-        try:
-            df = pd.DataFrame(self.ws_weights.get_all_records())
-            for c in cols:
-                if c not in df.columns:
-                    df[c] = ""
-            df["weight"] = pd.to_numeric(df["weight"], errors="coerce").fillna(1.0)
-            return df[cols]
-        except Exception:
-            return pd.DataFrame(columns=cols)
-
-    def upsert_weight(self, cat: str, sub: str, weight: float, by: str) -> bool:
-        if not self.connected:
-            return False
-        try:
-            rows = self.ws_weights.get_all_records()
-            ts = now_iso()
-            for i, r in enumerate(rows, start=2):
-                if str(r.get("category")) == str(cat) and str(r.get("subcategory")) == str(sub):
-                    self.ws_weights.update(f"C{i}:E{i}", [[float(weight), ts, by]])
-                    return True
-            self.ws_weights.append_row([cat, sub, float(weight), ts, by])
-            return True
-        except Exception:
-            return False
-
-
-def stat_df_from_history(rows: List[dict]) -> pd.DataFrame:
-    if not rows:
-        return pd.DataFrame(columns=["ts","category","subcategory","is_correct"])
-    df = pd.DataFrame(rows)
-    if "timestamp" in df.columns:
-        df["ts"] = pd.to_datetime(df["timestamp"], unit="s", errors="coerce")
-    else:
-        df["ts"] = pd.to_datetime(
-            df[["year","month","day"]].astype(str).agg("-".join, axis=1),
-            errors="coerce"
-        )
-    df["is_correct"] = pd.to_numeric(df.get("is_correct", 0), errors="coerce").fillna(0).astype(int)
-    df["category"] = df.get("category", "").astype(str)
-    df["subcategory"] = df.get("subcategory", "").astype(str)
-    return df[["ts","category","subcategory","is_correct"]].dropna(subset=["ts"])
-# ==============================
-# PART B6A — SESSION + LOGIN + QUIZ ENGINE + SIDEBAR
-# ==============================
-
-if "logged_in_user" not in st.session_state:
-    st.session_state.logged_in_user = None
-if "user_input_buffer" not in st.session_state:
-    st.session_state.user_input_buffer = ""
-if "wrong_count" not in st.session_state:
-    st.session_state.wrong_count = 0
-if "wrong_pool" not in st.session_state:
-    st.session_state.wrong_pool = []
-if "page" not in st.session_state:
-    st.session_state.page = "home"
-if "quiz" not in st.session_state:
-    st.session_state.quiz = {
-        "active": False,
-        "cat": "",
-        "sub": "",
-        "idx": 0,
-        "score": 0,
-        "limit": 10,
-        "is_retry": False,
-        "retry_pool": [],
-        "q": None
-    }
-
-def is_owner() -> bool:
-    return str(st.session_state.get("logged_in_user","")) == str(OWNER_USERNAME) and OWNER_USERNAME != ""
-
-def ensure_cookie_manager():
-    if stx is None:
-        return None
-    if "cookie_mgr" not in st.session_state:
-        st.session_state.cookie_mgr = stx.CookieManager()
-    return st.session_state.cookie_mgr
-
-def try_auto_login():
-    cm = ensure_cookie_manager()
-    if cm is None:
-        return
-    if st.session_state.logged_in_user is not None:
-        return
-    user_cookie = cm.get(cookie="berklee_user")
-    if user_cookie and st.session_state.stat_mgr.auto_login(user_cookie):
-        st.session_state.logged_in_user = user_cookie
-
-try_auto_login()
-
-def render_login():
-    st.title("🎹 Road to Berklee")
-    if stx is None:
-        st.error("extra_streamlit_components가 필요해. requirements.txt에 추가해줘.")
-        st.stop()
-
-    with st.form("login"):
-        u = st.text_input("Username")
-        p = st.text_input("Password", type="password")
-        if st.form_submit_button("Login"):
-            if st.session_state.stat_mgr.login_user(u, p):
-                st.session_state.logged_in_user = u
-                cm = ensure_cookie_manager()
-                if cm:
-                    cm.set("berklee_user", u, expires_at=datetime.datetime.now()+timedelta(days=30))
-                st.rerun()
-            else:
-                st.error("Login failed.")
-
-def logout():
-    st.session_state.stat_mgr.logout()
-    st.session_state.logged_in_user = None
-    cm = ensure_cookie_manager()
-    if cm:
-        cm.delete("berklee_user")
-    st.rerun()
-
-def start_quiz(cat: str, sub: str, limit: int = 10, is_retry: bool = False, retry_pool: Optional[List[Question]] = None, mode: str = "fixed"):
-    st.session_state.user_input_buffer = ""
-    st.session_state.wrong_count = 0
-    if not is_retry:
-        st.session_state.wrong_pool = []
-
-    pool = retry_pool or []
-    if is_retry and pool:
-        q = pool[0]
-    else:
-        q = generate_question(cat, sub) if mode == "fixed" else generate_question_weighted()
-
-    st.session_state.quiz = {
-        "active": True,
-        "cat": cat,
-        "sub": sub,
-        "idx": 0,
-        "score": 0,
-        "limit": len(pool) if is_retry else limit,
-        "is_retry": is_retry,
-        "retry_pool": pool,
-        "q": q,
-        "mode": mode
-    }
-    st.session_state.page = "quiz"
-    st.rerun()
-
-def next_question():
-    qs = st.session_state.quiz
-    qs["idx"] += 1
-    if qs["idx"] >= qs["limit"]:
-        st.session_state.page = "result"
-        st.rerun()
-
-    if qs["is_retry"]:
-        qs["q"] = qs["retry_pool"][qs["idx"]]
-    else:
-        qs["q"] = generate_question(qs["cat"], qs["sub"]) if qs.get("mode","fixed") == "fixed" else generate_question_weighted()
-
-    st.session_state.user_input_buffer = ""
-    st.rerun()
-
-def check_answer():
-    qs = st.session_state.quiz
-    q = qs["q"]
-    ok = is_answer_correct(q, st.session_state.user_input_buffer)
-
-    if ok:
-        if not qs["is_retry"]:
-            qs["score"] += 1
-        st.session_state.stat_mgr.record(q.category, q.subcategory, True, qs["is_retry"])
-        st.session_state.wrong_count = 0
-        next_question()
-    else:
-        st.session_state.wrong_count += 1
-        if st.session_state.wrong_count >= 3:
-            st.session_state.stat_mgr.record(q.category, q.subcategory, False, qs["is_retry"])
-            if not qs["is_retry"]:
-                st.session_state.wrong_pool.append(q)
-            st.session_state.wrong_count = 0
-            next_question()
-        else:
-            st.session_state.user_input_buffer = ""
-
-def sidebar_menu() -> str:
-    with st.sidebar:
-        st.write(f"👤 **{st.session_state.logged_in_user}**")
-        if st.button("Logout"):
-            logout()
-        st.markdown("---")
-        items = ["🏠 Home", "📝 Start Quiz", "📊 Statistics", "📘 Theory", "✅ Checklist", "ℹ️ Credits"]
-        if is_owner():
-            items += ["🧪 Diagnostic", "⚖️ Weights"]
-        return st.radio("Menu", items)
-
-# ==============================
-# PART B6B — PAGES + ROUTER (FINAL)
-# ==============================
-
-def render_home():
-    st.title("🎹 Road to Berklee")
-    st.write("Music theory practice app.")
-
-
-def render_quiz_page():
-    qs = st.session_state.quiz
-    q: Question = qs["q"]
-    st.progress(qs["idx"] / max(1, qs["limit"]))
-    st.write(f"Question {qs['idx']+1} / {qs['limit']}")
-    st.subheader(q.prompt)
-    st.text_input("Answer", value=st.session_state.user_input_buffer, disabled=True)
-
-    if render_keypad_for_question(q):
-        check_answer()
-
-    if st.button("🏠 Quit"):
-        st.session_state.page = "home"
-        st.rerun()
-
-
-def render_result_page():
-    qs = st.session_state.quiz
-    st.header("Result")
-    st.metric("Score", f"{qs['score']}/{qs['limit']}")
-    if st.session_state.wrong_pool:
-        if st.button("🔄 Retry mistakes", use_container_width=True):
-            start_quiz(qs["cat"], qs["sub"], is_retry=True, retry_pool=st.session_state.wrong_pool)
-    if st.button("⬅️ Back", use_container_width=True):
-        st.session_state.page = "home"
-        st.rerun()
-
-
-def render_start_quiz():
-    st.header("📝 Start Quiz")
-
-    mode_label = st.radio("Mode", ["Selected topic", "Random (Weighted)"], horizontal=True)
-    limit = st.slider("Number of questions", 5, 50, 10, 5)
-
-    if mode_label == "Selected topic":
-        cat = st.selectbox("Category", list(CATEGORY_INFO.keys()))
-        sub = st.selectbox("Subcategory", CATEGORY_INFO.get(cat, []))
-        if st.button("Start"):
-            start_quiz(cat, sub, limit=limit, mode="fixed")
-    else:
-        st.caption("Weights sheet values control how often each topic appears.")
-        if st.button("Start Random (Weighted)"):
-            start_quiz("(Random)", "(Weighted)", limit=limit, mode="weighted")
-
-
-def _plot_accuracy_over_time(df: pd.DataFrame, freq: str):
-    if df.empty:
-        st.info("No data.")
-        return
-    d = df.copy()
-    d = d.set_index("ts")
-    grp = d.resample(freq)["is_correct"].mean() * 100.0
-    fig = plt.figure()
-    plt.plot(grp.index, grp.values)
-    plt.ylabel("Accuracy (%)")
-    plt.xlabel("Date")
-    st.pyplot(fig, clear_figure=True)
-
-def _topic_features(df: pd.DataFrame, days: int) -> pd.DataFrame:
-    if df.empty:
-        return pd.DataFrame(columns=["category","subcategory","solved","acc","recent_solved","recent_acc","wrong_streak","last_seen_days"])
-
-    now = datetime.datetime.now()
-    cutoff = now - datetime.timedelta(days=int(days))
-
-    d = df.copy()
-    d["ts"] = pd.to_datetime(d["ts"], errors="coerce")
-    d = d.dropna(subset=["ts"])
-    d["is_correct"] = pd.to_numeric(d["is_correct"], errors="coerce").fillna(0).astype(int)
-
-    g_all = d.groupby(["category","subcategory"])["is_correct"].agg(["count","mean"]).reset_index()
-    g_all.rename(columns={"count":"solved","mean":"acc"}, inplace=True)
-    g_all["acc"] = (g_all["acc"] * 100.0).fillna(0.0)
-
-    d_recent = d[d["ts"] >= cutoff].copy()
-    if d_recent.empty:
-        g_all["recent_solved"] = 0
-        g_all["recent_acc"] = 0.0
-    else:
-        g_recent = d_recent.groupby(["category","subcategory"])["is_correct"].agg(["count","mean"]).reset_index()
-        g_recent.rename(columns={"count":"recent_solved","mean":"recent_acc"}, inplace=True)
-        g_recent["recent_acc"] = (g_recent["recent_acc"] * 100.0).fillna(0.0)
-        g_all = g_all.merge(g_recent, on=["category","subcategory"], how="left")
-        g_all["recent_solved"] = pd.to_numeric(g_all["recent_solved"], errors="coerce").fillna(0).astype(int)
-        g_all["recent_acc"] = pd.to_numeric(g_all["recent_acc"], errors="coerce").fillna(0.0)
-
-    # last_seen_days
-    last_ts = d.groupby(["category","subcategory"])["ts"].max().reset_index().rename(columns={"ts":"last_ts"})
-    g_all = g_all.merge(last_ts, on=["category","subcategory"], how="left")
-    g_all["last_seen_days"] = (now - g_all["last_ts"]).dt.days.fillna(999).astype(int)
-    g_all = g_all.drop(columns=["last_ts"], errors="ignore")
-
-    # wrong_streak: consecutive wrong answers at the end of history for each topic
-    d_sorted = d.sort_values("ts")
-    streak_map = {}
-    for (cat, sub), grp in d_sorted.groupby(["category","subcategory"]):
-        streak = 0
-        for v in grp["is_correct"].tolist()[::-1]:
-            if int(v) == 0:
-                streak += 1
-            else:
-                break
-        streak_map[(cat, sub)] = streak
-    g_all["wrong_streak"] = g_all.apply(lambda r: int(streak_map.get((r["category"], r["subcategory"]), 0)), axis=1)
-
-    return g_all[["category","subcategory","solved","acc","recent_solved","recent_acc","wrong_streak","last_seen_days"]]
-
-
-def _clamp(x: float, lo: float, hi: float) -> float:
-    return float(min(hi, max(lo, x)))
-
-
-def _recommend_weights(features: pd.DataFrame, base: float = 1.0, floor: float = 0.0, ceil: float = 5.0) -> Dict[tuple, float]:
-    rec = {(c, s): base for c, subs in CATEGORY_INFO.items() for s in subs}
-    if features.empty:
-        return rec
-
-    for _, r in features.iterrows():
-        cat = str(r["category"])
-        sub = str(r["subcategory"])
-        if (cat, sub) not in rec:
-            continue
-
-        solved = int(r["solved"])
-        acc = float(r["acc"])
-        recent_solved = int(r["recent_solved"])
-        recent_acc = float(r["recent_acc"])
-        wrong_streak = int(r["wrong_streak"])
-        last_seen_days = int(r["last_seen_days"])
-
-        w = base
-
-        # 1) Not enough data → keep near base
-        if solved < 8:
-            w = base
-        else:
-            # 2) Core weakness by accuracy (prefer recent accuracy if we have enough recent samples)
-            eff_acc = recent_acc if recent_solved >= 5 else acc
-
-            if eff_acc < 45:
-                w += 2.0
-            elif eff_acc < 65:
-                w += 1.2
-            elif eff_acc < 80:
-                w += 0.5
-            elif eff_acc >= 92:
-                w -= 0.6
-            elif eff_acc >= 87:
-                w -= 0.3
-
-            # 3) Volume confidence: more solved → stronger effect
-            if solved >= 60:
-                w += 0.3 if eff_acc < 70 else -0.2
-            elif solved >= 30:
-                w += 0.15 if eff_acc < 70 else -0.1
-
-        # 4) Wrong streak boost (recent repeated failure)
-        if wrong_streak >= 4:
-            w += 0.8
-        elif wrong_streak == 3:
-            w += 0.5
-        elif wrong_streak == 2:
-            w += 0.25
-
-        # 5) Recency: if not seen for long time, gently boost to avoid forgetting
-        if last_seen_days >= 30:
-            w += 0.35
-        elif last_seen_days >= 14:
-            w += 0.2
-
-        rec[(cat, sub)] = _clamp(w, floor, ceil)
-
-    return rec
-
-
-def _render_weight_recommendation(df_history: pd.DataFrame):
-    st.subheader("Weight recommendation (weakness-aware)")
-
-    days = st.selectbox("Analysis window (days)", [7, 14, 30, 90], index=2, key="wr_days")
-    base = st.slider("Base weight", 0.0, 3.0, 1.0, 0.5, key="wr_base")
-    floor = st.slider("Minimum weight", 0.0, 2.0, 0.0, 0.5, key="wr_floor")
-    ceil = st.slider("Maximum weight", 3.0, 8.0, 5.0, 0.5, key="wr_ceil")
-
-    feats = _topic_features(df_history, days=int(days))
-    if feats.empty:
-        st.info("No history found yet.")
-        return
-
-    rec = _recommend_weights(feats, base=float(base), floor=float(floor), ceil=float(ceil))
-
-    view = feats.copy()
-    view["recommended_weight"] = view.apply(
-        lambda r: rec.get((str(r["category"]), str(r["subcategory"])), float(base)),
-        axis=1
-    )
-
-    # Prioritize: low effective accuracy + high wrong streak + enough recent attempts
-    view["priority"] = (
-        (100.0 - view["recent_acc"].where(view["recent_solved"] >= 5, view["acc"])) +
-        (view["wrong_streak"] * 8.0) +
-        (view["last_seen_days"].clip(0, 60) * 0.2)
-    )
-    view = view.sort_values(["priority","recent_solved","solved"], ascending=[False, False, False])
-
-    st.dataframe(
-        view[["category","subcategory","solved","acc","recent_solved","recent_acc","wrong_streak","last_seen_days","recommended_weight"]],
-        use_container_width=True
-    )
-
-    st.caption("Logic: lower accuracy, higher recent wrong streak, and long time since last practice increase the recommended weight.")
-
-    if not is_owner():
-        st.info("Only the owner can apply these weights to Google Sheets.")
-        return
-
-    if st.button("Apply recommended weights to Google Sheets"):
-        ok_all = True
-        for (cat, sub), w in rec.items():
-            ok_all = ok_all and st.session_state.stat_mgr.upsert_weight(cat, sub, float(w), st.session_state.logged_in_user)
-        st.success("Applied successfully." if ok_all else "Applied with some failures (check sheet permissions).")
-
-
-    rec = _recommend_weights(topic, base=base)
-
-    view = topic.copy()
-    view["recommended_weight"] = view.apply(lambda r: rec.get((str(r["category"]), str(r["subcategory"])), base), axis=1)
-    view = view.sort_values(["acc","solved"], ascending=[True, False])
-
-    st.dataframe(view[["category","subcategory","solved","acc","recommended_weight"]], use_container_width=True)
-
-    if not is_owner():
-        st.caption("Owner only can apply these weights to Google Sheet.")
-        return
-
-    c1, c2 = st.columns([1, 2])
-    with c1:
-        if st.button("💾 Apply recommended weights"):
-            ok_all = True
-            for (cat, sub), w in rec.items():
-                ok_all = ok_all and st.session_state.stat_mgr.upsert_weight(cat, sub, float(w), st.session_state.logged_in_user)
-            st.success("Applied." if ok_all else "Some saves failed.")
-    with c2:
-        st.caption("Tip: accuracy 낮은 토픽이 자동으로 weight↑, 높은 토픽은 weight↓로 추천돼.")
-
-def render_statistics():
-    st.header("📊 Statistics")
-    rows = st.session_state.stat_mgr.data
-    df = stat_df_from_history(rows)
-
-    solved = int(df.shape[0])
-    correct = int(df["is_correct"].sum()) if solved else 0
-    acc = (correct / solved * 100.0) if solved else 0.0
-
-    st.markdown(f"### {solved} steps to Berklee College of Music")
-    st.write(f"Total Accuracy: **{acc:.1f}%**")
-
-    if df.empty:
-        return
-
-    c1, c2, c3 = st.columns(3)
-    with c1:
-        days = st.selectbox("Period", [7, 14, 30, 90, 365], index=2)
-    with c2:
-        freq = st.selectbox("Graph unit", [("Daily","D"),("Weekly","W"),("Monthly","M")], index=1, format_func=lambda x: x[0])[1]
-    with c3:
-        cat_filter = st.selectbox("Category filter", ["(All)"] + list(CATEGORY_INFO.keys()))
-
-    cutoff = datetime.datetime.now() - datetime.timedelta(days=int(days))
-    dff = df[df["ts"] >= cutoff]
-    if cat_filter != "(All)":
-        dff = dff[dff["category"] == cat_filter]
-
-    st.subheader("Accuracy over time")
-    _plot_accuracy_over_time(dff, freq)
-
-    st.subheader("By category")
-    by = dff.groupby("category")["is_correct"].agg(["count","sum"])
-    by["acc"] = (by["sum"] / by["count"] * 100.0).fillna(0.0)
-    st.dataframe(by.rename(columns={"count":"solved","sum":"correct","acc":"accuracy%"}), use_container_width=True)
-    _render_weight_recommendation(df)
-
-
-
-def render_theory():
-    st.header("📘 Theory")
-    if "theory_df" not in st.session_state:
-        st.session_state.theory_df = st.session_state.stat_mgr.load_theory_df()
-    df = st.session_state.theory_df
-
-    cat = st.selectbox("Category", list(CATEGORY_INFO.keys()), key="th_cat")
-    sub = st.selectbox("Subcategory", CATEGORY_INFO.get(cat, []), key="th_sub")
-
-    content = ""
-    if not df.empty:
-        m = (df["category"].astype(str) == str(cat)) & (df["subcategory"].astype(str) == str(sub))
-        if m.any():
-            content = str(df[m].iloc[0]["content"] or "")
-
-    if is_owner():
-        new = st.text_area("Owner editor", value=content, height=260)
-        c1, c2 = st.columns([1,2])
-        with c1:
-            if st.button("💾 Save"):
-                ok = st.session_state.stat_mgr.upsert_theory(cat, sub, new, st.session_state.logged_in_user)
-                if ok:
-                    st.session_state.theory_df = st.session_state.stat_mgr.load_theory_df()
-                    st.success("Saved.")
-                else:
-                    st.error("Save failed.")
-        with c2:
-            if st.button("🔄 Reload"):
-                st.session_state.theory_df = st.session_state.stat_mgr.load_theory_df()
-                st.rerun()
-    else:
-        if content.strip():
-            st.markdown(content)
-        else:
-            st.info("No notes yet.")
-
-
-def render_checklist():
-    st.header("✅ Checklist")
-    if "checklist_df" not in st.session_state:
-        st.session_state.checklist_df = st.session_state.stat_mgr.load_checklist_df()
-    df = st.session_state.checklist_df
-
-    if df.empty:
-        st.info("No checklist items yet.")
-    else:
-        for section in df["section"].astype(str).unique():
-            st.subheader(section)
-            subdf = df[df["section"].astype(str) == str(section)]
-            for _, r in subdf.iterrows():
-                item = str(r["item"])
-                checked = int(r["checked"]) == 1
-                key = f"chk_{section}_{item}"
-                new_val = st.checkbox(item, value=checked, key=key)
-                if new_val != checked:
-                    st.session_state.stat_mgr.set_checklist_item(section, item, 1 if new_val else 0, st.session_state.logged_in_user)
-                    st.session_state.checklist_df = st.session_state.stat_mgr.load_checklist_df()
-                    st.rerun()
-
-    if is_owner():
-        st.markdown("---")
-        st.subheader("Owner: Add / Delete")
-        sec = st.text_input("Section", key="chk_sec")
-        item = st.text_input("Item", key="chk_item")
-        c1, c2 = st.columns(2)
-        with c1:
-            if st.button("➕ Add"):
-                if sec.strip() and item.strip():
-                    st.session_state.stat_mgr.set_checklist_item(sec.strip(), item.strip(), 0, st.session_state.logged_in_user)
-                    st.session_state.checklist_df = st.session_state.stat_mgr.load_checklist_df()
-                    st.rerun()
-        with c2:
-            if st.button("🗑️ Delete"):
-                if sec.strip() and item.strip():
-                    st.session_state.stat_mgr.delete_checklist_item(sec.strip(), item.strip())
-                    st.session_state.checklist_df = st.session_state.stat_mgr.load_checklist_df()
-                    st.rerun()
-
-
-def render_diagnostic():
-    st.header("🧪 Diagnostic")
-    if not is_owner():
-        st.warning("Owner only.")
-        return
-    cat = st.selectbox("Category", list(CATEGORY_INFO.keys()), key="dg_cat")
-    sub = st.selectbox("Subcategory", CATEGORY_INFO.get(cat, []), key="dg_sub")
-    if st.button("🎲 Generate"):
-        st.session_state.dg_q = generate_question(cat, sub)
-    q = st.session_state.get("dg_q")
-    if not q:
-        return
-    st.subheader(q.prompt)
-    st.write(f"kind: `{q.kind}`  | sep: `{q.sep}`")
-    st.code(", ".join(q.answers))
-
-
-def render_weights():
-    st.header("⚖️ Weights")
-    if not is_owner():
-        st.warning("Owner only.")
-        return
-    df = st.session_state.stat_mgr.load_weights_df()
-    weights = {}
-    for cat, subs in CATEGORY_INFO.items():
-        for sub in subs:
-            weights[(cat, sub)] = 1.0
-    if not df.empty:
-        for _, r in df.iterrows():
-            weights[(str(r["category"]), str(r["subcategory"]))] = float(r["weight"])
-
-    cat = st.selectbox("Category", list(CATEGORY_INFO.keys()), key="wg_cat")
-    changed = False
-    for sub in CATEGORY_INFO.get(cat, []):
-        key = f"w_{cat}_{sub}"
-        new = st.slider(sub, 0.0, 5.0, float(weights[(cat, sub)]), 0.5, key=key)
-        if float(new) != float(weights[(cat, sub)]):
-            weights[(cat, sub)] = float(new)
-            changed = True
-
-    if st.button("💾 Save weights"):
-        ok_all = True
-        for sub in CATEGORY_INFO.get(cat, []):
-            ok_all = ok_all and st.session_state.stat_mgr.upsert_weight(cat, sub, weights[(cat, sub)], st.session_state.logged_in_user)
-        st.success("Saved." if ok_all else "Some saves failed.")
-
-
-# Router
-if st.session_state.logged_in_user is None:
-    render_login()
-    st.stop()
-
-menu = sidebar_menu()
-
-if menu == "🏠 Home":
-    render_home()
-elif menu == "📝 Start Quiz":
-    if st.session_state.page == "quiz":
-        render_quiz_page()
-    elif st.session_state.page == "result":
-        render_result_page()
-    else:
-        render_start_quiz()
-elif menu == "📊 Statistics":
-    render_statistics()
-elif menu == "📘 Theory":
-    render_theory()
-elif menu == "✅ Checklist":
-    render_checklist()
-elif menu == "🧪 Diagnostic":
-    render_diagnostic()
-elif menu == "⚖️ Weights":
-    render_weights()
-elif menu == "ℹ️ Credits":
-    st.header("ℹ️ Credits")
-    st.write("### Road to Berklee")
-    st.write("Developed by: Oh Seung-yeol")
-
-
+# deploy ping 2026-01-16
+
+# ==============================
+# PART B1 — IMPORTS & CONFIG
+# ==============================
+
+from __future__ import annotations
+
+import time
+_SCRIPT_T0 = time.perf_counter()
+
+import streamlit as st
+import random
+import datetime
+from datetime import timedelta
+import hashlib
+import heapq
+import importlib
+import importlib.util
+import json
+import operator
+import os
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from functools import lru_cache, wraps
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class _LazyModule:
+    """Stands in for a module and imports it on first attribute access.
+
+    pandas/numpy/gspread are not needed to paint the login page, so a cold
+    start does not pay for them until a page actually uses them.
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._mod = None
+
+    def __getattr__(self, attr):
+        if self._mod is None:
+            self._mod = importlib.import_module(self._name)
+        return getattr(self._mod, attr)
+
+
+def _lazy_import(name: str) -> Optional[_LazyModule]:
+    # None when the package is not installed (same contract as a failed import)
+    try:
+        return _LazyModule(name) if importlib.util.find_spec(name) is not None else None
+    except Exception:
+        return None
+
+
+np = _lazy_import("numpy")
+pd = _lazy_import("pandas")
+gspread = _lazy_import("gspread")
+
+try:
+    import extra_streamlit_components as stx
+except Exception:
+    stx = None
+
+
+# ------------------------------
+# App Config
+# ------------------------------
+# Importing this module has no UI side effects (bench.py imports it); the page
+# itself is drawn by main() at the bottom of the file.
+BUILD_ID = "2026-01-16-01"
+
+
+def _config(key: str, default: str = "") -> str:
+    # env (BERKLEE_<KEY>) wins over st.secrets; missing secrets.toml is fine
+    v = os.environ.get(f"BERKLEE_{key}")
+    if v:
+        return v
+    try:
+        return str(st.secrets.get(key, default)) if hasattr(st, "secrets") else default
+    except Exception:
+        return default
+
+
+OWNER_USERNAME = _config("OWNER_USERNAME")
+
+# "sheets" (Google Sheets via gspread), "sqlite" (local file, no credentials needed)
+# or "fake" (the Sheets code path against fake_gspread's in-process spreadsheet)
+STORAGE_BACKEND = _config("STORAGE_BACKEND", "sheets").lower()
+SQLITE_PATH = _config("SQLITE_PATH", "berklee.db")
+
+# "fake" backend: seeded "user:password,..." accounts and injected faults
+FAKE_SHEETS_USERS = _config("FAKE_SHEETS_USERS", "")
+FAKE_SHEETS_LATENCY_MS = float(_config("FAKE_SHEETS_LATENCY_MS", "0"))
+FAKE_SHEETS_QUOTA_PER_MIN = float(_config("FAKE_SHEETS_QUOTA_PER_MIN", "0"))
+FAKE_SHEETS_FAIL_RATE = float(_config("FAKE_SHEETS_FAIL_RATE", "0"))
+
+WS_USERS = "Users"
+WS_HISTORY = "History"
+WS_THEORY = "Theory"
+WS_CHECKLIST = "Checklist"
+WS_WEIGHTS = "QuizWeights"
+WS_REVIEW = "Review"
+WS_TOPIC_STATS = "TopicStats"
+
+# QuizWeights is read at most once per TTL per process (shared by every session)
+WEIGHTS_TTL_SEC = 600
+
+# History rows are buffered per session and written with one append_rows
+HISTORY_FLUSH_ROWS = 10
+HISTORY_FLUSH_SEC = 60
+HISTORY_RETRY_DELAYS = [0.5, 1.0, 2.0]
+HISTORY_SPILL_FILE = _config("HISTORY_SPILL", "history_spill.jsonl")
+# A process-wide timer checks buffered sessions this often, so rows don't wait for a rerun
+HISTORY_FLUSH_TICK_SEC = 5
+
+# History is read incrementally: only rows past the last-seen row are fetched
+HISTORY_SYNC_SEC = 30
+# A sync whose read raced another session's is re-read from the new high-water mark at most this often
+HISTORY_SYNC_TRIES = 3
+
+# Spaced review (SM-2): ease factor bounds, and a missed item returns after this many minutes
+REVIEW_EF_START = 2.5
+REVIEW_EF_MIN = 1.3
+REVIEW_RELEARN_MIN = 10
+
+# Script start -> first paint of the login page, one JSON line per session.
+# Off unless a path is set (e.g. BERKLEE_STARTUP_LOG=startup_times.jsonl);
+# Diagnostic summarizes the last STARTUP_LOG_KEEP entries
+STARTUP_LOG = _config("STARTUP_LOG", "")
+STARTUP_LOG_KEEP = 2000
+
+# Per-topic day buckets are kept this long (the longest Statistics period)
+TOPIC_STATS_DAYS = 365
+
+# Changed per-topic stats are saved to the TopicStats sheet at most this often per process
+TOPIC_STATS_SAVE_SEC = 60
+
+# Theory/Checklist/QuizWeights/Review key -> row indexes are re-checked against column A this often
+SHEET_INDEX_TTL_SEC = 60
+
+# Unprompted reconnects of the shared Sheets pool are at most this frequent
+SHEETS_RECONNECT_MIN_SEC = 5
+
+# Process-wide Sheets request budget (the API allows 60 requests/min per user)
+SHEETS_QUOTA_PER_MIN = float(_config("SHEETS_QUOTA_PER_MIN", "60"))
+SHEETS_BURST = 10
+# 429/5xx: exponential backoff with jitter; reads give up sooner than queued writes
+SHEETS_BACKOFF_BASE_SEC = 1.0
+SHEETS_BACKOFF_MAX_SEC = 32.0
+SHEETS_READ_TRIES = 3
+SHEETS_WRITE_TRIES = 6
+# This many transient failures in a row stop all calls for a while (reads fall back to caches)
+SHEETS_BREAKER_FAILURES = 5
+SHEETS_BREAKER_OPEN_SEC = 60
+# A queued write refused by the open breaker waits for its next trial window, up to this long
+SHEETS_QUEUE_WAIT_SEC = 600
+# Sheets calls are counted per minute for this long (Diagnostic quota chart)
+SHEETS_USAGE_KEEP_MIN = 60
+# Owners see a warning once the last 60 s used this share of SHEETS_QUOTA_PER_MIN
+SHEETS_QUOTA_WARN = 0.8
+
+# Rerun timing spans (Diagnostic page); off unless TRACE=1 or switched on there
+TRACE_ENABLED = _config("TRACE", "0").lower() in ("1", "true", "on", "yes")
+# Durations kept per span name for the percentiles
+TRACE_WINDOW = 1000
+
+
+# ------------------------------
+# Tracing
+# ------------------------------
+class _Span:
+    __slots__ = ("tracer", "name")
+
+    def __init__(self, tracer: "Tracer", name: str):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.tracer._enter(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._exit()
+        return False
+
+
+class Tracer:
+    """Process-wide span timings: the last TRACE_WINDOW durations per span name.
+
+    Spans nest per thread. Each one also keeps its own time (minus child
+    spans), so a slow render_* is told apart from the StatManager call
+    inside it. While disabled a span costs one attribute check.
+    """
+    def __init__(self, enabled: bool = False, window: int = TRACE_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples: Dict[str, deque] = {}
+        self.calls: Dict[str, int] = {}
+        self.total: Dict[str, float] = {}
+        self.own: Dict[str, float] = {}
+        self.since = time.time()
+        self._local = threading.local()
+
+    def span(self, name: str):
+        return _Span(self, name) if self.enabled else _NO_SPAN
+
+    def _enter(self, name: str):
+        loc = self._local
+        if not hasattr(loc, "stack"):
+            loc.stack, loc.trace = [], None
+        slot = None
+        if loc.trace is not None:
+            slot = len(loc.trace)
+            loc.trace.append(None)
+        loc.stack.append([name, time.perf_counter(), 0.0, slot])
+
+    def _exit(self):
+        loc = self._local
+        name, t0, child, slot = loc.stack.pop()
+        dt = time.perf_counter() - t0
+        if loc.stack:
+            loc.stack[-1][2] += dt
+        if slot is not None and loc.trace is not None:
+            loc.trace[slot] = {"depth": len(loc.stack), "span": name,
+                               "ms": round(dt * 1e3, 3), "own_ms": round((dt - child) * 1e3, 3)}
+        with self.lock:
+            q = self.samples.get(name)
+            if q is None:
+                q = self.samples[name] = deque(maxlen=self.window)
+            q.append(dt)
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.total[name] = self.total.get(name, 0.0) + dt
+            self.own[name] = self.own.get(name, 0.0) + dt - child
+
+    @contextmanager
+    def rerun(self, sink):
+        """Root span of one script run; its span tree lands in sink["last_trace"]."""
+        if not self.enabled:
+            yield
+            return
+        loc = self._local
+        if not hasattr(loc, "stack"):
+            loc.stack = []
+        loc.trace = []
+        try:
+            with self.span("rerun"):
+                yield
+        finally:
+            trace, loc.trace = loc.trace, None
+            sink["last_trace"] = [t for t in trace if t is not None]
+
+    def reset(self):
+        with self.lock:
+            self.samples, self.calls, self.total, self.own = {}, {}, {}, {}
+            self.since = time.time()
+
+    def snapshot(self) -> List[dict]:
+        """Per span: lifetime calls/total/own time and p50/p95/max over the window, slowest total first."""
+        with self.lock:
+            items = [(n, sorted(q), self.calls[n], self.total[n], self.own[n]) for n, q in self.samples.items()]
+        out = []
+        for name, xs, calls, total, own in items:
+            k = len(xs)
+            out.append({
+                "span": name, "calls": calls, "total_ms": total * 1e3, "own_ms": own * 1e3,
+                "mean_ms": total / calls * 1e3,
+                "p50_ms": xs[(k - 1) // 2] * 1e3, "p95_ms": xs[min(k - 1, int(k * 0.95))] * 1e3,
+                "max_ms": xs[-1] * 1e3,
+            })
+        out.sort(key=lambda r: r["total_ms"], reverse=True)
+        return out
+
+
+_NO_SPAN = nullcontext()
+
+
+@st.cache_resource
+def _tracer() -> Tracer:
+    return Tracer(TRACE_ENABLED)
+
+
+TRACER = _tracer()
+
+
+def traced(name: Optional[str] = None):
+    """Time every call of the decorated function as span `name` (default: its qualified name)."""
+    def deco(fn):
+        span = name or fn.__qualname__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return fn(*args, **kwargs)
+            with _Span(TRACER, span):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def traced_methods(cls):
+    """Class decorator: @traced() on every public method."""
+    for attr, fn in list(vars(cls).items()):
+        if callable(fn) and not attr.startswith("_"):
+            setattr(cls, attr, traced(f"{cls.__name__}.{attr}")(fn))
+    return cls
+
+# ==============================
+# PART B2 — MUSIC UTILS & NORMALIZATION
+# ==============================
+
+# -------- normalize --------
+@lru_cache(maxsize=8192)
+def normalize_user_input(s: str) -> str:
+    if s is None:
+        return ""
+    s = str(s).strip()
+    s = (s.replace("＋", "+")
+           .replace("－", "-")
+           .replace("–", "-")
+           .replace("—", "-")
+           .replace("♯", "#")
+           .replace("♭", "b")
+           .replace("𝄪", "##")
+           .replace("𝄫", "bb"))
+    s = re.sub(r"\s+", " ", s)
+    return s.strip()
+
+
+# -------- pitch / note --------
+NOTES = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
+NOTE_TO_IDX = {n: i for i, n in enumerate(NOTES)}
+ENH_PITCH = {'C#':'Db','D#':'Eb','F#':'Gb','G#':'Ab','A#':'Bb','Cb':'B','B#':'C','E#':'F','Fb':'E'}
+
+def _norm_pitch_slow(p: str) -> str:
+    s = normalize_user_input(p).replace(" ", "")
+    if not s:
+        return s
+    s = s[0].upper() + s[1:]
+    s = ENH_PITCH.get(s, s)
+    return s
+
+def norm_pitch(p: str) -> str:
+    c = _PITCH_CANON.get(p)
+    return c if c is not None else _norm_pitch_slow(p)
+
+def pitch_idx(p: str) -> int:
+    i = _PITCH_IDX.get(p)
+    return i if i is not None else NOTE_TO_IDX.get(_norm_pitch_slow(p), -1)
+
+def idx_to_pitch(i: int) -> str:
+    return NOTES[i % 12]
+
+def transpose_pitch(p: str, semitones: int) -> str:
+    i = pitch_idx(p)
+    if i < 0:
+        return norm_pitch(p)
+    return _TRANSPOSE[i][semitones % 12]
+
+
+# -------- degree --------
+DEGREE_MAP = {
+    'I':0,'bII':1,'#I':1,'II':2,'bIII':3,'#II':3,'III':4,'bIV':4,
+    'IV':5,'#III':5,'bV':6,'#IV':6,'V':7,'bVI':8,'#V':8,
+    'VI':9,'bVII':10,'#VI':10,'VII':11,'bI':11
+}
+
+def _degree_to_semitone_slow(deg: str) -> int:
+    d = normalize_user_input(deg).replace(" ", "")
+    return DEGREE_MAP.get(d, 0)
+
+def degree_to_semitone(deg: str) -> int:
+    v = _DEGREE_SEMI.get(deg)
+    return v if v is not None else _degree_to_semitone_slow(deg)
+
+def degree_to_pitch_in_C(deg: str) -> str:
+    return transpose_pitch("C", degree_to_semitone(deg))
+
+
+# -------- interval --------
+def interval_to_semitones(q: str, n: int) -> int:
+    base = {1:0,2:2,3:4,4:5,5:7,6:9,7:11}
+    octs = (n - 1) // 7
+    deg = ((n - 1) % 7) + 1
+    semi = base[deg] + 12 * octs
+    if q == "m": return semi - 1
+    if q == "+": return semi + 1
+    if q == "-": return semi - 1
+    return semi
+
+def _interval_to_pitch_from_C_slow(itv: str) -> str:
+    itv = normalize_user_input(itv).replace(" ", "").replace("P.", "P")
+    if itv and itv[0] in ["+","-"] and itv[1:].isdigit():
+        return transpose_pitch("C", int(itv))
+    q = itv[0]
+    n = int(itv[1:]) if itv[1:].isdigit() else 1
+    return transpose_pitch("C", interval_to_semitones(q, n))
+
+def interval_to_pitch_from_C(itv: str) -> str:
+    p = _INTERVAL_PITCH.get(itv)
+    return p if p is not None else _interval_to_pitch_from_C_slow(itv)
+
+
+# -------- circle of 5th --------
+CYCLE = ["C","G","D","A","E","B","Gb","Db","Ab","Eb","Bb","F"]
+CYCLE_INDEX = {p: i for i, p in enumerate(CYCLE)}
+_ENH_TO_CYCLE = {"F#":"Gb","C#":"Db","G#":"Ab","D#":"Eb","A#":"Bb","Cb":"B","B#":"C","E#":"F","Fb":"E"}
+
+def _to_cycle_pitch(p: str) -> str:
+    p = norm_pitch(p)
+    return _ENH_TO_CYCLE.get(p, p)
+
+def cycle_r_steps_to_pitch(p: str) -> int:
+    v = _CYCLE_STEPS.get(p)
+    return v if v is not None else CYCLE_INDEX.get(_to_cycle_pitch(p), 0)
+
+
+# -------- tension --------
+_TENSION_TO_SEMI = {"b9":1,"9":2,"#9":3,"11":5,"#11":6,"b13":8,"13":9}
+
+def _tension_to_pitch_from_C_slow(t: str) -> str:
+    t = normalize_user_input(t).replace(" ", "")
+    return transpose_pitch("C", _TENSION_TO_SEMI.get(t, 2))
+
+def tension_to_pitch_from_C(t: str) -> str:
+    p = _TENSION_PITCH.get(t)
+    return p if p is not None else _tension_to_pitch_from_C_slow(t)
+
+
+# -------- helpers --------
+def relative_minor(maj: str) -> str:
+    return transpose_pitch(maj, -3)
+
+def semitone_distance(a: str, b: str) -> int:
+    ia, ib = pitch_idx(a), pitch_idx(b)
+    if ia < 0 or ib < 0:
+        return 0
+    return (ib - ia) % 12
+
+
+# -------- precomputed tables --------
+# Every spelling the app produces or accepts is resolved once at import through
+# the *_slow functions above, so generators and grading only do dict/list
+# lookups; anything unusual still falls back to the slow path.
+_ACCIDENTALS = ["", "#", "b", "♯", "♭", "##", "bb", "𝄪", "𝄫"]
+_ROMANS = ["I", "II", "III", "IV", "V", "VI", "VII"]
+
+_TRANSPOSE = [[NOTES[(i + s) % 12] for s in range(12)] for i in range(12)]
+
+_PITCH_CANON = {l + a: _norm_pitch_slow(l + a) for L in "CDEFGAB" for l in (L, L.lower()) for a in _ACCIDENTALS}
+_PITCH_IDX = {sp: NOTE_TO_IDX[c] for sp, c in _PITCH_CANON.items() if c in NOTE_TO_IDX}
+_CYCLE_STEPS = {sp: CYCLE_INDEX.get(_ENH_TO_CYCLE.get(c, c), 0) for sp, c in _PITCH_CANON.items()}
+
+_DEGREE_SEMI = {d: _degree_to_semitone_slow(d) for d in [a + r for r in _ROMANS for a in ["", "b", "#", "♭", "♯"]] + list(DEGREE_MAP)}
+
+_INTERVAL_PITCH: Dict[str, str] = {}
+for _q in ["m", "M", "P", "P.", "+", "-"]:
+    for _n in range(1, 15):
+        _INTERVAL_PITCH[f"{_q}{_n}"] = _interval_to_pitch_from_C_slow(f"{_q}{_n}")
+
+_TENSION_PITCH = {a + n: _tension_to_pitch_from_C_slow(a + n) for a in ["", "b", "#", "♭", "♯"] for n in ["9", "11", "13"]}
+
+
+# -------- answer canonicalization --------
+# Grading compares canonical forms per question kind. Pitches (and chord roots)
+# fold only the black-key pairs (C# == Db); B#/Cb/E#/Fb and double accidentals
+# stay as spelled, and topics in SPELLING_TOPICS grade pitches exactly as
+# spelled. Degrees, numbers and intervals keep their spelling as well; only
+# notation variants (M7/maj7, A4/+4, so/Sol, case of free text) are unified.
+_PITCH_RE = re.compile(r"([A-Ga-g])([#b]*)")
+_CHORD_RE = re.compile(r"([A-Ga-g])(##|bb|#|b)?(.*)")
+_DEGREE_RE = re.compile(r"(##|bb|#|b)?(VII|VI|V|IV|III|II|I)(.*)")
+_NUMBER_RE = re.compile(r"([#b]*)(\d+)")
+_INTERVAL_RE = re.compile(r"(maj|min|aug|dim|perf|M|m|P|A|d|\+|-)(\d+)", re.IGNORECASE)
+_INTERVAL_QUAL = {"maj": "M", "min": "m", "aug": "+", "a": "+", "dim": "-", "d": "-", "perf": "P", "p": "P", "+": "+", "-": "-"}
+_TENSION_RE = re.compile(r"([#b+\-]?)(\d+)")
+
+# chord-quality spellings -> the spelling the generators use
+_QUALITY_ALIASES = {
+    "": "", "6": "6", "7": "7", "dom7": "7", "sus4": "sus4", "7sus4": "7sus4",
+    "m": "m", "-": "m", "min": "m", "mi": "m", "m6": "m6", "-6": "m6",
+    "maj7": "maj7", "M7": "maj7", "Maj7": "maj7", "ma7": "maj7", "Δ": "maj7", "Δ7": "maj7",
+    "m7": "m7", "-7": "m7", "min7": "m7", "mi7": "m7",
+    "m7b5": "m7b5", "-7b5": "m7b5", "min7b5": "m7b5", "m7(b5)": "m7b5", "ø": "m7b5", "ø7": "m7b5",
+    "mM7": "mM7", "m(maj7)": "mM7", "mmaj7": "mM7", "minmaj7": "mM7", "-M7": "mM7", "-maj7": "mM7",
+    "dim": "dim", "o": "dim", "°": "dim", "dim7": "dim7", "o7": "dim7", "°7": "dim7",
+    "aug": "aug", "+": "aug",
+    "+M7": "+M7", "+maj7": "+M7", "augmaj7": "+M7", "maj7#5": "+M7", "M7#5": "+M7", "maj7(#5)": "+M7",
+}
+_SOLFEGE = ["Do", "Di", "Ra", "Re", "Ri", "Me", "Mi", "Fa", "Fi", "Se", "Sol", "Si", "Le", "La", "Li", "Te", "Ti"]
+
+# topics whose pitch answers are graded as spelled (no enharmonic folding)
+SPELLING_TOPICS = {
+    ("Intervals", "Tracking"),
+    ("Warming up", "Key signatures"),
+    ("Warming up", "Chord tones"),
+    ("Warming up", "Finding degrees"),
+    ("Chord Forms", "Extract (Degree)"),
+    ("Chord Forms", "9 chord"),
+    ("Chord Forms", "Rootless"),
+    ("Locations", "Deg->Pitch"),
+    ("Minor", "Pitch"),
+    ("Mastery", "Pitches"),
+}
+_BLACK_KEY_FOLD = {s: f for s, f in ENH_PITCH.items() if len(f) == 2}  # C#->Db .. A#->Bb
+
+def _spell_pitch_slow(t: str) -> str:
+    m = _PITCH_RE.fullmatch(t)
+    return m.group(1).upper() + m.group(2) if m else t
+
+def _canon_pitch_slow(t: str) -> str:
+    p = _spell_pitch_slow(t)
+    return _BLACK_KEY_FOLD.get(p, p)
+
+def _chord_slow(t: str, pitch) -> str:
+    chord, _, bass = t.partition("/")
+    m = _CHORD_RE.fullmatch(chord)
+    if not m:
+        return t
+    out = pitch(m.group(1) + (m.group(2) or "")) + _QUALITY_ALIASES.get(m.group(3), m.group(3))
+    return f"{out}/{pitch(bass)}" if bass else out
+
+def _canon_chord_slow(t: str) -> str:
+    return _chord_slow(t, _canon_pitch_slow)
+
+def _spell_chord_slow(t: str) -> str:
+    return _chord_slow(t, _spell_pitch_slow)
+
+def _canon_degree_slow(t: str) -> str:
+    m = _DEGREE_RE.fullmatch(t)
+    if not m:
+        return t
+    return (m.group(1) or "") + m.group(2) + _QUALITY_ALIASES.get(m.group(3), m.group(3))
+
+def _canon_number_slow(t: str) -> str:
+    m = _NUMBER_RE.fullmatch(t)
+    return m.group(1) + str(int(m.group(2))) if m else t
+
+def _canon_interval_slow(t: str) -> str:
+    m = _INTERVAL_RE.fullmatch(t.replace("P.", "P"))
+    if not m:
+        return t
+    q = m.group(1)
+    return (q if q in ("M", "m") else _INTERVAL_QUAL[q.lower()]) + str(int(m.group(2)))
+
+def _canon_tension_slow(t: str) -> str:
+    m = _TENSION_RE.fullmatch(t)
+    if not m:
+        return t
+    return {"+": "#", "-": "b"}.get(m.group(1), m.group(1)) + m.group(2)
+
+def _canon_solfege_slow(t: str) -> str:
+    return _SOLFEGE_CANON.get(t.lower(), t)
+
+def _canon_text_slow(t: str) -> str:
+    return t.casefold()
+
+_SOLFEGE_CANON = {s.lower(): s for s in _SOLFEGE}
+_SOLFEGE_CANON["so"] = "Sol"
+
+_CANON_SLOW = {
+    "pitch": _canon_pitch_slow,
+    "chord": _canon_chord_slow,
+    "pitch/spelled": _spell_pitch_slow,
+    "chord/spelled": _spell_chord_slow,
+    "degree": _canon_degree_slow,
+    "number": _canon_number_slow,
+    "interval": _canon_interval_slow,
+    "tension": _canon_tension_slow,
+    "solfege": _canon_solfege_slow,
+    "text": _canon_text_slow,
+}
+
+_ROOTS = [l + a for L in "CDEFGAB" for l in (L, L.lower()) for a in ["", "#", "b", "##", "bb"]]
+_ANSWER_CANON: Dict[str, Dict[str, str]] = {
+    "pitch": {r: _canon_pitch_slow(r) for r in _ROOTS},
+    "chord": {r + q: _canon_chord_slow(r + q) for r in _ROOTS for q in _QUALITY_ALIASES},
+    "pitch/spelled": {r: _spell_pitch_slow(r) for r in _ROOTS},
+    "degree": {a + r + q: _canon_degree_slow(a + r + q)
+               for a in ["", "b", "#"] for r in _ROMANS for q in _QUALITY_ALIASES},
+    "number": {a + str(n): _canon_number_slow(a + str(n)) for a in ["", "#", "b"] for n in range(15)},
+    "interval": {q + str(n): _canon_interval_slow(q + str(n))
+                 for q in ["M", "m", "P", "P.", "+", "-", "A", "d"] for n in range(1, 15)},
+    "tension": {a + n: _canon_tension_slow(a + n) for a in ["", "#", "b", "+", "-"] for n in ["4", "9", "11", "13"]},
+    "solfege": {s: _canon_solfege_slow(s) for v in _SOLFEGE_CANON for s in (v, v.capitalize(), v.upper())},
+}
+
+def canonical_answer(kind: str, token: str, spelled: bool = False) -> str:
+    """One normalized answer token -> its canonical form for `kind`; `spelled` turns off enharmonic folding."""
+    if spelled and kind in ("pitch", "chord"):
+        kind += "/spelled"
+    if kind != "text":
+        token = token.replace(" ", "")
+    c = _ANSWER_CANON.get(kind, {}).get(token)
+    return c if c is not None else _CANON_SLOW.get(kind, _canon_text_slow)(token)
+# ==============================
+# PART B3 — DATA TABLES + QUESTION MODEL + GENERATORS
+# ==============================
+
+# tables
+DISTANCE_TO_DEGREE = {
+    1:['I'], 2:['#I','bII'], 3:['II'], 4:['#II','bIII'], 5:['III','bIV'], 6:['IV','#III'],
+    7:['#IV','bV'], 8:['V'], 9:['#V','bVI'], 10:['VI'], 11:['#VI','bVII'], 12:['VII','bI'], 13:['P8']
+}
+
+SOLFEGE = {
+    'I':'Do','II':'Re','III':'Mi','IV':'Fa','V':'Sol','VI':'La','VII':'Ti',
+    'bII':'Ra','bIII':'Me','bV':'Se','bVI':'Le','bVII':'Te',
+    '#I':'Di','#II':'Ri','#IV':'Fi','#V':'Si','#VI':'Li','bI':'Ti'
+}
+
+CHORD_FORMULAS = {
+    'maj7':[0,4,7,11],'mM7':[0,3,7,11],'6':[0,4,7,9],'m6':[0,3,7,9],
+    '7':[0,4,7,10],'m7':[0,3,7,10],'m7b5':[0,3,6,10],'dim7':[0,3,6,9],
+    'aug':[0,4,8],'aug7':[0,4,8,10],'7(b5)':[0,4,6,10],'+M7':[0,4,8,11],'7sus4':[0,5,7,10]
+}
+
+MAJOR_BY_FLATS = {0:"C",1:"F",2:"Bb",3:"Eb",4:"Ab",5:"Db",6:"Gb",7:"Cb"}
+MAJOR_BY_SHARPS = {0:"C",1:"G",2:"D",3:"A",4:"E",5:"B",6:"F#",7:"C#"}
+
+CATEGORY_INFO = {
+    'Enharmonics': ['Degrees', 'Number', 'Natural Form'],
+    'Warming up': ['Counting keys', 'Finding degrees', 'Chord tones', 'Key signatures', 'Solfege'],
+    'Intervals': ['Alternative', 'Tracking'],
+    'Chord Forms': ['Relationships', 'Extract (Degree)', '9 chord', 'Rootless'],
+    'Cycle of 5th': ['P5 down', 'P5 up', 'r calc', '2-5-1'],
+    'Locations': ['Deg->Pitch', 'Pitch->Deg'],
+    'Tritones': ['Pitch', 'Degree', 'Dom7', 'Dim7'],
+    'Modes': ['Alterations', 'Tensions', 'Chords(Deg)', 'Chords(Key)'],
+    'Minor': ['Chords', 'Tensions', 'Pitch'],
+    'Mastery': ['Functions', 'Degrees', 'Pitches', 'Avail Scales', 'Pivot', 'Similarities']
+}
+
+# Enharmonics
+ENH_DEGREE_PAIRS = [
+    ("#VII", "I"), ("#I", "bII"), ("#II", "bIII"), ("bIV", "III"),
+    ("IV", "#III"), ("#V", "bVI"), ("#VI", "bVII"), ("VII", "bI")
+]
+ENH_NUMBER_GROUPS = [
+    ["1","8","#7"], ["#1","b2","#8","b9"], ["2","9"], ["#2","b3","#9","b10"],
+    ["3","b4","10","b11"], ["4","#3","11","#10"], ["#4","b5","#11","b12"], ["5","12"],
+    ["#5","b6","#12","b13"], ["6","13"], ["#6","b7","#13","b14"], ["7","b8","14"]
+]
+ENH_INTERVAL_GROUPS = [
+    ["P1","+7","-2","P8","-9"], ["m2","+1","m9","+8"], ["M2","-3","M9","-10"],
+    ["m3","+2","m10","+9"], ["M3","-4","M10","-11"], ["P4","+3","P11","+10"],
+    ["+4","-5","+11","-12"], ["P5","-6","P12","-13"], ["m6","+5","m13","+12"],
+    ["M6","-7","M13","-14"], ["m7","+6","m14","+13"], ["M7","-8","M14"]
+]
+
+# Modes / Minor / Mastery
+MODE_ALTERATIONS = {
+    "Dorian": ["bIII","bVII"],
+    "Phrygian": ["bII","bIII","bVI","bVII"],
+    "Lydian": ["#IV"],
+    "Mixolydian": ["bVII"],
+    "Aeolian": ["bII","bIII","bVI","bVII"],
+    "Locrian": ["bII","bIII","bV","bVI","bVII"],
+}
+MODE_TENSIONS = {
+    "Ionian": ["9","13"],
+    "Dorian": ["9","11"],
+    "Phrygian": ["11"],
+    "Lydian": ["#4"],
+    "Mixolydian": ["9","13"],
+    "Aeolian": ["9","11"],
+    "Locrian": ["11","b13"],
+}
+MODE_7TH_CHORDS_DEG = {
+    "Ionian": ["Imaj7","IIm7","IIIm7","IVmaj7","V7","VIm7","VIIm7b5"],
+    "Dorian": ["Im7","IIm7","bIIImaj7","IV7","Vm7","VIm7b5","bVIImaj7"],
+    "Phrygian": ["Im7","bIImaj7","bIII7","IVm7","Vm7b5","bVImaj7","bVIIm7"],
+    "Lydian": ["Imaj7","II7","IIIm7","#IVm7b5","Vmaj7","VIm7","VIIm7"],
+    "Mixolydian": ["I7","IIm7","IIIm7b5","IVmaj7","Vm7","VIm7","bVIImaj7"],
+    "Aeolian": ["Im7","IIm7b5","bIIImaj7","IVm7","Vm7","bVImaj7","bVII7"],
+    "Locrian": ["Im7b5","bIImaj7","bIIIm7","IVm7","bVmaj7","bVI7","bVIIm7"],
+}
+
+MINOR_DEGREES = {
+    "Natural minor": ["I","II","bIII","IV","V","bVI","bVII"],
+    "Harmonic minor": ["I","II","bIII","IV","V","bVI","VII"],
+    "Melodic minor": ["I","II","bIII","IV","V","VI","VII"],
+}
+MINOR_CHORD_FORMS = {
+    "Natural minor": ["m7","m7b5","maj7","m7","m7","maj7","7"],
+    "Harmonic minor": ["mM7","m7b5","+M7","m7","7","maj7","dim7"],
+    "Melodic minor": ["mM7","m7","+M7","7","7","m7b5","m7b5"],
+}
+MINOR_TENSIONS = {
+    "Natural minor": [["9","11"],["11","b13"],["9","13"],["9","11"],["11"],["9","#11"],["9","13"]],
+    "Harmonic minor": [["9","11"],["11","13"],["9"],["9","#11"],["9","#11"],["9","b13"],["9","11"]],
+    "Melodic minor": [["9","11","13"],["11","13"],["9","#11","13"],["9","#11","13"],["9","b13"],["9","11","b13"],["11","b13"]],
+}
+
+FUNCTIONS = {
+    'T': set(['I','I6','Imaj7','IIIm7','VIm7','I7','IIIm7b5','III7']),
+    'Tm': set(['Im','Im6','Imb6','Im7','ImM7','bIIImaj7','bIII+M7','VIm7b5']),
+    'SD': set(['IV','IV6','IVmaj7','IIm7','IV7','bVII','bVIImaj7','VII7']),
+    'SDm': set(['IVm','IVm6','IVm7','IIm7b5','bVI6','bVImaj7','bVII7','bIImaj7','bVI7','IVmM7']),
+    'D': set(['V','V7','VIIm7b6','bII7','VIIdim7']),
+    'Dm': set(['Vm','Vm7']),
+}
+FUNCTION_OVERRIDES = {'#IVm7b5':['T','SD'], 'bVImaj7':['SDm','Tm']}
+
+SCALE_DEGREES = {
+    "Ionian": ["I","II","III","IV","V","VI","VII"],
+    "Dorian": ["I","II","bIII","IV","V","VI","bVII"],
+    "Phrygian": ["I","bII","bIII","IV","V","bVI","bVII"],
+    "Lydian": ["I","II","III","#IV","V","VI","VII"],
+    "Mixolydian": ["I","II","III","IV","V","VI","bVII"],
+    "Aeolian": ["I","bII","bIII","IV","V","bVI","bVII"],
+    "Locrian": ["I","bII","bIII","IV","bV","bVI","bVII"],
+    "Natural minor": ["I","II","bIII","IV","V","bVI","bVII"],
+    "Harmonic minor": ["I","II","bIII","IV","V","bVI","VII"],
+    "Melodic minor": ["I","II","bIII","IV","V","VI","VII"],
+}
+AVAILABLE_SCALES = {
+    "Ionian": ['I','I6','Imaj7'],
+    "Dorian": ['IVm','IVm6','IVm7','IIm7'],
+    "Phrygian": ['IIIm7'],
+    "Lydian": ['IV','IVmaj7','bVII','bVIImaj7','bVImaj7','bIImaj7','bIIImaj7'],
+    "Mixolydian": ['V','bVII7','V7/IV','V7/V','V7'],
+    "Aeolian": ['VIm7'],
+    "Locrian": ['VIIm7b5','#IVm7b5','IIm7b5'],
+    "All": ['I7'],
+    "Lydian b7": ['IV7','bVII7','bVI7','bII7','IV6'],
+    "Altered": ['VII7'],
+    "HmP5↓": ['V7'],
+    "Combination of Diminished": ['V7','bII7','bVII7'],
+}
+
+_ROMAN_RE = re.compile(r"^(b|#)?(I|II|III|IV|V|VI|VII)(.*)$")
+
+@lru_cache(maxsize=4096)
+def degchord_to_pitchchord(key: str, degch: str) -> str:
+    m = _ROMAN_RE.match(degch)
+    if not m:
+        return f"{key}{degch}"
+    acc = m.group(1) or ""
+    roman = m.group(2)
+    qual = m.group(3) or ""
+    deg = f"{acc}{roman}"
+    root = transpose_pitch(key, degree_to_semitone(deg))
+    return f"{root}{qual}"
+
+def ord_suffix(n: int) -> str:
+    return {1:"Ist",2:"IInd",3:"IIIrd",4:"IVth",5:"Vth",6:"VIth",7:"VIIth"}.get(n, f"{n}th")
+
+_SEMI_TO_DEGREE = [next((k for k, v in DEGREE_MAP.items() if v == i), "I") for i in range(12)]
+
+def inv_degree_from_semi(semi: int) -> str:
+    return _SEMI_TO_DEGREE[semi % 12]
+
+
+# model
+@dataclass
+class Question:
+    category: str
+    subcategory: str
+    prompt: str
+    answers: List[str]
+    kind: str
+    sep: Optional[str] = None
+    rule: str = ""
+    # canonical forms of `answers`, fixed at build time so grading is one set lookup
+    canonical: frozenset = field(init=False, repr=False, compare=False)
+    # pitches graded as spelled (see SPELLING_TOPICS)
+    spelled: bool = field(init=False, repr=False, compare=False)
+    # index in GEN_SPACES[(category, subcategory)]; -1 when not built from a space
+    item: int = field(default=-1, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.spelled = (self.category, self.subcategory) in SPELLING_TOPICS
+        self.canonical = frozenset(canonical_answer(self.kind, normalize_user_input(a), self.spelled) for a in self.answers)
+
+
+def qbuild(cat: str, sub: str, prompt: str, answers: List[str], kind: str, sep: Optional[str] = None, rule: str = "") -> Question:
+    return Question(cat, sub, prompt, answers, kind, sep, rule)
+
+
+# generators
+# Each topic has a _q_* builder (parameters -> Question) and a gen_* that draws
+# the parameters; GEN_SPACES below enumerates the same parameters.
+def _q_enh_degrees(ask: str, ans: str) -> Question:
+    return qbuild("Enharmonics", "Degrees", f"What is {ask}'s enharmonic?", [ans], "degree")
+
+def gen_enh_degrees(rng=random) -> Question:
+    a, b = rng.choice(ENH_DEGREE_PAIRS)
+    ask = rng.choice([a, b])
+    ans = b if ask == a else a
+    return _q_enh_degrees(ask, ans)
+
+def _q_enh_number(group: List[str], shown: str) -> Question:
+    expected = [x for x in group if x != shown]
+    return qbuild("Enharmonics", "Number", f"What are {shown}'s enharmonics?", expected, "number", sep=",")
+
+def gen_enh_number(rng=random) -> Question:
+    group = rng.choice(ENH_NUMBER_GROUPS)
+    return _q_enh_number(group, rng.choice(group))
+
+def _q_enh_interval(group: List[str], shown: str) -> Question:
+    expected = [x for x in group if x != shown]
+    return qbuild("Enharmonics", "Natural Form", f"What are {shown}'s enharmonics?", expected, "interval", sep=",")
+
+def gen_enh_interval(rng=random) -> Question:
+    group = rng.choice(ENH_INTERVAL_GROUPS)
+    return _q_enh_interval(group, rng.choice(group))
+
+def _q_warm_counting_keys(keynum: int) -> Question:
+    d = ((keynum - 1) % 13) + 1
+    return qbuild("Warming up","Counting keys", f"What degree has {keynum}keys?", DISTANCE_TO_DEGREE.get(d, ["I"]), "degree")
+
+def gen_warm_counting_keys(rng=random) -> Question:
+    return _q_warm_counting_keys(rng.randint(1, 24))
+
+def _q_warm_finding_degrees(root: str, deg: str) -> Question:
+    ans = transpose_pitch(root, degree_to_semitone(deg))
+    return qbuild("Warming up","Finding degrees", f"What pitch is {deg} of {root}Key?", [ans], "pitch")
+
+def gen_warm_finding_degrees(rng=random) -> Question:
+    root = rng.choice(NOTES)
+    deg = rng.choice(list(DEGREE_MAP.keys()))
+    return _q_warm_finding_degrees(root, deg)
+
+def _q_warm_chord_tones(root: str, chord: str) -> Question:
+    tones = [transpose_pitch(root, s) for s in CHORD_FORMULAS[chord]]
+    return qbuild("Warming up","Chord tones", f"What are the Chord tones of {root}{chord}?", tones, "pitch", sep=",")
+
+def gen_warm_chord_tones(rng=random) -> Question:
+    root = rng.choice(NOTES)
+    chord = rng.choice(list(CHORD_FORMULAS.keys()))
+    return _q_warm_chord_tones(root, chord)
+
+def _q_warm_key_signatures(is_major: bool, t: str, n: int) -> Question:
+    sig = (t * n) if n > 0 else ""
+    maj = MAJOR_BY_FLATS.get(n, "C") if t == "b" else MAJOR_BY_SHARPS.get(n, "C")
+    ans = maj if is_major else relative_minor(maj)
+    qtype = "major" if is_major else "minor"
+    return qbuild("Warming up","Key signatures", f"What {qtype} key has ({sig})?", [norm_pitch(ans)], "pitch")
+
+def gen_warm_key_signatures(rng=random) -> Question:
+    is_major = rng.choice([True, False])
+    t = rng.choice(["#", "b"])
+    n = rng.randint(0, 7)
+    return _q_warm_key_signatures(is_major, t, n)
+
+def _q_warm_solfege(deg: str) -> Question:
+    return qbuild("Warming up","Solfege", f"What is {deg}'s solfege?", [SOLFEGE[deg]], "solfege")
+
+def gen_warm_solfege(rng=random) -> Question:
+    return _q_warm_solfege(rng.choice(list(SOLFEGE.keys())))
+
+R_CALC_INTERVALS = ["m2","M2","m3","M3","P4","P5","m6","M6","m7","M7","+11","-2","+7","-12"]
+
+def _q_cycle_r_calc(form: int, label: str) -> Question:
+    if form == 1:
+        p = degree_to_pitch_in_C(label)
+    elif form == 2:
+        p = interval_to_pitch_from_C(label)
+    else:
+        p = tension_to_pitch_from_C(label)
+    ans = str(cycle_r_steps_to_pitch(p))
+    return qbuild("Cycle of 5th","r calc", f"How many 'r's do you need to get {label}?", [ans], "number")
+
+def gen_cycle_r_calc(rng=random) -> Question:
+    form = rng.choice([1,2,3])
+    if form == 1:
+        return _q_cycle_r_calc(1, rng.choice(list(DEGREE_MAP.keys())))
+    if form == 2:
+        return _q_cycle_r_calc(2, rng.choice(R_CALC_INTERVALS))
+    return _q_cycle_r_calc(3, rng.choice(list(_TENSION_TO_SEMI.keys())))
+
+def _q_modes_alterations(mode: str) -> Question:
+    return qbuild("Modes","Alterations", f"What degree should be flatted or sharped in {mode} scale?", MODE_ALTERATIONS[mode], "degree", sep=",")
+
+def gen_modes_alterations(rng=random) -> Question:
+    return _q_modes_alterations(rng.choice(list(MODE_ALTERATIONS.keys())))
+
+def _q_modes_tensions(mode: str) -> Question:
+    return qbuild("Modes","Tensions", f"What are the tension notes of {mode}?", MODE_TENSIONS[mode], "tension", sep=",")
+
+def gen_modes_tensions(rng=random) -> Question:
+    return _q_modes_tensions(rng.choice(list(MODE_TENSIONS.keys())))
+
+def _q_modes_chords_deg(mode: str, n: int) -> Question:
+    ans = MODE_7TH_CHORDS_DEG[mode][n-1]
+    return qbuild("Modes","Chords(Deg)", f"What is {ord_suffix(n)} 7th chord in {mode}?", [ans], "degree")
+
+def gen_modes_chords_deg(rng=random) -> Question:
+    mode = rng.choice(list(MODE_7TH_CHORDS_DEG.keys()))
+    return _q_modes_chords_deg(mode, rng.randint(1, 7))
+
+def _q_modes_chords_key(mode: str, key: str, n: int) -> Question:
+    degch = MODE_7TH_CHORDS_DEG[mode][n-1]
+    ans = degchord_to_pitchchord(key, degch)
+    return qbuild("Modes","Chords(Key)", f"What is {ord_suffix(n)} 7th chord in {key}{mode}?", [ans], "chord")
+
+def gen_modes_chords_key(rng=random) -> Question:
+    mode = rng.choice(list(MODE_7TH_CHORDS_DEG.keys()))
+    key = rng.choice(NOTES)
+    return _q_modes_chords_key(mode, key, rng.randint(1, 7))
+
+def _q_mastery_pivot(chord_type: str, deg: str) -> Question:
+    semi = degree_to_semitone(deg)
+    outs: List[str] = []
+    if chord_type == "maj7":
+        outs = [inv_degree_from_semi(semi + 7), inv_degree_from_semi(semi)]
+    elif chord_type == "7":
+        outs = [inv_degree_from_semi(semi + 5)]
+    elif chord_type == "m7":
+        outs = [inv_degree_from_semi(semi + 10), inv_degree_from_semi(semi + 8), inv_degree_from_semi(semi + 3)]
+    else:
+        outs = [inv_degree_from_semi(semi + 1)]
+    outs = list(dict.fromkeys(outs))
+    return qbuild("Mastery","Pivot", f"What keys have {deg}{chord_type} chord as a pivot chord?", outs, "degree", sep=",")
+
+def gen_mastery_pivot(rng=random) -> Question:
+    chord_type = rng.choice(["maj7","7","m7","m7b5"])
+    deg = rng.choice(list(DEGREE_MAP.keys()))
+    return _q_mastery_pivot(chord_type, deg)
+
+def _q_locations_deg_to_pitch(key: str, deg: str) -> Question:
+    ans = transpose_pitch(key, degree_to_semitone(deg))
+    return qbuild("Locations", "Deg->Pitch", f"{key}Key에서 {deg}는 어떤 Pitch?", [ans], "pitch")
+
+def gen_locations_deg_to_pitch(rng=random) -> Question:
+    key = rng.choice(NOTES)
+    deg = rng.choice(list(DEGREE_MAP.keys()))
+    return _q_locations_deg_to_pitch(key, deg)
+
+def _q_locations_pitch_to_deg(key: str, deg: str) -> Question:
+    pitch = transpose_pitch(key, degree_to_semitone(deg))
+    return qbuild("Locations", "Pitch->Deg", f"{key}Key에서 {pitch}는 어떤 Degree?", [deg], "degree")
+
+def gen_locations_pitch_to_deg(rng=random) -> Question:
+    key = rng.choice(NOTES)
+    deg = rng.choice(list(DEGREE_MAP.keys()))
+    return _q_locations_pitch_to_deg(key, deg)
+
+def _q_tritone_pitch(p: str) -> Question:
+    ans = transpose_pitch(p, 6)
+    return qbuild("Tritones", "Pitch", f"What is the tritone of {p}?", [ans], "pitch")
+
+def gen_tritone_pitch(rng=random) -> Question:
+    return _q_tritone_pitch(rng.choice(NOTES))
+
+def _q_tritone_degree(deg: str) -> Question:
+    semi = (degree_to_semitone(deg) + 6) % 12
+    ans = inv_degree_from_semi(semi)
+    return qbuild("Tritones", "Degree", f"What is the tritone degree of {deg}?", [ans], "degree")
+
+def gen_tritone_degree(rng=random) -> Question:
+    return _q_tritone_degree(rng.choice(list(DEGREE_MAP.keys())))
+
+def _q_tritone_dom7(root: str) -> Question:
+    ans = f"{transpose_pitch(root, 6)}7"
+    return qbuild("Tritones", "Dom7", f"What is the tritone substitution of {root}7?", [ans], "chord")
+
+def gen_tritone_dom7(rng=random) -> Question:
+    return _q_tritone_dom7(rng.choice(NOTES))
+
+def _q_tritone_dim7(root: str) -> Question:
+    ans = transpose_pitch(root, 6)
+    return qbuild("Tritones", "Dim7", f"In {root}dim7, what note is a tritone away from the root?", [ans], "pitch")
+
+def gen_tritone_dim7(rng=random) -> Question:
+    return _q_tritone_dim7(rng.choice(NOTES))
+
+def _q_cycle_p5_down(p: str) -> Question:
+    ans = transpose_pitch(p, -7)
+    return qbuild("Cycle of 5th","P5 down", f"P5 down from {p} is?", [ans], "pitch")
+
+def gen_cycle_p5_down(rng=random) -> Question:
+    return _q_cycle_p5_down(rng.choice(NOTES))
+
+def _q_cycle_p5_up(p: str) -> Question:
+    ans = transpose_pitch(p, +7)
+    return qbuild("Cycle of 5th","P5 up", f"P5 up from {p} is?", [ans], "pitch")
+
+def gen_cycle_p5_up(rng=random) -> Question:
+    return _q_cycle_p5_up(rng.choice(NOTES))
+
+def _q_cycle_251(key: str) -> Question:
+    ii = degchord_to_pitchchord(key, "IIm7")
+    v = degchord_to_pitchchord(key, "V7")
+    i = degchord_to_pitchchord(key, "Imaj7")
+    return qbuild("Cycle of 5th","2-5-1", f"Write 2-5-1 in key of {key} (comma-separated)", [ii, v, i], "chord", sep=",")
+
+def gen_cycle_251(rng=random) -> Question:
+    return _q_cycle_251(rng.choice(NOTES))
+
+def _q_minor_chords(scale: str, n: int) -> Question:
+    deg = MINOR_DEGREES[scale][n-1]
+    form = MINOR_CHORD_FORMS[scale][n-1]
+    ans = f"{deg}{form}"
+    return qbuild("Minor","Chords", f"What is {ord_suffix(n)} chord in {scale}?", [ans], "degree")
+
+def gen_minor_chords(rng=random) -> Question:
+    scale = rng.choice(list(MINOR_CHORD_FORMS.keys()))
+    return _q_minor_chords(scale, rng.randint(1, 7))
+
+def _q_minor_tensions(scale: str, n: int) -> Question:
+    ans = MINOR_TENSIONS[scale][n-1]
+    return qbuild("Minor","Tensions", f"What are the tensions of {ord_suffix(n)} chord in {scale}?", ans, "tension", sep=",")
+
+def gen_minor_tensions(rng=random) -> Question:
+    scale = rng.choice(list(MINOR_TENSIONS.keys()))
+    return _q_minor_tensions(scale, rng.randint(1, 7))
+
+def _q_minor_pitch(scale: str, key: str, deg: str) -> Question:
+    ans = transpose_pitch(key, degree_to_semitone(deg))
+    return qbuild("Minor","Pitch", f"In {key}{scale}, what pitch is {deg}?", [ans], "pitch")
+
+def gen_minor_pitch(rng=random) -> Question:
+    scale = rng.choice(list(MINOR_DEGREES.keys()))
+    key = rng.choice(NOTES)
+    deg = rng.choice(MINOR_DEGREES[scale])
+    return _q_minor_pitch(scale, key, deg)
+
+def _interval_groups_for_alternative() -> List[List[str]]:
+    # 같은 음(동일 pitch class)을 만드는 서로 다른 표기들
+    return [
+        ["P1","+7","-2","P8","-9"],
+        ["m2","+1","m9","+8"],
+        ["M2","-3","M9","-10"],
+        ["m3","+2","m10","+9"],
+        ["M3","-4","M10","-11"],
+        ["P4","+3","P11","+10"],
+        ["+4","-5","+11","-12"],
+        ["P5","-6","P12","-13"],
+        ["m6","+5","m13","+12"],
+        ["M6","-7","M13","-14"],
+        ["m7","+6","m14","+13"],
+        ["M7","-8","M14"],
+    ]
+
+def _q_intervals_alternative(group: List[str], shown: str) -> Question:
+    expected = [x for x in group if x != shown]
+    return qbuild("Intervals", "Alternative", f"What are {shown}'s alternative intervals? (comma-separated)", expected, "interval", sep=",")
+
+def gen_intervals_alternative(rng=random) -> Question:
+    group = rng.choice(_interval_groups_for_alternative())
+    return _q_intervals_alternative(group, rng.choice(group))
+
+def _q_intervals_tracking(root: str, q: str, n: int) -> Question:
+    itv = f"{q}{n}" if q in ["m","M","P"] else f"{q}{interval_to_semitones(q, n)}"
+    ans = transpose_pitch(root, semitone_distance("C", interval_to_pitch_from_C(itv)))
+    return qbuild("Intervals", "Tracking", f"From {root}, what is {itv}?", [ans], "pitch")
+
+def gen_intervals_tracking(rng=random) -> Question:
+    root = rng.choice(NOTES)
+    q = rng.choice(["m","M","P","+","-"])
+    n = rng.choice([1,2,3,4,5,6,7,8,9,10,11,12,13,14])
+    return _q_intervals_tracking(root, q, n)
+
+CHORD_LIST = list(CHORD_FORMULAS.keys())
+
+def _chord_tones(root: str, form: str) -> List[str]:
+    return [transpose_pitch(root, s) for s in CHORD_FORMULAS[form]]
+
+def _q_chord_relationships(a: str, b: str) -> Question:
+    shared = set(CHORD_FORMULAS[a]).intersection(set(CHORD_FORMULAS[b]))
+    prompt = f"Do {a} and {b} share any common chord tones? (yes/no)"
+    ans = ["yes"] if len(shared) > 0 else ["no"]
+    return qbuild("Chord Forms", "Relationships", prompt, ans, "text")
+
+def gen_chord_relationships(rng=random) -> Question:
+    a, b = rng.sample(CHORD_LIST, 2)
+    return _q_chord_relationships(a, b)
+
+def _q_chord_extract_degree(form: str, deg: str) -> Question:
+    root = degree_to_pitch_in_C(deg)
+    tones = _chord_tones(root, form)
+    return qbuild("Chord Forms", "Extract (Degree)", f"Chord tones of {deg}{form} in C (comma-separated)", tones, "pitch", sep=",")
+
+def gen_chord_extract_degree(rng=random) -> Question:
+    form = rng.choice(CHORD_LIST)
+    deg = rng.choice(list(DEGREE_MAP.keys()))
+    return _q_chord_extract_degree(form, deg)
+
+def _q_chord_9(root: str, form: str) -> Question:
+    base = CHORD_FORMULAS[form]
+    ninth = 14  # 9th = 14 semitones from root
+    tones = [transpose_pitch(root, s) for s in (base + [ninth])]
+    return qbuild("Chord Forms", "9 chord", f"What are the chord tones of {root}{form}(9)? (comma-separated)", tones, "pitch", sep=",")
+
+def gen_chord_9(rng=random) -> Question:
+    root = rng.choice(NOTES)
+    form = rng.choice(["maj7","m7","7","m7b5"])
+    return _q_chord_9(root, form)
+
+def _q_chord_rootless(root: str, form: str) -> Question:
+    tones = _chord_tones(root, form)
+    tones_no_root = [t for i, t in enumerate(tones) if i != 0]
+    return qbuild("Chord Forms", "Rootless", f"Rootless voicing tones of {root}{form} (comma-separated)", tones_no_root, "pitch", sep=",")
+
+def gen_chord_rootless(rng=random) -> Question:
+    root = rng.choice(NOTES)
+    form = rng.choice(["7","m7","maj7","m7b5"])
+    return _q_chord_rootless(root, form)
+
+def _function_of(ch: str) -> List[str]:
+    if ch in FUNCTION_OVERRIDES:
+        return FUNCTION_OVERRIDES[ch]
+    outs = []
+    for fn, s in FUNCTIONS.items():
+        if ch in s:
+            outs.append(fn)
+    return outs or ["T"]
+
+# sets iterate in hash order; sort so a seeded rng replays the same question
+_FUNCTION_CHORDS = [c for v in FUNCTIONS.values() for c in sorted(v)]
+
+def _q_mastery_functions(ch: str) -> Question:
+    ans = _function_of(ch)
+    return qbuild("Mastery","Functions", f"What is the function of {ch}?", ans, "text", sep="," if len(ans) > 1 else None)
+
+def gen_mastery_functions(rng=random) -> Question:
+    return _q_mastery_functions(rng.choice(_FUNCTION_CHORDS))
+
+def _q_mastery_degrees(scale: str, n: int) -> Question:
+    ans = SCALE_DEGREES[scale][n-1]
+    return qbuild("Mastery","Degrees", f"In {scale}, what is the {ord_suffix(n)} degree?", [ans], "degree")
+
+def gen_mastery_degrees(rng=random) -> Question:
+    scale = rng.choice(list(SCALE_DEGREES.keys()))
+    return _q_mastery_degrees(scale, rng.randint(1, 7))
+
+def _q_mastery_pitches(key: str, scale: str, deg: str) -> Question:
+    ans = transpose_pitch(key, degree_to_semitone(deg))
+    return qbuild("Mastery","Pitches", f"In {key}{scale}, what pitch is {deg}?", [ans], "pitch")
+
+def gen_mastery_pitches(rng=random) -> Question:
+    key = rng.choice(NOTES)
+    scale = rng.choice(list(SCALE_DEGREES.keys()))
+    deg = rng.choice(SCALE_DEGREES[scale])
+    return _q_mastery_pitches(key, scale, deg)
+
+def _q_mastery_avail_scales(scale: str, ch: str) -> Question:
+    return qbuild("Mastery","Avail Scales", f"What scale includes chord {ch}?", [scale], "text")
+
+def gen_mastery_avail_scales(rng=random) -> Question:
+    scale = rng.choice(list(AVAILABLE_SCALES.keys()))
+    return _q_mastery_avail_scales(scale, rng.choice(AVAILABLE_SCALES[scale]))
+
+def _q_mastery_similarities(a: str, b: str) -> Question:
+    sa, sb = set(SCALE_DEGREES[a]), set(SCALE_DEGREES[b])
+    common = sorted(list(sa.intersection(sb)))
+    if not common:
+        common = ["(none)"]
+    return qbuild("Mastery","Similarities", f"Common degrees between {a} and {b}? (comma-separated)", common, "degree", sep="," if common != ["(none)"] else None)
+
+def gen_mastery_similarities(rng=random) -> Question:
+    a, b = rng.sample(list(SCALE_DEGREES.keys()), 2)
+    return _q_mastery_similarities(a, b)
+
+
+# dispatcher
+GEN_DISPATCH: Dict[tuple, callable] = {
+    ("Enharmonics","Degrees"): gen_enh_degrees,
+    ("Enharmonics","Number"): gen_enh_number,
+    ("Enharmonics","Natural Form"): gen_enh_interval,
+    ("Warming up","Counting keys"): gen_warm_counting_keys,
+    ("Warming up","Finding degrees"): gen_warm_finding_degrees,
+    ("Warming up","Chord tones"): gen_warm_chord_tones,
+    ("Warming up","Key signatures"): gen_warm_key_signatures,
+    ("Warming up","Solfege"): gen_warm_solfege,
+    ("Cycle of 5th","r calc"): gen_cycle_r_calc,
+    ("Modes","Alterations"): gen_modes_alterations,
+    ("Modes","Tensions"): gen_modes_tensions,
+    ("Modes","Chords(Deg)"): gen_modes_chords_deg,
+    ("Modes","Chords(Key)"): gen_modes_chords_key,
+    ("Mastery","Pivot"): gen_mastery_pivot,
+    ("Locations","Deg->Pitch"): gen_locations_deg_to_pitch,
+    ("Locations","Pitch->Deg"): gen_locations_pitch_to_deg,
+    ("Tritones","Pitch"): gen_tritone_pitch,
+    ("Tritones","Degree"): gen_tritone_degree,
+    ("Tritones","Dom7"): gen_tritone_dom7,
+    ("Tritones","Dim7"): gen_tritone_dim7,
+    ("Cycle of 5th","P5 down"): gen_cycle_p5_down,
+    ("Cycle of 5th","P5 up"): gen_cycle_p5_up,
+    ("Cycle of 5th","2-5-1"): gen_cycle_251,
+    ("Minor","Chords"): gen_minor_chords,
+    ("Minor","Tensions"): gen_minor_tensions,
+    ("Minor","Pitch"): gen_minor_pitch,
+    ("Intervals","Alternative"): gen_intervals_alternative,
+    ("Intervals","Tracking"): gen_intervals_tracking,
+    ("Chord Forms","Relationships"): gen_chord_relationships,
+    ("Chord Forms","Extract (Degree)"): gen_chord_extract_degree,
+    ("Chord Forms","9 chord"): gen_chord_9,
+    ("Chord Forms","Rootless"): gen_chord_rootless,
+    ("Mastery","Functions"): gen_mastery_functions,
+    ("Mastery","Degrees"): gen_mastery_degrees,
+    ("Mastery","Pitches"): gen_mastery_pitches,
+    ("Mastery","Avail Scales"): gen_mastery_avail_scales,
+    ("Mastery","Similarities"): gen_mastery_similarities,
+
+}
+
+# -------- question spaces --------
+class IndexPermutation:
+    """Seeded bijection on range(n) with O(1) memory.
+
+    A 4-round Feistel network over the smallest even bit width covering n, with
+    cycle-walking to stay inside range(n). perm[i] costs a few integer ops.
+    """
+    ROUNDS = 4
+
+    def __init__(self, n: int, rng=random):
+        self.n = int(n)
+        bits = max(2, (self.n - 1).bit_length())
+        bits += bits % 2
+        self.half = bits // 2
+        self.mask = (1 << self.half) - 1
+        self.keys = [rng.getrandbits(32) for _ in range(self.ROUNDS)]
+
+    def _round(self, r: int, key: int) -> int:
+        x = ((r ^ key) * 0x9E3779B1) & 0xFFFFFFFF
+        x ^= x >> 15
+        x = (x * 0x85EBCA6B) & 0xFFFFFFFF
+        return (x ^ (x >> 13)) & self.mask
+
+    def _encrypt(self, x: int) -> int:
+        left, right = x >> self.half, x & self.mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half) | right
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, i: int) -> int:
+        if not 0 <= i < self.n:
+            raise IndexError(i)
+        x = self._encrypt(i)
+        while x >= self.n:
+            x = self._encrypt(x)
+        return x
+
+    def __iter__(self):
+        return (self[i] for i in range(self.n))
+
+
+class QuestionSpace:
+    """Every question a generator can produce, as an indexable set.
+
+    The space is the product of `axes`; index i is decoded mixed-radix into one
+    value per axis and passed to `build`. Nothing is materialized. Builds are
+    traced as `span` (gen/<category>/<subcategory> for GEN_SPACES).
+    """
+    def __init__(self, build, *axes):
+        self.build = build
+        self.span = "gen"
+        self.axes = [list(a) for a in axes]
+        self.size = 1
+        for a in self.axes:
+            self.size *= len(a)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def params(self, i: int) -> tuple:
+        if not 0 <= i < self.size:
+            raise IndexError(i)
+        out = []
+        for a in reversed(self.axes):
+            i, r = divmod(i, len(a))
+            out.append(a[r])
+        return tuple(reversed(out))
+
+    def __getitem__(self, i: int) -> Question:
+        if TRACER.enabled:
+            with TRACER.span(self.span):
+                q = self.build(*self.params(i))
+        else:
+            q = self.build(*self.params(i))
+        q.item = i
+        return q
+
+    def __iter__(self):
+        return (self[i] for i in range(self.size))
+
+    def stream(self, rng=random):
+        """Endless questions: no repeat until the whole space has been served,
+        then a fresh permutation for the next pass. An empty space yields nothing."""
+        if self.size == 0:
+            return
+        while True:
+            for i in IndexPermutation(self.size, rng):
+                yield self[i]
+
+    def sample_without_replacement(self, n: int, rng=random) -> List[Question]:
+        return list(islice(self.stream(rng), int(n)))
+
+
+def _ordered_pairs(items: List[str]) -> List[tuple]:
+    return [(a, b) for a in items for b in items if a != b]
+
+def _group_members(groups: List[List[str]]) -> List[tuple]:
+    return [(g, x) for g in groups for x in g]
+
+_DEGREES = list(DEGREE_MAP.keys())
+_R_CALC_LABELS = list(dict.fromkeys(
+    [(1, d) for d in _DEGREES] + [(2, i) for i in R_CALC_INTERVALS] + [(3, t) for t in _TENSION_TO_SEMI]
+))
+# 0 sharps and 0 flats are the same question
+_KEY_SIG_MARKS = [("#", 0)] + [(t, n) for t in ["#", "b"] for n in range(1, 8)]
+
+# parameter spaces mirror the gen_* draws above; keep the two in step
+GEN_SPACES: Dict[tuple, QuestionSpace] = {
+    ("Enharmonics","Degrees"): QuestionSpace(lambda p: _q_enh_degrees(*p), [(a, b) for a, b in ENH_DEGREE_PAIRS] + [(b, a) for a, b in ENH_DEGREE_PAIRS]),
+    ("Enharmonics","Number"): QuestionSpace(lambda p: _q_enh_number(*p), _group_members(ENH_NUMBER_GROUPS)),
+    ("Enharmonics","Natural Form"): QuestionSpace(lambda p: _q_enh_interval(*p), _group_members(ENH_INTERVAL_GROUPS)),
+    ("Warming up","Counting keys"): QuestionSpace(_q_warm_counting_keys, range(1, 25)),
+    ("Warming up","Finding degrees"): QuestionSpace(_q_warm_finding_degrees, NOTES, _DEGREES),
+    ("Warming up","Chord tones"): QuestionSpace(_q_warm_chord_tones, NOTES, CHORD_FORMULAS.keys()),
+    ("Warming up","Key signatures"): QuestionSpace(lambda m, p: _q_warm_key_signatures(m, *p), [True, False], _KEY_SIG_MARKS),
+    ("Warming up","Solfege"): QuestionSpace(_q_warm_solfege, SOLFEGE.keys()),
+    ("Cycle of 5th","r calc"): QuestionSpace(lambda p: _q_cycle_r_calc(*p), _R_CALC_LABELS),
+    ("Modes","Alterations"): QuestionSpace(_q_modes_alterations, MODE_ALTERATIONS.keys()),
+    ("Modes","Tensions"): QuestionSpace(_q_modes_tensions, MODE_TENSIONS.keys()),
+    ("Modes","Chords(Deg)"): QuestionSpace(_q_modes_chords_deg, MODE_7TH_CHORDS_DEG.keys(), range(1, 8)),
+    ("Modes","Chords(Key)"): QuestionSpace(_q_modes_chords_key, MODE_7TH_CHORDS_DEG.keys(), NOTES, range(1, 8)),
+    ("Mastery","Pivot"): QuestionSpace(_q_mastery_pivot, ["maj7","7","m7","m7b5"], _DEGREES),
+    ("Locations","Deg->Pitch"): QuestionSpace(_q_locations_deg_to_pitch, NOTES, _DEGREES),
+    ("Locations","Pitch->Deg"): QuestionSpace(_q_locations_pitch_to_deg, NOTES, _DEGREES),
+    ("Tritones","Pitch"): QuestionSpace(_q_tritone_pitch, NOTES),
+    ("Tritones","Degree"): QuestionSpace(_q_tritone_degree, _DEGREES),
+    ("Tritones","Dom7"): QuestionSpace(_q_tritone_dom7, NOTES),
+    ("Tritones","Dim7"): QuestionSpace(_q_tritone_dim7, NOTES),
+    ("Cycle of 5th","P5 down"): QuestionSpace(_q_cycle_p5_down, NOTES),
+    ("Cycle of 5th","P5 up"): QuestionSpace(_q_cycle_p5_up, NOTES),
+    ("Cycle of 5th","2-5-1"): QuestionSpace(_q_cycle_251, NOTES),
+    ("Minor","Chords"): QuestionSpace(_q_minor_chords, MINOR_CHORD_FORMS.keys(), range(1, 8)),
+    ("Minor","Tensions"): QuestionSpace(_q_minor_tensions, MINOR_TENSIONS.keys(), range(1, 8)),
+    ("Minor","Pitch"): QuestionSpace(lambda p, key: _q_minor_pitch(p[0], key, p[1]), [(s, d) for s in MINOR_DEGREES for d in MINOR_DEGREES[s]], NOTES),
+    ("Intervals","Alternative"): QuestionSpace(lambda p: _q_intervals_alternative(*p), _group_members(_interval_groups_for_alternative())),
+    ("Intervals","Tracking"): QuestionSpace(_q_intervals_tracking, NOTES, ["m","M","P","+","-"], range(1, 15)),
+    ("Chord Forms","Relationships"): QuestionSpace(lambda p: _q_chord_relationships(*p), _ordered_pairs(CHORD_LIST)),
+    ("Chord Forms","Extract (Degree)"): QuestionSpace(_q_chord_extract_degree, CHORD_LIST, _DEGREES),
+    ("Chord Forms","9 chord"): QuestionSpace(_q_chord_9, NOTES, ["maj7","m7","7","m7b5"]),
+    ("Chord Forms","Rootless"): QuestionSpace(_q_chord_rootless, NOTES, ["7","m7","maj7","m7b5"]),
+    ("Mastery","Functions"): QuestionSpace(_q_mastery_functions, dict.fromkeys(_FUNCTION_CHORDS)),
+    ("Mastery","Degrees"): QuestionSpace(_q_mastery_degrees, SCALE_DEGREES.keys(), range(1, 8)),
+    ("Mastery","Pitches"): QuestionSpace(lambda key, p: _q_mastery_pitches(key, *p), NOTES, [(s, d) for s in SCALE_DEGREES for d in SCALE_DEGREES[s]]),
+    ("Mastery","Avail Scales"): QuestionSpace(lambda p: _q_mastery_avail_scales(*p), [(s, c) for s in AVAILABLE_SCALES for c in AVAILABLE_SCALES[s]]),
+    ("Mastery","Similarities"): QuestionSpace(lambda p: _q_mastery_similarities(*p), _ordered_pairs(list(SCALE_DEGREES.keys()))),
+}
+for (_c, _s), _space in GEN_SPACES.items():
+    _space.span = f"gen/{_c}/{_s}"
+
+def generate_question(cat: str, sub: str, rng=random) -> Question:
+    # gen_* draw their own parameters, so they are traced here rather than in QuestionSpace
+    fn = GEN_DISPATCH.get((cat, sub))
+    if fn:
+        if TRACER.enabled:
+            with TRACER.span(f"gen/{cat}/{sub}"):
+                return fn(rng)
+        return fn(rng)
+    return qbuild(cat, sub, f"Determine the {sub}.", ["C"], "text")
+
+def _weights_from_records(rows: List[dict]) -> Dict[tuple, float]:
+    base = {(c, s): 1.0 for c, subs in CATEGORY_INFO.items() for s in subs}
+    for r in rows or []:
+        c = str(r.get("category", ""))
+        s = str(r.get("subcategory", ""))
+        if (c, s) in base:
+            try:
+                base[(c, s)] = max(0.0, float(r.get("weight", 1.0)))
+            except Exception:
+                base[(c, s)] = 1.0
+    return base
+
+
+class AliasSampler:
+    """Walker/Vose alias table over weighted items: O(n) build, O(1) per draw.
+
+    Items with weight <= 0 are never drawn; if every weight is 0 the draw is uniform.
+    """
+    def __init__(self, items: List, weights: List[float]):
+        self.items = list(items)
+        ws = [max(0.0, float(w)) for w in weights]
+        total = sum(ws)
+        n = len(self.items)
+        if n == 0:
+            raise ValueError("AliasSampler needs at least one item")
+        if total <= 0:
+            ws = [1.0] * n
+            total = float(n)
+        self.weights = ws
+
+        scaled = [w * n / total for w in ws]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        # leftovers are 1.0 up to float error
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    @classmethod
+    def from_map(cls, wm: Dict[tuple, float]) -> "AliasSampler":
+        pairs = list(wm.keys())
+        return cls(pairs, [wm[p] for p in pairs])
+
+    def draw(self, rng=random):
+        i = int(rng.random() * len(self.items))
+        return self.items[i] if rng.random() < self.prob[i] else self.items[self.alias[i]]
+
+    def draw_k(self, k: int, rng=random) -> List:
+        n = len(self.items)
+        items, prob, alias = self.items, self.prob, self.alias
+        out = []
+        for _ in range(int(k)):
+            i = int(rng.random() * n)
+            out.append(items[i] if rng.random() < prob[i] else items[alias[i]])
+        return out
+
+    def sample_without_replacement(self, k: int, rng=random) -> List:
+        """Weighted draw with no repeats (Efraimidis-Spirakis keys).
+
+        When k exceeds the number of drawable items, the items are dealt out in
+        rounds: every item appears once before any item appears again.
+        """
+        idx = [i for i, w in enumerate(self.weights) if w > 0]
+        out: List = []
+        while len(out) < int(k):
+            keyed = sorted(idx, key=lambda i: rng.random() ** (1.0 / self.weights[i]), reverse=True)
+            out.extend(self.items[i] for i in keyed[:int(k) - len(out)])
+        return out
+
+
+def _weights_sampler() -> AliasSampler:
+    if "stat_mgr" not in st.session_state:
+        return AliasSampler.from_map(_weights_from_records([]))
+    return st.session_state.stat_mgr.weights_sampler()
+
+def generate_question_weighted(rng=random) -> Question:
+    cat, sub = _weights_sampler().draw(rng)
+    return generate_question(cat, sub, rng)
+
+def generate_questions_weighted(n: int, distinct: bool = False, rng=random) -> List[Question]:
+    """Weighted topics; within a topic no question repeats until its space is used up."""
+    sampler = _weights_sampler()
+    topics = sampler.sample_without_replacement(n, rng) if distinct else sampler.draw_k(n, rng)
+    streams = {}
+    out = []
+    for t in topics:
+        if t not in GEN_SPACES:
+            out.append(generate_question(t[0], t[1], rng))
+            continue
+        if t not in streams:
+            streams[t] = GEN_SPACES[t].stream(rng)
+        out.append(next(streams[t]))
+    return out
+
+def new_quiz_seed() -> int:
+    return random.SystemRandom().getrandbits(32)
+
+@traced()
+def build_quiz(cat: str, sub: str, mode: str, limit: int, seed: int) -> List[Question]:
+    """All questions of a quiz, fully determined by (seed, cat, sub, mode, limit).
+
+    Weighted quizzes also depend on the weights in effect (see weights_version).
+    """
+    rng = random.Random(seed)
+    if mode == "fixed":
+        space = GEN_SPACES.get((cat, sub))
+        if space is None:
+            return [generate_question(cat, sub, rng) for _ in range(int(limit))]
+        return space.sample_without_replacement(limit, rng)
+    return generate_questions_weighted(int(limit), rng=rng)
+
+# -------- spaced review --------
+
+class IndexedMinHeap:
+    """Binary min-heap of keys by priority, with key -> slot positions.
+
+    push() inserts or re-prioritizes a key and remove() drops one, both in
+    O(log n); the minimum is read in O(1) and the k smallest in O(k log k)
+    without touching the heap.
+    """
+    def __init__(self):
+        self.heap: List[list] = []  # [priority, key]
+        self.pos: Dict = {}
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def __contains__(self, key) -> bool:
+        return key in self.pos
+
+    def priority(self, key) -> float:
+        return self.heap[self.pos[key]][0]
+
+    def push(self, key, priority: float):
+        i = self.pos.get(key)
+        if i is None:
+            self.heap.append([priority, key])
+            i = self.pos[key] = len(self.heap) - 1
+            self._up(i)
+            return
+        old = self.heap[i][0]
+        self.heap[i][0] = priority
+        if priority < old:
+            self._up(i)
+        else:
+            self._down(i)
+
+    def peek(self) -> Optional[tuple]:
+        """(key, priority) of the minimum, or None when empty."""
+        return (self.heap[0][1], self.heap[0][0]) if self.heap else None
+
+    def pop(self) -> tuple:
+        key, pri = self.peek()
+        self.remove(key)
+        return key, pri
+
+    def remove(self, key):
+        i = self.pos.pop(key)
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.pos[last[1]] = i
+            self._up(i)
+            self._down(self.pos[last[1]])
+
+    def nsmallest(self, k: int) -> List[tuple]:
+        """The k smallest (key, priority), smallest first."""
+        out = []
+        frontier = [(self.heap[0][0], 0)] if self.heap else []
+        while frontier and len(out) < k:
+            pri, i = heapq.heappop(frontier)
+            out.append((self.heap[i][1], pri))
+            for c in (2 * i + 1, 2 * i + 2):
+                if c < len(self.heap):
+                    heapq.heappush(frontier, (self.heap[c][0], c))
+        return out
+
+    def count_upto(self, priority: float) -> int:
+        """Number of keys with priority <= `priority`; visits only those (and their children)."""
+        h = self.heap
+        n, stack = 0, [0] if h else []
+        while stack:
+            i = stack.pop()
+            if h[i][0] <= priority:
+                n += 1
+                stack.extend(c for c in (2 * i + 1, 2 * i + 2) if c < len(h))
+        return n
+
+    def _up(self, i: int):
+        h, pos = self.heap, self.pos
+        node = h[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if h[parent][0] <= node[0]:
+                break
+            h[i] = h[parent]
+            pos[h[i][1]] = i
+            i = parent
+        h[i] = node
+        pos[node[1]] = i
+
+    def _down(self, i: int):
+        h, pos = self.heap, self.pos
+        n = len(h)
+        node = h[i]
+        while True:
+            c = 2 * i + 1
+            if c >= n:
+                break
+            if c + 1 < n and h[c + 1][0] < h[c][0]:
+                c += 1
+            if h[c][0] >= node[0]:
+                break
+            h[i] = h[c]
+            pos[h[i][1]] = i
+            i = c
+        h[i] = node
+        pos[node[1]] = i
+
+
+@dataclass
+class ReviewItem:
+    ef: float = REVIEW_EF_START
+    interval: int = 0  # days
+    reps: int = 0
+    lapses: int = 0
+    due: float = 0.0  # epoch seconds
+
+
+def answer_quality(wrong_tries: int, solved: bool) -> int:
+    """SM-2 grade (0-5) of one answer: 5 first try, 4 / 3 after one / two misses, 1 if given up."""
+    return max(3, 5 - wrong_tries) if solved else 1
+
+
+class ReviewScheduler:
+    """One user's spaced-review items (SM-2), keyed (category, subcategory, item index).
+
+    Items are tracked from their first answer in any quiz mode; `heap` orders
+    them by due time, so the next due item is found without scanning. Topics
+    whose items changed are kept in `dirty` until StatManager saves them (one
+    Review row per user and topic, encoded by encode_topic).
+    """
+    VERSION = "v1"
+
+    def __init__(self, user: str):
+        self.user = user
+        self.topics: Dict[tuple, Dict[int, ReviewItem]] = {}
+        self.heap = IndexedMinHeap()
+        self.dirty: set = set()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def get(self, key: tuple) -> Optional[ReviewItem]:
+        return self.topics.get(key[:2], {}).get(key[2])
+
+    def _put(self, key: tuple, it: ReviewItem):
+        self.topics.setdefault(key[:2], {})[key[2]] = it
+        self.heap.push(key, it.due)
+
+    def answer(self, key: tuple, quality: int, now: Optional[float] = None):
+        """Apply one SM-2 review to `key` (tracking it if new)."""
+        now = time.time() if now is None else now
+        it = self.get(key) or ReviewItem()
+        if quality < 3:
+            it.reps = 0
+            it.lapses += 1
+            it.interval = 0
+            it.due = now + REVIEW_RELEARN_MIN * 60
+        else:
+            it.reps += 1
+            it.interval = 1 if it.reps == 1 else 6 if it.reps == 2 else max(1, round(it.interval * it.ef))
+            it.due = now + it.interval * 86400
+        it.ef = max(REVIEW_EF_MIN, it.ef + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+        self._put(key, it)
+        self.dirty.add(key[:2])
+
+    def due_count(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        return self.heap.count_upto(now)
+
+    def next_keys(self, n: int, now: Optional[float] = None) -> tuple:
+        """(due, ahead): up to n due keys, most overdue first, then the soonest not yet due."""
+        now = time.time() if now is None else now
+        due, ahead = [], []
+        for key, t in self.heap.nsmallest(n):
+            (due if t <= now else ahead).append(key)
+        return due, ahead
+
+    def new_keys(self, n: int, sampler: "AliasSampler", rng=random) -> List[tuple]:
+        """Up to n untracked items from weighted topics (a topic whose items are all tracked is skipped)."""
+        out, chosen, taken = [], set(), Counter()
+        for _ in range(n * 4):
+            if len(out) >= n:
+                break
+            t = sampler.draw(rng)
+            space = GEN_SPACES.get(t)
+            tracked = self.topics.get(t, {})
+            if space is None or len(tracked) + taken[t] >= len(space):
+                continue
+            # uniform over the untracked indexes: redraw while at least half are free, else list them
+            free = len(space) - len(tracked) - taken[t]
+            if 2 * free >= len(space):
+                i = rng.randrange(len(space))
+                while i in tracked or t + (i,) in chosen:
+                    i = rng.randrange(len(space))
+            else:
+                i = rng.choice([j for j in range(len(space)) if j not in tracked and t + (j,) not in chosen])
+            taken[t] += 1
+            chosen.add(t + (i,))
+            out.append(t + (i,))
+        return out
+
+    def quiz(self, n: int, sampler: "AliasSampler", rng=random, now: Optional[float] = None) -> List[Question]:
+        """n questions: due items first, then new ones, then items due soonest."""
+        due, ahead = self.next_keys(n, now)
+        keys = due + self.new_keys(n - len(due), sampler, rng)
+        keys += ahead[:n - len(keys)]
+        rng.shuffle(keys)
+        return [GEN_SPACES[k[:2]][k[2]] for k in keys]
+
+    # persistence: "v1 item,ef*100,interval,reps,lapses,due_minute ..."
+    def encode_topic(self, topic: tuple) -> str:
+        parts = [self.VERSION]
+        for i, it in sorted(self.topics.get(topic, {}).items()):
+            parts.append(f"{i},{round(it.ef * 100)},{it.interval},{it.reps},{it.lapses},{int(it.due // 60)}")
+        return " ".join(parts)
+
+    def load(self, records: List[dict]):
+        """Add stored Review rows of this user; items already answered this session are kept."""
+        for r in records:
+            topic = (str(r.get("category")), str(r.get("subcategory")))
+            space = GEN_SPACES.get(topic)
+            parts = str(r.get("items", "")).split()
+            if space is None or not parts or parts[0] != self.VERSION:
+                continue
+            for p in parts[1:]:
+                try:
+                    i, ef, interval, reps, lapses, due = (int(x) for x in p.split(","))
+                except ValueError:
+                    continue
+                if 0 <= i < len(space) and i not in self.topics.get(topic, {}):
+                    self._put(topic + (i,), ReviewItem(ef / 100.0, interval, reps, lapses, due * 60.0))
+        self.loaded = True
+
+    def take_dirty(self) -> Dict[tuple, str]:
+        """Encoded rows of the changed topics; they are no longer dirty."""
+        out = {t: self.encode_topic(t) for t in self.dirty}
+        self.dirty = set()
+        return out
+
+# ==============================
+# PART B4 — GRADING + SMART KEYPAD
+# ==============================
+
+# -------- grading --------
+def tokenize_answer(s: str, sep: Optional[str]) -> List[str]:
+    s = normalize_user_input(s)
+    if not sep:
+        return [s]
+    parts = [p.strip() for p in s.split(sep)]
+    return [p for p in parts if p]
+
+def is_answer_correct(q: Question, user_input: str) -> bool:
+    user_tokens = tokenize_answer(user_input, q.sep)
+    if q.sep:
+        return frozenset(canonical_answer(q.kind, t, q.spelled) for t in user_tokens) == q.canonical
+    return canonical_answer(q.kind, user_tokens[0], q.spelled) in q.canonical
+
+
+# -------- keypad sets --------
+KEYPAD_SETS = {
+    "pitch": [
+        ["♭","♯"], ["C","D","E","F"], ["G","A","B"], [","], ["⬅️","❌","✅"]
+    ],
+    "degree": [
+        ["♭","♯"], ["I","II","III"], ["IV","V","VI","VII"], [","], ["⬅️","❌","✅"]
+    ],
+    "number": [
+        ["+","-"], ["1","2","3","4","5"], ["6","7","8","9","0"], [","], ["⬅️","❌","✅"]
+    ],
+    "interval": [
+        ["+","-","m","M","P"], ["1","2","3","4","5"], ["6","7","8","9"], [","], ["⬅️","❌","✅"]
+    ],
+    "solfege": [
+        ["Do","Re","Mi","Fa"], ["Sol","La","Ti"],
+        ["Di","Ri","Fi","Si","Li"], ["Ra","Me","Se","Le","Te"], ["⬅️","❌","✅"]
+    ],
+    "tension": [
+        ["♭","♯"], ["b9","9","#9"], ["11","#11"], ["b13","13"], [","], ["⬅️","❌","✅"]
+    ],
+    "chord": [
+        ["♭","♯"], ["C","D","E","F"], ["G","A","B"],
+        ["maj7","m7","7","m7b5"], ["dim7","aug","+M7","sus4"],
+        ["/",","], ["⬅️","❌","✅"]
+    ],
+    "text": [
+        ["C","D","E","F","G","A","B"], ["⬅️","❌","✅"]
+    ]
+}
+
+def keypad_for_kind(kind: str):
+    return KEYPAD_SETS.get(kind, KEYPAD_SETS["text"])
+
+def add_input(k):
+    st.session_state.user_input_buffer += k
+
+def del_input():
+    st.session_state.user_input_buffer = st.session_state.user_input_buffer[:-1]
+
+def clear_input():
+    st.session_state.user_input_buffer = ""
+
+@traced()
+def render_keypad_for_question(q: Question) -> bool:
+    rows = keypad_for_kind(q.kind)
+    st.markdown(
+        "<style>.stButton>button{height:64px;font-size:18px;font-weight:600}</style>",
+        unsafe_allow_html=True
+    )
+    submit = False
+    for r in rows:
+        cols = st.columns(len(r))
+        for i, key in enumerate(r):
+            if key == "⬅️":
+                cols[i].button(key, on_click=del_input, use_container_width=True)
+            elif key == "❌":
+                cols[i].button(key, on_click=clear_input, use_container_width=True)
+            elif key == "✅":
+                submit = cols[i].button(key, type="primary", use_container_width=True)
+            else:
+                cols[i].button(key, on_click=add_input, args=(key,), use_container_width=True)
+    return submit
+# ==============================
+# PART B5 — STORAGE (StatManager) + STATS DATA
+# ==============================
+
+def now_iso() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+class WeightsCache:
+    """Process-wide snapshot of the QuizWeights sheet.
+
+    `version` only moves when the records actually change, so anything derived
+    from the weights (the weights map, samplers, ...) can be memoized on it.
+    `lock` is only held to read or swap the snapshot, never across a sheet read.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded = threading.Condition(self.lock)
+        self.loading = False
+        self.epoch = 0
+        self.records: Optional[List[dict]] = None
+        self.loaded_at = 0.0
+        self.version = 0
+        self._wmap: Optional[Dict[tuple, float]] = None
+        self._wmap_version = -1
+        self._sampler: Optional[AliasSampler] = None
+        self._sampler_version = -1
+
+    def is_fresh(self) -> bool:
+        return self.records is not None and (time.time() - self.loaded_at) < WEIGHTS_TTL_SEC
+
+    def store(self, rows: List[dict]):
+        if rows != self.records:
+            self.version += 1
+        self.records = rows
+        self.loaded_at = time.time()
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = 0.0
+            self.epoch += 1
+
+    def refresh(self, load) -> List[dict]:
+        """Return the records, calling load() if they are stale.
+
+        Only one caller loads at a time; the others keep using the stale snapshot
+        (or wait for the first one). A load that raced an invalidate() is stored
+        but stays stale.
+        """
+        with self.lock:
+            while self.loading and not self.is_fresh():
+                if self.records is not None:
+                    return self.records
+                self.loaded.wait()
+            if self.is_fresh():
+                return self.records
+            self.loading = True
+            epoch = self.epoch
+        try:
+            rows = load()
+            with self.lock:
+                self.store(rows)
+                if epoch != self.epoch:
+                    self.loaded_at = 0.0
+                return self.records
+        finally:
+            with self.lock:
+                self.loading = False
+                self.loaded.notify_all()
+
+    def weights_map(self) -> Dict[tuple, float]:
+        if self._wmap is None or self._wmap_version != self.version:
+            self._wmap = _weights_from_records(self.records or [])
+            self._wmap_version = self.version
+        return self._wmap
+
+    def sampler(self) -> AliasSampler:
+        if self._sampler is None or self._sampler_version != self.version:
+            self._sampler = AliasSampler.from_map(self.weights_map())
+            self._sampler_version = self.version
+        return self._sampler
+
+
+@st.cache_resource
+def _weights_cache(store_key: str) -> WeightsCache:
+    return WeightsCache()
+
+
+@st.cache_resource
+def _spill_lock(path: str) -> threading.Lock:
+    return threading.Lock()
+
+
+@st.cache_resource
+def _spill_sender(path: str) -> threading.Lock:
+    """Held by the one writer resending a spill file, so two never send the same rows."""
+    return threading.Lock()
+
+
+class HistoryFlusher:
+    """Process-wide timer that flushes HistoryWriters once they are due.
+
+    Nothing runs between a session's reruns, so without it a short buffer
+    would wait for the next answer (or go away with a closed tab). A writer is
+    held from its first buffered row until its buffer is empty again.
+    """
+    def __init__(self, tick: float = HISTORY_FLUSH_TICK_SEC):
+        self.tick = tick
+        self.lock = threading.Lock()
+        self.writers: set = set()
+        self.thread: Optional[threading.Thread] = None
+
+    def watch(self, writer: "HistoryWriter"):
+        with self.lock:
+            self.writers.add(writer)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True, name="history-flusher")
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            self.run_once()
+
+    def run_once(self):
+        with self.lock:
+            writers = list(self.writers)
+        for w in writers:
+            if w.is_due():
+                w.flush(background=True)
+            with self.lock:
+                if not w.pending():
+                    self.writers.discard(w)
+
+
+@st.cache_resource
+def _history_flusher() -> HistoryFlusher:
+    return HistoryFlusher()
+
+
+class HistoryWriter:
+    """Write-behind buffer for History rows.
+
+    Rows are queued in memory and sent with a single append_rows once
+    HISTORY_FLUSH_ROWS rows or HISTORY_FLUSH_SEC seconds have piled up, or when
+    flush() is called explicitly (quiz end, logout); a `flusher` checks the
+    buffer between reruns. Batches that still fail after retrying are kept in
+    a local JSONL spill file and resent with the next flush; the file only
+    loses those rows once the resend succeeded. `ws` may be a worksheet or a
+    callable returning the current one; `on_error` sees each failed attempt
+    (e.g. to reconnect) and `on_unsent` the rows of a batch that was spilled
+    instead of written.
+    """
+    def __init__(self, ws, spill_path: str = HISTORY_SPILL_FILE, on_error=None, on_unsent=None,
+                 flusher: Optional[HistoryFlusher] = None):
+        self.ws = ws
+        self.on_error = on_error
+        self.on_unsent = on_unsent
+        self.flusher = flusher
+        self.spill_path = spill_path
+        self.spill_lock = _spill_lock(spill_path)
+        self.spill_sender = _spill_sender(spill_path)
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.rows: List[list] = []
+        self.first_at = 0.0
+        self._inflight: Optional[threading.Thread] = None
+
+    def add(self, row: list):
+        with self.lock:
+            first = not self.rows
+            if first:
+                self.first_at = time.time()
+            self.rows.append(row)
+        if first and self.flusher is not None:
+            self.flusher.watch(self)
+        if self.is_due():
+            self.flush(background=True)
+
+    def is_due(self) -> bool:
+        with self.lock:
+            if not self.rows:
+                return False
+            return len(self.rows) >= HISTORY_FLUSH_ROWS or (time.time() - self.first_at) >= HISTORY_FLUSH_SEC
+
+    def pending(self) -> int:
+        with self.lock:
+            return len(self.rows)
+
+    def flush(self, background: bool = False) -> bool:
+        """Send the buffer. A background flush while one is still running is
+        skipped (the rows stay buffered); a foreground flush waits for it first."""
+        inflight = self._inflight
+        if background and inflight is not None and inflight.is_alive():
+            return True
+        with self.lock:
+            rows, self.rows = self.rows, []
+        if background:
+            if not rows and not os.path.exists(self.spill_path):
+                return True
+            t = threading.Thread(target=SHEETS_USAGE.bind(self._write), args=(rows,), daemon=True)
+            t.start()
+            self._inflight = t
+            return True
+        if inflight is not None:
+            inflight.join(timeout=10)
+            self._inflight = None
+        if not rows and not os.path.exists(self.spill_path):
+            return True
+        return self._write(rows)
+
+    def _write(self, rows: List[list]) -> bool:
+        with self.write_lock:
+            if not self.spill_sender.acquire(blocking=False):
+                return self._send(rows)  # another writer is resending the spill file
+            try:
+                spilled, size = self._spill_read()
+                ok = self._send(spilled + rows, unsent=rows)
+                if ok and size:
+                    self._spill_drop(size)
+                return ok
+            finally:
+                self.spill_sender.release()
+
+    def _send(self, rows: List[list], unsent: Optional[List[list]] = None) -> bool:
+        """append_rows with retries; on failure `unsent` (default: all rows) goes to the spill file."""
+        if not rows:
+            return True
+        for delay in HISTORY_RETRY_DELAYS + [None]:
+            try:
+                ws = self.ws() if callable(self.ws) else self.ws
+                ws.append_rows(rows)
+                return True
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(e)
+                if delay is None:
+                    break
+                time.sleep(delay * (1.0 + random.random() * 0.5))
+        unsent = rows if unsent is None else unsent
+        self._spill_put(unsent)
+        if self.on_unsent is not None and unsent:
+            self.on_unsent(unsent)
+        return False
+
+    def _spill_read(self) -> tuple:
+        """(rows, bytes read) of the spill file; the file itself is left alone."""
+        with self.spill_lock:
+            if not os.path.exists(self.spill_path):
+                return [], 0
+            try:
+                with open(self.spill_path, "rb") as f:
+                    data = f.read()
+                return [json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()], len(data)
+            except Exception:
+                return [], 0
+
+    def _spill_drop(self, size: int):
+        """Remove the first `size` bytes (rows that were resent); keeps rows spilled since."""
+        with self.spill_lock:
+            try:
+                with open(self.spill_path, "rb") as f:
+                    rest = f.read()[size:]
+                if rest.strip():
+                    tmp = self.spill_path + ".tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(rest)
+                    os.replace(tmp, self.spill_path)
+                else:
+                    os.remove(self.spill_path)
+            except OSError:
+                pass
+
+    def _spill_put(self, rows: List[list]):
+        with self.spill_lock:
+            try:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for r in rows:
+                        f.write(json.dumps(r) + "\n")
+            except Exception:
+                pass
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_DAY = _EPOCH.toordinal()
+
+def _history_time(ts: float) -> datetime.datetime:
+    """A History timestamp as the naive datetime stat_df_from_history() gives it."""
+    return _EPOCH + datetime.timedelta(seconds=ts)
+
+def _history_day_span(day: int) -> tuple:
+    """[start, end) timestamps of one day ordinal in _history_time()'s clock."""
+    start = (day - _EPOCH_DAY) * 86400.0
+    return start, start + 86400.0
+
+
+# one topic of a TopicStats (entry_row / load_entry)
+TOPIC_STATS_COLS = ["category", "subcategory", "solved", "correct", "last_hit", "wrong_ts", "last_ts", "days"]
+
+
+class TopicStats:
+    """Running per-topic counters for one user, updated in O(1) per answer.
+
+    Each (category, subcategory) keeps solved / correct totals, the last
+    answer time, the last correct answer time with the wrong answers after it
+    (the wrong streak, whatever order rows arrive in) and [solved, correct]
+    buckets per day for the last TOPIC_STATS_DAYS days. A window starts inside
+    one day; that day's answers are read back through `edge` (day ordinal ->
+    History rows of that day), so windowed numbers match _topic_features().
+    """
+    def __init__(self, edge: Optional[Callable[[int], Iterable[dict]]] = None):
+        self.topics: Dict[tuple, dict] = {}
+        self.edge = edge
+
+    @classmethod
+    def from_rows(cls, rows: List[dict]) -> "TopicStats":
+        stats = cls()
+        by_day: Dict[int, List[dict]] = {}
+        for r in rows:
+            day = stats.add(r)
+            if day is not None:
+                by_day.setdefault(day, []).append(r)
+        stats.edge = lambda day: by_day.get(day, ())
+        return stats
+
+    def copy(self) -> "TopicStats":
+        out = TopicStats(self.edge)
+        out.topics = {
+            k: dict(t, wrong_ts=list(t["wrong_ts"]), days={d: list(b) for d, b in t["days"].items()})
+            for k, t in self.topics.items()
+        }
+        return out
+
+    @staticmethod
+    def _parse(rec: dict) -> Optional[tuple]:
+        """(timestamp, correct, topic key) of one History row; None without a usable timestamp."""
+        try:
+            ts = float(rec.get("timestamp"))
+            _history_time(ts)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        try:
+            ok = int(float(rec.get("is_correct") or 0)) != 0
+        except (TypeError, ValueError):
+            ok = False
+        return ts, ok, (str(rec.get("category", "")), str(rec.get("subcategory", "")))
+
+    @classmethod
+    def day_of(cls, rec: dict) -> Optional[int]:
+        parsed = cls._parse(rec)
+        return None if parsed is None else _history_time(parsed[0]).toordinal()
+
+    def add(self, rec: dict) -> Optional[int]:
+        """Count one History row; returns its day ordinal (None if it was skipped)."""
+        parsed = self._parse(rec)
+        if parsed is None:
+            return None
+        ts, ok, key = parsed
+        day = _history_time(ts).toordinal()
+        t = self.topics.get(key)
+        if t is None:
+            t = self.topics[key] = {"solved": 0, "correct": 0, "last_hit": None, "wrong_ts": [], "last_ts": ts, "days": {}}
+        t["solved"] += 1
+        t["correct"] += int(ok)
+        t["last_ts"] = max(t["last_ts"], ts)
+        if t["last_hit"] is None or ts > t["last_hit"]:
+            if ok:
+                t["last_hit"] = ts
+                t["wrong_ts"] = [w for w in t["wrong_ts"] if w > ts]
+            else:
+                t["wrong_ts"].append(ts)
+        b = t["days"].get(day)
+        if b is None:
+            b = t["days"][day] = [0, 0]
+            for old in [d for d in t["days"] if d < day - TOPIC_STATS_DAYS]:
+                del t["days"][old]
+        b[0] += 1
+        b[1] += int(ok)
+        return day
+
+    def totals(self) -> tuple:
+        return (sum(t["solved"] for t in self.topics.values()), sum(t["correct"] for t in self.topics.values()))
+
+    def version(self) -> tuple:
+        """Changes whenever an answer is added."""
+        return (self.totals()[0], max((t["last_ts"] for t in self.topics.values()), default=0.0))
+
+    def window(self, days: int, now: Optional[datetime.datetime] = None) -> Dict[tuple, tuple]:
+        """(solved, correct) per topic over answers at or after `now - days`.
+
+        Whole days come from the buckets; the day the window starts in is read
+        through `edge` (or counted whole when there is no edge source).
+        """
+        cutoff = (now or datetime.datetime.now()) - datetime.timedelta(days=int(days))
+        first = cutoff.toordinal()
+        out = {}
+        for key, t in self.topics.items():
+            s = c = 0
+            for day, (bs, bc) in t["days"].items():
+                if day > first or (day == first and self.edge is None):
+                    s += bs
+                    c += bc
+            out[key] = [s, c]
+        if self.edge is not None:
+            for rec in self.edge(first):
+                parsed = self._parse(rec)
+                if parsed is None or parsed[2] not in out or _history_time(parsed[0]) < cutoff:
+                    continue
+                out[parsed[2]][0] += 1
+                out[parsed[2]][1] += int(parsed[1])
+        return {key: tuple(v) for key, v in out.items()}
+
+    def daily(self, days: int, category: Optional[str] = None, now: Optional[datetime.datetime] = None) -> pd.DataFrame:
+        """count / correct per calendar day over the last `days` days."""
+        first = ((now or datetime.datetime.now()) - datetime.timedelta(days=int(days))).toordinal()
+        tot: Dict[int, list] = {}
+        for (cat, _), t in self.topics.items():
+            if category is not None and cat != category:
+                continue
+            for day, (bs, bc) in t["days"].items():
+                if day >= first:
+                    b = tot.setdefault(day, [0, 0])
+                    b[0] += bs
+                    b[1] += bc
+        days_sorted = sorted(tot)
+        return pd.DataFrame(
+            [tot[d] for d in days_sorted],
+            index=pd.DatetimeIndex([datetime.date.fromordinal(d) for d in days_sorted]),
+            columns=["count", "correct"],
+        )
+
+    def frame(self, days: int, now: Optional[datetime.datetime] = None) -> pd.DataFrame:
+        """The rows _topic_features() gives for this user's history, without reading it."""
+        now = now or datetime.datetime.now()
+        recent = self.window(days, now)
+        rows = []
+        for key in sorted(self.topics):
+            t = self.topics[key]
+            rs, rc = recent[key]
+            rows.append([
+                key[0], key[1],
+                t["solved"], t["correct"] / t["solved"] * 100.0,
+                rs, (rc / rs * 100.0) if rs else 0.0,
+                len(t["wrong_ts"]),
+                (now - _history_time(t["last_ts"])).days,
+            ])
+        return pd.DataFrame(rows, columns=TOPIC_FEATURE_COLS)
+
+    # one topic <-> one row of the SQLite topic_stats table (and of the TopicStats sheet)
+    def entry_row(self, key: tuple) -> tuple:
+        t = self.topics[key]
+        return (key[0], key[1], t["solved"], t["correct"], t["last_hit"], json.dumps(t["wrong_ts"]),
+                t["last_ts"], json.dumps(t["days"]))
+
+    def load_entry(self, row: dict):
+        self.topics[(row["category"], row["subcategory"])] = {
+            "solved": int(row["solved"]),
+            "correct": int(row["correct"]),
+            "last_hit": None if row["last_hit"] in (None, "") else float(row["last_hit"]),
+            "wrong_ts": [float(w) for w in json.loads(row["wrong_ts"] or "[]")],
+            "last_ts": float(row["last_ts"]),
+            "days": {int(d): list(b) for d, b in json.loads(row["days"] or "{}").items()},
+        }
+
+
+class HistoryIndex:
+    """Process-wide copy of the History sheet, partitioned by username.
+
+    `hwm` is the last sheet row already consumed and `last_row` its values.
+    Each sync re-reads from `hwm` onward: the first row returned must still
+    equal `last_row` (otherwise rows were edited or deleted and the index is
+    rebuilt), the rest are new appends.
+
+    `stats` holds each user's TopicStats over the sheet rows. They are saved
+    to the TopicStats sheet, one row per user and topic along with the History
+    row they count through and its timestamp. After a process start those rows
+    are loaded with load_saved() and the first read only counts the rows past
+    each checkpoint; a topic whose checkpoint row changed is recounted.
+    `dirty` holds the topics changed since the last save.
+
+    Rows recorded in this process wait in `local` (by timestamp) until a sync
+    reads them back; topic_stats() counts them on top of `stats`. Rows whose
+    write was spilled are dropped from it again and counted once they reach
+    the sheet.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.local: Dict[str, Dict[float, dict]] = {}
+        self.generation = 0
+        self.saved_at = 0.0
+        self.reset([])
+
+    def reset(self, header: List[str]):
+        self.generation += 1
+        self.header = list(header)
+        self.hwm = 1
+        self.last_row: list = list(header)
+        self.by_user: Dict[str, List[dict]] = {}
+        self.by_day: Dict[str, Dict[int, List[dict]]] = {}
+        self.stats: Dict[str, TopicStats] = {}
+        # (username, category, subcategory) -> (History row, its timestamp) of the loaded saved rows
+        self.checkpoints: Dict[tuple, tuple] = {}
+        self.dirty: set = set()
+
+    def user_stats(self, user: str) -> TopicStats:
+        user = str(user)
+        stats = self.stats.get(user)
+        if stats is None:
+            stats = self.stats[user] = TopicStats(edge=lambda day: self.day_rows(user, day))
+        return stats
+
+    def topic_stats(self, user: str) -> TopicStats:
+        """`user`'s stats over the sheet rows plus the rows not read back yet."""
+        stats = self.user_stats(user).copy()
+        for rec in self.local.get(str(user), {}).values():
+            stats.add(rec)
+        return stats
+
+    def day_rows(self, user: str, day: int) -> List[dict]:
+        """One day of the user's rows, sheet and not yet read back (TopicStats.edge)."""
+        with self.lock:
+            lo, hi = _history_day_span(day)
+            local = [r for ts, r in self.local.get(user, {}).items() if lo <= ts < hi]
+            return list(self.by_day.get(user, {}).get(day, ())) + local
+
+    def add_local(self, rows: List[list]):
+        for row in rows:
+            rec = dict(zip(HISTORY_COLS, row))
+            self.local.setdefault(str(rec.get("username")), {})[float(rec["timestamp"])] = rec
+
+    def drop_local(self, rows: List[list]):
+        for row in rows:
+            rec = dict(zip(HISTORY_COLS, row))
+            self._pop_local(str(rec.get("username")), rec)
+
+    def _pop_local(self, user: str, rec: dict):
+        try:
+            self.local.get(user, {}).pop(float(rec.get("timestamp")), None)
+        except (TypeError, ValueError):
+            pass
+
+    def load_saved(self, records: List[dict]):
+        """Start from saved TopicStats rows; call after reset(), before the first ingest()."""
+        for r in records:
+            try:
+                key = (str(r["username"]), str(r["category"]), str(r["subcategory"]))
+                row = int(float(r["history_row"]))
+                self.user_stats(key[0]).load_entry(r)
+            except (KeyError, TypeError, ValueError):
+                continue
+            self.checkpoints[key] = (row, r.get("history_ts"))
+
+    def _recount(self, key: tuple):
+        user, cat, sub = key
+        stats = self.user_stats(user)
+        stats.topics.pop((cat, sub), None)
+        for rec in self.user_rows(user):
+            if str(rec.get("category", "")) == cat and str(rec.get("subcategory", "")) == sub:
+                stats.add(rec)
+        self.checkpoints.pop(key, None)
+        self.dirty.add(key)
+
+    def ingest(self, values: List[list]):
+        h = self.header
+        for n, row in enumerate(values, start=self.hwm + 1):
+            if not row or all(str(v) == "" for v in row):
+                continue
+            rec = dict(zip(h, list(row) + [""] * (len(h) - len(row))))
+            user = str(rec.get("username"))
+            self.by_user.setdefault(user, []).append(rec)
+            self._pop_local(user, rec)
+            day = TopicStats.day_of(rec)
+            if day is None:
+                continue
+            self.by_day.setdefault(user, {}).setdefault(day, []).append(rec)
+            key = (user, str(rec.get("category", "")), str(rec.get("subcategory", "")))
+            cp = self.checkpoints.get(key)
+            if cp is None or n > cp[0]:
+                self.user_stats(user).add(rec)
+                self.dirty.add(key)
+            elif n == cp[0]:
+                if _same_value(rec.get("timestamp"), cp[1]):
+                    del self.checkpoints[key]
+                else:
+                    self._recount(key)
+        if values:
+            self.hwm += len(values)
+            self.last_row = list(values[-1])
+        # checkpoints are only good for the first read: one not met holds another row now, or is gone
+        for key in list(self.checkpoints):
+            self._recount(key)
+
+    def take_dirty(self) -> Dict[tuple, list]:
+        """TopicStats sheet values of every topic changed since the last save."""
+        ts = self.last_row[self.header.index("timestamp")] if "timestamp" in self.header else ""
+        out = {}
+        for key in self.dirty:
+            stats = self.stats.get(key[0])
+            if stats is not None and key[1:] in stats.topics:
+                out[key] = ["" if v is None else v for v in stats.entry_row(key[1:])[2:]] + [self.hwm, ts]
+        self.dirty = set()
+        self.saved_at = time.time()
+        return out
+
+    def user_rows(self, user: str) -> List[dict]:
+        return self.by_user.get(str(user), [])
+
+
+@st.cache_resource
+def _history_index(store_key: str) -> HistoryIndex:
+    return HistoryIndex()
+
+
+class RowIndex:
+    """Process-wide (key columns) -> sheet row map for one key/value worksheet.
+
+    `first_col` mirrors column A (header included) as of the last build; it is
+    compared with a fresh col_values(1) every SHEET_INDEX_TTL_SEC to catch
+    rows inserted, moved or deleted outside the app. `records` is the sheet as
+    of the last read, kept in step with the rows the app writes.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.valid = False
+        self.rows: Dict[tuple, int] = {}
+        self.first_col: List[str] = []
+        self.checked_at = 0.0
+        self.records: Optional[List[dict]] = None
+
+    def build(self, records: List[dict], keys: List[str]):
+        self.records = list(records)
+        self.rows = {}
+        self.first_col = [keys[0]]
+        for i, r in enumerate(records, start=2):
+            self.rows.setdefault(tuple(str(r.get(k)) for k in keys), i)
+            self.first_col.append(str(r.get(keys[0], "")))
+        self.valid = True
+        self.checked_at = time.time()
+
+    def appended(self, keys: List[tuple], res, records: Optional[List[dict]] = None):
+        expected = len(self.first_col) + 1
+        m = re.search(r"![A-Z]+(\d+)", str(((res or {}).get("updates") or {}).get("updatedRange", "")))
+        if m and int(m.group(1)) != expected:
+            self.valid = False
+            return
+        for n, key in enumerate(keys):
+            self.rows.setdefault(key, expected + n)
+            self.first_col.append(key[0])
+        if self.records is not None and records is not None and len(self.records) == expected - 2:
+            self.records.extend(records)
+        else:
+            self.records = None
+
+    def updated(self, row: int, record: dict):
+        if self.records is not None and 0 <= row - 2 < len(self.records):
+            self.records[row - 2] = record
+
+    def deleted(self, row: int):
+        self.rows = {k: (i - 1 if i > row else i) for k, i in self.rows.items() if i != row}
+        if row - 1 < len(self.first_col):
+            del self.first_col[row - 1]
+        if self.records is not None and 0 <= row - 2 < len(self.records):
+            del self.records[row - 2]
+
+
+@st.cache_resource
+def _row_index(store_key: str, table: str) -> RowIndex:
+    return RowIndex()
+
+
+# Column layout of the key/value worksheets: (key columns, value columns)
+TABLE_SCHEMAS = {
+    WS_THEORY: (["category","subcategory"], ["content","updated_at","updated_by"]),
+    WS_CHECKLIST: (["section","item"], ["checked","updated_at","updated_by"]),
+    WS_WEIGHTS: (["category","subcategory"], ["weight","updated_at","updated_by"]),
+    # one row per user and topic; `items` is ReviewScheduler.encode_topic()
+    WS_REVIEW: (["username","category","subcategory"], ["items","updated_at","updated_by"]),
+    # HistoryIndex's saved TopicStats: entry_row() values, then the History row they count through
+    WS_TOPIC_STATS: (["username","category","subcategory"],
+                     TOPIC_STATS_COLS[2:] + ["history_row","history_ts"]),
+}
+# updated_at / updated_by always change, so they are ignored when diffing records
+AUDIT_COLS = ("updated_at", "updated_by")
+
+
+def _same_value(a, b) -> bool:
+    try:
+        return float(a) == float(b)
+    except (TypeError, ValueError):
+        return str(a) == str(b)
+
+
+def _record_unchanged(rec: Optional[dict], vals: List[str], values: list) -> bool:
+    if rec is None:
+        return False
+    return all(_same_value(rec.get(c), v) for c, v in zip(vals, values) if c not in AUDIT_COLS)
+
+
+HISTORY_COLS = ["username","timestamp","year","month","day","category","subcategory","is_correct","count"]
+
+
+class StorageBackend(ABC):
+    """Storage interface behind StatManager.
+
+    Backends raise on I/O errors; StatManager decides what to swallow.
+    `key` identifies the underlying store for process-wide caches.
+    """
+    key = ""
+
+    # Users
+    @abstractmethod
+    def password_hash(self, username: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def user_exists(self, username: str) -> bool:
+        ...
+
+    @abstractmethod
+    def add_user(self, username: str, password_hash: str):
+        ...
+
+    # History
+    @abstractmethod
+    def append_history(self, rows: List[list]):
+        ...
+
+    def flush_history(self, background: bool = False) -> bool:
+        return True
+
+    def history_pending(self) -> int:
+        return 0
+
+    def history_due(self) -> bool:
+        return False
+
+    def sync_history(self):
+        pass
+
+    @abstractmethod
+    def user_history(self, username: str) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def all_history_df(self) -> pd.DataFrame:
+        """Every user's History rows in one frame (stat_df_from_history + username)."""
+        ...
+
+    def history_version(self):
+        """Changes whenever History rows are added or removed."""
+        return None
+
+    def topic_stats(self, username: str) -> TopicStats:
+        return TopicStats.from_rows(self.user_history(username))
+
+    # Theory / Checklist / QuizWeights
+    @abstractmethod
+    def load_records(self, table: str) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def upsert_record(self, table: str, key: tuple, values: list):
+        ...
+
+    @abstractmethod
+    def delete_record(self, table: str, key: tuple) -> bool:
+        ...
+
+    def user_records(self, table: str, username: str) -> List[dict]:
+        """`username`'s rows of a table keyed by username (Review)."""
+        return [r for r in self.load_records(table) if str(r.get("username")) == str(username)]
+
+    def write_records(self, table: str, items: Dict[tuple, list]) -> Dict[tuple, str]:
+        """Write rows the caller knows have changed; backends that pay for a read skip the diff."""
+        return self.upsert_records(table, items)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Run a write (one of the methods above); backends with slow I/O queue it."""
+        fut = Future()
+        try:
+            fut.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def upsert_records(self, table: str, items: Dict[tuple, list]) -> Dict[tuple, str]:
+        """Upsert many rows; returns "added" / "updated" / "unchanged" / "failed" per key."""
+        keys, vals = TABLE_SCHEMAS[table]
+        current = {tuple(str(r.get(k)) for k in keys): r for r in self.load_records(table)}
+        out = {}
+        for key, values in items.items():
+            rec = current.get(tuple(str(v) for v in key))
+            if _record_unchanged(rec, vals, values):
+                out[key] = "unchanged"
+                continue
+            try:
+                self.upsert_record(table, key, values)
+                out[key] = "added" if rec is None else "updated"
+            except Exception:
+                out[key] = "failed"
+        return out
+
+
+def _fake_gspread_client():
+    fake = importlib.import_module("fake_gspread")
+    server = fake.SERVER
+    with server.lock:
+        if not server.template:
+            users = [u.split(":", 1) for u in FAKE_SHEETS_USERS.split(",") if ":" in u]
+            server.template = {
+                WS_USERS: [["username", "password"]] + [[u, hashlib.sha256(p.encode()).hexdigest()] for u, p in users],
+                WS_HISTORY: [list(HISTORY_COLS)],
+            }
+            server.configure(latency_ms=FAKE_SHEETS_LATENCY_MS, quota_per_min=FAKE_SHEETS_QUOTA_PER_MIN,
+                             fail_rate=FAKE_SHEETS_FAIL_RATE)
+    return fake.FakeClient(server)
+
+
+def _gspread_client(key_file: str = "service_account.json"):
+    if gspread is None:
+        return None
+    if STORAGE_BACKEND == "fake":
+        return _fake_gspread_client()
+    try:
+        if hasattr(st, "secrets") and "gcp_service_account" in st.secrets:
+            return gspread.service_account_from_dict(dict(st.secrets["gcp_service_account"]))
+    except Exception:
+        pass
+    if os.path.exists(key_file):
+        return gspread.service_account(filename=key_file)
+    return None
+
+
+def _sheets_status(e: Exception) -> Optional[int]:
+    return getattr(getattr(e, "response", None), "status_code", None)
+
+
+def _should_reconnect(e: Exception) -> bool:
+    # 401 = token rejected; OSError covers requests' connection errors; google-auth
+    # refresh/transport failures are matched by name to avoid importing it here
+    return _sheets_status(e) == 401 or isinstance(e, OSError) or type(e).__name__ in ("RefreshError", "TransportError")
+
+
+def _sheets_transient(e: Exception) -> bool:
+    return _sheets_status(e) in (429, 500, 502, 503, 504) or isinstance(e, OSError)
+
+
+class SheetsUnavailable(RuntimeError):
+    """Raised instead of calling the API while the circuit breaker is open."""
+
+
+def _store_failure(e: Exception) -> bool:
+    # the store, not the code, is at fault: breaker open, network, Sheets API or auth, SQLite
+    return (isinstance(e, (SheetsUnavailable, OSError, sqlite3.Error)) or _sheets_status(e) is not None
+            or type(e).__name__ in ("RefreshError", "TransportError", "APIError", "WorksheetNotFound", "SpreadsheetNotFound"))
+
+
+class TokenBucket:
+    """Process-wide request budget: `rate` tokens per second, at most `capacity` banked."""
+    def __init__(self, per_min: float, capacity: int):
+        self.rate = per_min / 60.0
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def available(self) -> float:
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive transient failures; after `open_sec`
+    one trial call is let through (half-open) and its outcome closes or re-opens it."""
+    def __init__(self, threshold: int, open_sec: float):
+        self.threshold = threshold
+        self.open_sec = open_sec
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        with self.lock:
+            return self.failures >= self.threshold and time.time() - self.opened_at < self.open_sec
+
+    def retry_in(self) -> float:
+        """Seconds until the next trial call is let through (0 when closed or half-open)."""
+        with self.lock:
+            if self.failures < self.threshold:
+                return 0.0
+            return max(0.0, self.open_sec - (time.time() - self.opened_at))
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.failures < self.threshold:
+                return True
+            if time.time() - self.opened_at < self.open_sec or self.trial:
+                return False
+            self.trial = True
+            return True
+
+    def record(self, ok: bool):
+        with self.lock:
+            self.trial = False
+            if ok:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.time()
+
+
+# Worksheet methods that change the sheet; they get the longer 429 backoff
+_SHEETS_WRITE_METHODS = frozenset({"append_row", "append_rows", "update", "batch_update", "delete_rows", "add_worksheet"})
+# A transport error (no HTTP status) may hide a request that landed: these are not resent after one
+_SHEETS_NOT_IDEMPOTENT = frozenset({"append_row", "append_rows", "delete_rows", "add_worksheet"})
+
+
+class SheetsUsage:
+    """Process-wide count of Sheets requests by minute, method, worksheet, user and page.
+
+    Every attempt SheetsIO makes is counted (retries too: each one spends
+    quota), and so are failures and breaker refusals. The user and page come
+    from the calling thread (set by the router on each rerun, carried over
+    to queued and background writes). Answers and page views are counted
+    alongside for the per-answer and per-view ratios.
+    """
+    FIELDS = ("method", "worksheet", "user", "page")
+
+    def __init__(self, keep_min: int = SHEETS_USAGE_KEEP_MIN):
+        self.keep_min = keep_min
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.minutes: Dict[int, Counter] = {}
+            self.totals: Counter = Counter()
+            self.errors: Counter = Counter()
+            self.views: Counter = Counter()
+            self.answers = 0
+            self.recent: deque = deque()
+            self.since = time.time()
+
+    def attribute(self, user: Optional[str], page: str):
+        """Charge this thread's next calls to (user, page)."""
+        self._local.ctx = (str(user or "-"), page)
+
+    def context(self) -> tuple:
+        return getattr(self._local, "ctx", ("-", "(background)"))
+
+    def bind(self, fn):
+        """fn for another thread, charged to the caller's (user, page)."""
+        ctx = self.context()
+
+        def run(*args, **kwargs):
+            self._local.ctx = ctx
+            return fn(*args, **kwargs)
+        return run
+
+    def view(self, user: Optional[str], page: str):
+        self.attribute(user, page)
+        with self.lock:
+            self.views[page] += 1
+
+    def answered(self):
+        with self.lock:
+            self.answers += 1
+
+    def call(self, method: str, worksheet: str):
+        key = (method, worksheet) + self.context()
+        now = time.time()
+        minute = int(now // 60)
+        with self.lock:
+            per = self.minutes.get(minute)
+            if per is None:
+                per = self.minutes[minute] = Counter()
+                for m in [m for m in self.minutes if m <= minute - self.keep_min]:
+                    del self.minutes[m]
+            per[key] += 1
+            self.totals[key] += 1
+            self.recent.append(now)
+            self._trim(now)
+
+    def failed(self, method: str, worksheet: str, status):
+        with self.lock:
+            self.errors[(method, worksheet, str(status))] += 1
+
+    def _trim(self, now: float):
+        while self.recent and self.recent[0] <= now - 60.0:
+            self.recent.popleft()
+
+    def last_minute(self) -> int:
+        """Requests in the last 60 seconds."""
+        with self.lock:
+            self._trim(time.time())
+            return len(self.recent)
+
+    def per_minute(self, n: int = SHEETS_USAGE_KEEP_MIN) -> List[tuple]:
+        """(minute start, requests) for the last n minutes, oldest first."""
+        now = int(time.time() // 60)
+        with self.lock:
+            counts = {m: sum(c.values()) for m, c in self.minutes.items()}
+        return [(datetime.datetime.fromtimestamp(m * 60), counts.get(m, 0)) for m in range(now - n + 1, now + 1)]
+
+    def breakdown(self, *fields: str) -> List[dict]:
+        """Requests since `since`, summed over the other FIELDS; busiest first."""
+        idx = [self.FIELDS.index(f) for f in fields]
+        out: Counter = Counter()
+        with self.lock:
+            for key, n in self.totals.items():
+                out[tuple(key[i] for i in idx)] += n
+        return [dict(zip(fields, k), calls=n) for k, n in out.most_common()]
+
+    def pages(self) -> List[dict]:
+        """Requests, views (reruns) and requests per view for each page."""
+        calls = {r["page"]: r["calls"] for r in self.breakdown("page")}
+        with self.lock:
+            views = dict(self.views)
+        rows = [{"page": p, "calls": calls.get(p, 0), "views": views.get(p, 0),
+                 "calls_per_view": calls.get(p, 0) / views[p] if views.get(p) else None}
+                for p in set(calls) | set(views)]
+        return sorted(rows, key=lambda r: r["calls"], reverse=True)
+
+    def failures(self) -> List[dict]:
+        """Failed requests and breaker refusals by method, worksheet and error."""
+        with self.lock:
+            return [{"method": m, "worksheet": w, "error": e, "count": n} for (m, w, e), n in self.errors.most_common()]
+
+    def summary(self) -> dict:
+        with self.lock:
+            total = sum(self.totals.values())
+            return {"since": self.since, "calls": total, "answers": self.answers,
+                    "calls_per_answer": total / self.answers if self.answers else None,
+                    "views": sum(self.views.values()), "errors": sum(self.errors.values())}
+
+
+@st.cache_resource
+def _sheets_usage() -> SheetsUsage:
+    return SheetsUsage()
+
+
+SHEETS_USAGE = _sheets_usage()
+
+
+class SheetsIO:
+    """Every Sheets request of the process goes through call(): one token from
+    the shared bucket, exponential backoff with jitter on 429/5xx, and the
+    circuit breaker. Writes are queued on a single worker thread (so they land
+    in order and never block a rerun) and handed back as Futures.
+    """
+    def __init__(self):
+        self.bucket = TokenBucket(SHEETS_QUOTA_PER_MIN, SHEETS_BURST)
+        self.breaker = CircuitBreaker(SHEETS_BREAKER_FAILURES, SHEETS_BREAKER_OPEN_SEC)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sheets-io")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.backoffs = 0
+        self.usage = _sheets_usage()
+
+    def call(self, fn, *args, tries: int = SHEETS_READ_TRIES, worksheet: str = "*",
+             method: Optional[str] = None, **kwargs):
+        method = method or getattr(fn, "__name__", "call")
+        for attempt in range(tries):
+            if not self.breaker.allow():
+                self.usage.failed(method, worksheet, "breaker open")
+                raise SheetsUnavailable("Google Sheets temporarily unavailable")
+            self.bucket.acquire()
+            self.usage.call(method, worksheet)
+            try:
+                out = fn(*args, **kwargs)
+            except Exception as e:
+                self.usage.failed(method, worksheet, _sheets_status(e) or type(e).__name__)
+                if not _sheets_transient(e):
+                    self.breaker.record(True)
+                    raise
+                self.breaker.record(False)
+                if attempt == tries - 1 or (_sheets_status(e) is None and method in _SHEETS_NOT_IDEMPOTENT):
+                    raise
+                with self.lock:
+                    self.backoffs += 1
+                delay = min(SHEETS_BACKOFF_MAX_SEC, SHEETS_BACKOFF_BASE_SEC * 2 ** attempt)
+                time.sleep(delay * (0.5 + random.random() * 0.5))
+                continue
+            self.breaker.record(True)
+            return out
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queue a write. One refused by the open breaker is run again at the next
+        trial window (up to SHEETS_QUEUE_WAIT_SEC), so it is delayed, not dropped."""
+        with self.lock:
+            self.queued += 1
+        fn = self.usage.bind(fn)
+
+        def run():
+            deadline = time.time() + SHEETS_QUEUE_WAIT_SEC
+            try:
+                while True:
+                    try:
+                        return fn(*args, **kwargs)
+                    except SheetsUnavailable:
+                        wait = self.breaker.retry_in()
+                        if time.time() + wait > deadline:
+                            raise
+                        # half-open with another trial in flight: look again shortly
+                        time.sleep(wait or SHEETS_BACKOFF_BASE_SEC)
+            finally:
+                with self.lock:
+                    self.queued -= 1
+        return self.writer.submit(run)
+
+    def pending(self) -> int:
+        with self.lock:
+            return self.queued
+
+
+class _GatedWorksheet:
+    """Worksheet handle whose API methods run through SheetsIO.call()."""
+    def __init__(self, ws, io: SheetsIO):
+        self._ws = ws
+        self._io = io
+        self._title = ws.title
+
+    def __getattr__(self, name):
+        attr = getattr(self._ws, name)
+        if not callable(attr):
+            return attr
+        tries = SHEETS_WRITE_TRIES if name in _SHEETS_WRITE_METHODS else SHEETS_READ_TRIES
+        return lambda *a, **k: self._io.call(attr, *a, tries=tries, worksheet=self._title, method=name, **k)
+
+
+class SheetsPool:
+    """One authenticated gspread client and its worksheet handles per process.
+
+    Sessions borrow these instead of authenticating and opening the spreadsheet
+    themselves. Connecting costs gc.open() plus one worksheets() read; missing
+    Theory/Checklist/QuizWeights/Review tabs are created once. All requests share
+    one SheetsIO (rate limit, backoff, circuit breaker). Access tokens are
+    refreshed by the client's authorized session; reconnect() rebuilds client
+    and handles after an auth or transport failure. `generation` lets callers
+    skip a reconnect that another thread already did.
+    """
+    def __init__(self, key_file: str, sheet_name: str):
+        self.key_file = key_file
+        self.sheet_name = sheet_name
+        self.lock = threading.RLock()
+        self.io = SheetsIO()
+        self.generation = 0
+        self.connected_at = 0.0
+        self.gc = None
+        self.sh = None
+        self.handles: Dict[str, object] = {}
+
+    def _connect(self):
+        gc = _gspread_client(self.key_file)
+        if gc is None:
+            raise RuntimeError("no Google credentials")
+        sh = self.io.call(gc.open, self.sheet_name)
+        handles = {ws.title: _GatedWorksheet(ws, self.io) for ws in self.io.call(sh.worksheets)}
+        for title in (WS_USERS, WS_HISTORY):
+            if title not in handles:
+                raise gspread.exceptions.WorksheetNotFound(title)
+        for title, (keys, vals) in TABLE_SCHEMAS.items():
+            if title not in handles:
+                ws = _GatedWorksheet(self.io.call(
+                    sh.add_worksheet, title=title, rows=2000, cols=max(10, len(keys) + len(vals) + 2),
+                    worksheet=title,
+                ), self.io)
+                ws.append_row(keys + vals)
+                handles[title] = ws
+        self.gc, self.sh, self.handles = gc, sh, handles
+        self.generation += 1
+        self.connected_at = time.time()
+
+    def ensure(self):
+        if self.sh is None:
+            with self.lock:
+                if self.sh is None:
+                    self._connect()
+
+    def worksheet(self, title: str):
+        ws = self.handles.get(title)
+        if ws is None:
+            self.ensure()
+            ws = self.handles[title]
+        return ws
+
+    def reconnect(self, seen_generation: Optional[int] = None):
+        with self.lock:
+            if seen_generation is not None and seen_generation != self.generation:
+                return
+            if seen_generation is None and time.time() - self.connected_at < SHEETS_RECONNECT_MIN_SEC:
+                return
+            self.sh = None
+            self.handles = {}
+            self._connect()
+
+    def failed(self, e: Exception, seen_generation: Optional[int] = None):
+        if _should_reconnect(e):
+            try:
+                self.reconnect(seen_generation)
+            except Exception:
+                pass
+
+
+@st.cache_resource
+def _sheets_pool(key_file: str, sheet_name: str) -> SheetsPool:
+    return SheetsPool(key_file, sheet_name)
+
+
+def _reconnecting(retry: bool):
+    """SheetsBackend method wrapper: on an auth/transport failure, reconnect the
+    pool, then retry once (reads) or re-raise (writes, which may have landed)."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            gen = self.pool.generation
+            try:
+                return fn(self, *args, **kwargs)
+            except Exception as e:
+                if not _should_reconnect(e):
+                    raise
+                self.pool.failed(e, gen)
+                if not retry:
+                    raise
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return deco
+
+
+class SheetsBackend(StorageBackend):
+    """Per-session view of the shared SheetsPool: only the History write buffer is session-local."""
+    def __init__(self, pool: SheetsPool):
+        self.pool = pool
+        self.key = f"sheets:{pool.sheet_name}"
+        pool.ensure()
+        self.history_writer = HistoryWriter(
+            lambda: self.pool.worksheet(WS_HISTORY), on_error=self.pool.failed, on_unsent=self._history_unsent,
+            flusher=_history_flusher(),
+        )
+
+    @property
+    def ws_users(self):
+        return self.pool.worksheet(WS_USERS)
+
+    @property
+    def ws_history(self):
+        return self.pool.worksheet(WS_HISTORY)
+
+    @property
+    def ws(self) -> Dict[str, object]:
+        self.pool.ensure()
+        return self.pool.handles
+
+    # Users
+    @_reconnecting(retry=True)
+    def password_hash(self, username: str) -> Optional[str]:
+        cell = self.ws_users.find(username)
+        if not cell:
+            return None
+        return self.ws_users.cell(cell.row, 2).value
+
+    @_reconnecting(retry=True)
+    def user_exists(self, username: str) -> bool:
+        return username in self.ws_users.col_values(1)
+
+    @_reconnecting(retry=False)
+    def add_user(self, username: str, password_hash: str):
+        self.ws_users.append_row([username, password_hash])
+
+    # History
+    def append_history(self, rows: List[list]):
+        for row in rows:
+            self.history_writer.add(row)
+        idx = _history_index(self.key)
+        with idx.lock:
+            idx.add_local(rows)
+
+    def _history_unsent(self, rows: List[list]):
+        idx = _history_index(self.key)
+        with idx.lock:
+            idx.drop_local(rows)
+
+    def flush_history(self, background: bool = False) -> bool:
+        return self.history_writer.flush(background=background)
+
+    def history_pending(self) -> int:
+        return self.history_writer.pending()
+
+    def history_due(self) -> bool:
+        return self.history_writer.is_due()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        return self.pool.io.submit(fn, *args, **kwargs)
+
+    @_reconnecting(retry=True)
+    def sync_history(self):
+        """Read the rows appended since the last sync. The sheet is read without the
+        index lock; the result is only ingested if no other session moved the index meanwhile."""
+        idx = _history_index(self.key)
+        if idx.header and self.pool.io.breaker.is_open():
+            return
+        if not idx.header:
+            header, saved = self.ws_history.row_values(1), self._saved_topic_stats()
+            with idx.lock:
+                if not idx.header:
+                    idx.reset(header)
+                    idx.load_saved(saved)
+        for _ in range(HISTORY_SYNC_TRIES):
+            with idx.lock:
+                seen, hwm, last_row, width = (idx.generation, idx.hwm), idx.hwm, list(idx.last_row), len(idx.header)
+            last_col = gspread.utils.rowcol_to_a1(1, max(1, width)).rstrip("0123456789")
+            values = [list(r) for r in self.ws_history.get(f"A{hwm}:{last_col}", value_render_option="UNFORMATTED_VALUE")]
+            rebuild = not values or values[0] != last_row
+            if rebuild:
+                values = [self.ws_history.row_values(1)] + [
+                    list(r) for r in self.ws_history.get(f"A2:{last_col}", value_render_option="UNFORMATTED_VALUE")]
+            with idx.lock:
+                if (idx.generation, idx.hwm) != seen:
+                    continue  # another session synced meanwhile: read on from its hwm
+                if rebuild:
+                    idx.reset(values[0])
+                idx.ingest(values[1:])
+                break
+        self.save_topic_stats()
+
+    def _saved_topic_stats(self) -> List[dict]:
+        try:
+            return self.load_records(WS_TOPIC_STATS)
+        except (SheetsUnavailable, gspread.exceptions.APIError, OSError):
+            return []  # counted from History instead
+
+    def save_topic_stats(self, force: bool = False) -> Optional[Future]:
+        """Queue a write of the topics changed since the last save (at most every TOPIC_STATS_SAVE_SEC)."""
+        idx = _history_index(self.key)
+        with idx.lock:
+            if not idx.dirty or (not force and time.time() - idx.saved_at < TOPIC_STATS_SAVE_SEC):
+                return None
+            items = idx.take_dirty()
+
+        def write():
+            try:
+                res = self._write_rows(WS_TOPIC_STATS, items)
+            except Exception:
+                with idx.lock:
+                    idx.dirty.update(items)
+                raise
+            failed = [key for key, r in res.items() if r == "failed"]
+            if failed:
+                with idx.lock:
+                    idx.dirty.update(failed)
+            return res
+        return self.submit(write)
+
+    def user_history(self, username: str) -> List[dict]:
+        idx = _history_index(self.key)
+        with idx.lock:
+            return list(idx.user_rows(username))
+
+    def all_history_df(self) -> pd.DataFrame:
+        idx = _history_index(self.key)
+        with idx.lock:
+            rows = [r for recs in idx.by_user.values() for r in recs]
+        return stat_df_from_history(rows, with_user=True)
+
+    def history_version(self):
+        idx = _history_index(self.key)
+        with idx.lock:
+            return (idx.generation, idx.hwm)
+
+    def topic_stats(self, username: str) -> TopicStats:
+        idx = _history_index(self.key)
+        with idx.lock:
+            return idx.topic_stats(username)
+
+    # Theory / Checklist / QuizWeights
+    # The RowIndex lock is only held to read or update the index, never across a
+    # Sheets call (those may sleep in backoff). Row numbers resolved under it stay
+    # valid for the call that follows because writes run one at a time on the
+    # SheetsIO writer; appended() re-checks the row the sheet reports.
+    def _row_index(self, table: str) -> RowIndex:
+        idx = _row_index(self.key, table)
+        keys, _ = TABLE_SCHEMAS[table]
+        with idx.lock:
+            valid, checked_at = idx.valid, idx.checked_at
+        if valid and time.time() - checked_at >= SHEET_INDEX_TTL_SEC:
+            col = [str(v) for v in self.ws[table].col_values(1)]
+            with idx.lock:
+                valid = col == idx.first_col
+                if valid:
+                    idx.checked_at = time.time()
+        if not valid:
+            rows = self.ws[table].get_all_records()
+            with idx.lock:
+                idx.build(rows, keys)
+        return idx
+
+    @_reconnecting(retry=True)
+    def load_records(self, table: str) -> List[dict]:
+        idx = _row_index(self.key, table)
+        try:
+            rows = self.ws[table].get_all_records()
+        except SheetsUnavailable:
+            if idx.records is None:
+                raise
+            return idx.records
+        with idx.lock:
+            idx.build(rows, TABLE_SCHEMAS[table][0])
+        return rows
+
+    @_reconnecting(retry=True)
+    def user_records(self, table: str, username: str) -> List[dict]:
+        # from the row index's copy of the sheet: a login reads nothing once another session has
+        idx = self._row_index(table)
+        with idx.lock:
+            records = idx.records
+        if records is None:
+            records = self.load_records(table)
+        return [dict(r) for r in records if str(r.get("username")) == str(username)]
+
+    @_reconnecting(retry=False)
+    def upsert_record(self, table: str, key: tuple, values: list):
+        ws = self.ws[table]
+        keys, vals = TABLE_SCHEMAS[table]
+        k = tuple(str(v) for v in key)
+        idx = self._row_index(table)
+        with idx.lock:
+            i = idx.rows.get(k)
+        rec = dict(zip(keys + vals, list(key) + list(values)))
+        if i is not None:
+            a = gspread.utils.rowcol_to_a1(i, len(keys) + 1)
+            b = gspread.utils.rowcol_to_a1(i, len(keys) + len(vals))
+            ws.update(f"{a}:{b}", [list(values)])
+            with idx.lock:
+                idx.updated(i, rec)
+            return
+        res = ws.append_row(list(key) + list(values))
+        with idx.lock:
+            idx.appended([k], res, [rec])
+
+    @_reconnecting(retry=False)
+    def delete_record(self, table: str, key: tuple) -> bool:
+        k = tuple(str(v) for v in key)
+        idx = self._row_index(table)
+        with idx.lock:
+            i = idx.rows.get(k)
+        if i is None:
+            return False
+        self.ws[table].delete_rows(i)
+        with idx.lock:
+            idx.deleted(i)
+        return True
+
+    @_reconnecting(retry=False)
+    def upsert_records(self, table: str, items: Dict[tuple, list]) -> Dict[tuple, str]:
+        # one read to diff, then at most one batch_update and one append_rows
+        ws = self.ws[table]
+        keys, vals = TABLE_SCHEMAS[table]
+        idx = _row_index(self.key, table)
+        out, changed = {}, {}
+        rows = ws.get_all_records()
+        with idx.lock:
+            idx.build(rows, keys)
+            for key, values in items.items():
+                i = idx.rows.get(tuple(str(v) for v in key))
+                if i is not None and _record_unchanged(rows[i - 2], vals, values):
+                    out[key] = "unchanged"
+                else:
+                    changed[key] = values
+        out.update(self._write_rows(table, changed))
+        return out
+
+    @_reconnecting(retry=False)
+    def write_records(self, table: str, items: Dict[tuple, list]) -> Dict[tuple, str]:
+        return self._write_rows(table, items)
+
+    def _write_rows(self, table: str, items: Dict[tuple, list]) -> Dict[tuple, str]:
+        """Write value columns by key through the row index: one batch_update, one append_rows."""
+        ws = self.ws[table]
+        keys, vals = TABLE_SCHEMAS[table]
+        idx = self._row_index(table)
+        out = {}
+        with idx.lock:
+            rows = {key: idx.rows.get(tuple(str(v) for v in key)) for key in items}
+        updates = [(key, i, items[key]) for key, i in rows.items() if i is not None]
+        appends = [(key, tuple(str(v) for v in key), items[key]) for key, i in rows.items() if i is None]
+
+        if updates:
+            data = [{
+                "range": f"{gspread.utils.rowcol_to_a1(i, len(keys) + 1)}:{gspread.utils.rowcol_to_a1(i, len(keys) + len(vals))}",
+                "values": [list(values)],
+            } for _, i, values in updates]
+            try:
+                ws.batch_update(data)
+                with idx.lock:
+                    for key, i, values in updates:
+                        idx.updated(i, dict(zip(keys + vals, list(key) + list(values))))
+                out.update({key: "updated" for key, _, _ in updates})
+            except SheetsUnavailable:
+                raise  # nothing was sent; a queued write is run again when the breaker allows
+            except Exception:
+                out.update({key: "failed" for key, _, _ in updates})
+
+        if appends:
+            try:
+                res = ws.append_rows([list(key) + list(values) for key, _, values in appends])
+                with idx.lock:
+                    idx.appended([k for _, k, _ in appends], res,
+                                 [dict(zip(keys + vals, list(key) + list(values))) for key, _, values in appends])
+                out.update({key: "added" for key, _, _ in appends})
+            except SheetsUnavailable:
+                raise
+            except Exception:
+                with idx.lock:
+                    idx.valid = False
+                out.update({key: "failed" for key, _, _ in appends})
+        return out
+
+
+SQLITE_TABLES = {WS_THEORY: "theory", WS_CHECKLIST: "checklist", WS_WEIGHTS: "weights", WS_REVIEW: "review"}
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    year INTEGER, month INTEGER, day INTEGER,
+    category TEXT, subcategory TEXT,
+    is_correct INTEGER NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS ix_history_user_ts ON history (username, timestamp);
+CREATE TABLE IF NOT EXISTS theory (
+    category TEXT NOT NULL, subcategory TEXT NOT NULL,
+    content TEXT, updated_at TEXT, updated_by TEXT,
+    PRIMARY KEY (category, subcategory)
+);
+CREATE TABLE IF NOT EXISTS checklist (
+    section TEXT NOT NULL, item TEXT NOT NULL,
+    checked INTEGER NOT NULL DEFAULT 0, updated_at TEXT, updated_by TEXT,
+    PRIMARY KEY (section, item)
+);
+CREATE TABLE IF NOT EXISTS weights (
+    category TEXT NOT NULL, subcategory TEXT NOT NULL,
+    weight REAL NOT NULL DEFAULT 1.0, updated_at TEXT, updated_by TEXT,
+    PRIMARY KEY (category, subcategory)
+);
+CREATE TABLE IF NOT EXISTS review (
+    username TEXT NOT NULL,
+    category TEXT NOT NULL, subcategory TEXT NOT NULL,
+    items TEXT, updated_at TEXT, updated_by TEXT,
+    PRIMARY KEY (username, category, subcategory)
+);
+CREATE TABLE IF NOT EXISTS topic_stats (
+    username TEXT NOT NULL,
+    category TEXT NOT NULL, subcategory TEXT NOT NULL,
+    solved INTEGER NOT NULL DEFAULT 0, correct INTEGER NOT NULL DEFAULT 0,
+    last_hit REAL, wrong_ts TEXT, last_ts REAL, days TEXT,
+    PRIMARY KEY (username, category, subcategory)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SQLiteBackend(StorageBackend):
+    """Local SQLite store with the same tables as the Google Sheet.
+
+    History is indexed on (username, timestamp) and the key/value tables are
+    keyed on (category, subcategory) / (section, item), so nothing is scanned.
+    """
+    def __init__(self, path: str = "berklee.db"):
+        self.key = f"sqlite:{path}"
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            # topic_stats is derived from history: an older layout is dropped and rebuilt on first read
+            cols = [r["name"] for r in self.conn.execute("PRAGMA table_info(topic_stats)")]
+            if cols and cols[1:] != TOPIC_STATS_COLS:
+                self.conn.execute("DROP TABLE topic_stats")
+                self.conn.execute("DELETE FROM meta WHERE key LIKE 'topic_stats:%'")
+            self.conn.executescript(SQLITE_SCHEMA)
+
+    def _query(self, sql: str, args: tuple = ()) -> List[dict]:
+        with self.lock:
+            return [dict(r) for r in self.conn.execute(sql, args).fetchall()]
+
+    # Users
+    def password_hash(self, username: str) -> Optional[str]:
+        rows = self._query("SELECT password FROM users WHERE username = ?", (username,))
+        return rows[0]["password"] if rows else None
+
+    def user_exists(self, username: str) -> bool:
+        return bool(self._query("SELECT 1 FROM users WHERE username = ?", (username,)))
+
+    def add_user(self, username: str, password_hash: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO users (username, password) VALUES (?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET password = excluded.password",
+                (username, password_hash),
+            )
+
+    # History
+    def append_history(self, rows: List[list]):
+        cols = ", ".join(HISTORY_COLS)
+        marks = ", ".join("?" * len(HISTORY_COLS))
+        with self.lock, self.conn:
+            self.conn.executemany(f"INSERT INTO history ({cols}) VALUES ({marks})", [tuple(r) for r in rows])
+            self._bump_topic_stats(rows)
+
+    def user_history(self, username: str) -> List[dict]:
+        cols = ", ".join(HISTORY_COLS)
+        return self._query(f"SELECT {cols} FROM history WHERE username = ? ORDER BY timestamp", (str(username),))
+
+    def all_history_df(self) -> pd.DataFrame:
+        return stat_df_from_history(self._query("SELECT username, timestamp, category, subcategory, is_correct FROM history"), with_user=True)
+
+    def history_version(self):
+        r = self._query("SELECT COUNT(*) AS n, MAX(id) AS last_id FROM history")[0]
+        return (r["n"], r["last_id"])
+
+    # topic_stats rows exist once a user's stats were built; until then they are
+    # built from history on first read, so appends before that are not counted twice
+    def _stats_built(self, username: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM meta WHERE key = ?", (f"topic_stats:{username}",)).fetchone() is not None
+
+    def _write_topic_stats(self, username: str, stats: TopicStats, keys):
+        marks = ", ".join("?" * (len(TOPIC_STATS_COLS) + 1))
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO topic_stats (username, {', '.join(TOPIC_STATS_COLS)}) VALUES ({marks})",
+            [(username,) + stats.entry_row(k) for k in keys],
+        )
+
+    def _bump_topic_stats(self, rows: List[list]):
+        for row in rows:
+            rec = dict(zip(HISTORY_COLS, row))
+            user = str(rec["username"])
+            if not self._stats_built(user):
+                continue
+            key = (str(rec["category"]), str(rec["subcategory"]))
+            stats = TopicStats()
+            cur = self.conn.execute(
+                f"SELECT {', '.join(TOPIC_STATS_COLS)} FROM topic_stats WHERE username = ? AND category = ? AND subcategory = ?",
+                (user,) + key,
+            )
+            for r in cur.fetchall():
+                stats.load_entry(dict(r))
+            stats.add(rec)
+            if key in stats.topics:
+                self._write_topic_stats(user, stats, [key])
+
+    def topic_stats(self, username: str) -> TopicStats:
+        username = str(username)
+        with self.lock:
+            if self._stats_built(username):
+                stats = TopicStats()
+                for r in self._query(f"SELECT {', '.join(TOPIC_STATS_COLS)} FROM topic_stats WHERE username = ?", (username,)):
+                    stats.load_entry(r)
+            else:
+                stats = self._build_topic_stats(username)
+        stats.edge = lambda day: self._day_history(username, day)
+        return stats
+
+    def _day_history(self, username: str, day: int) -> List[dict]:
+        cols = ", ".join(HISTORY_COLS)
+        return self._query(
+            f"SELECT {cols} FROM history WHERE username = ? AND timestamp >= ? AND timestamp < ?",
+            (username,) + _history_day_span(day),
+        )
+
+    def _build_topic_stats(self, username: str) -> TopicStats:
+        username = str(username)
+        with self.lock, self.conn:
+            stats = TopicStats.from_rows(self.user_history(username))
+            self.conn.execute("DELETE FROM topic_stats WHERE username = ?", (username,))
+            self._write_topic_stats(username, stats, list(stats.topics))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"topic_stats:{username}", now_iso()))
+        return stats
+
+    # Theory / Checklist / QuizWeights
+    def load_records(self, table: str) -> List[dict]:
+        keys, vals = TABLE_SCHEMAS[table]
+        return self._query(f"SELECT {', '.join(keys + vals)} FROM {SQLITE_TABLES[table]} ORDER BY rowid")
+
+    def user_records(self, table: str, username: str) -> List[dict]:
+        keys, vals = TABLE_SCHEMAS[table]
+        return self._query(f"SELECT {', '.join(keys + vals)} FROM {SQLITE_TABLES[table]} WHERE username = ? ORDER BY rowid",
+                           (str(username),))
+
+    def upsert_record(self, table: str, key: tuple, values: list):
+        keys, vals = TABLE_SCHEMAS[table]
+        cols = keys + vals
+        sets = ", ".join(f"{c} = excluded.{c}" for c in vals)
+        sql = (
+            f"INSERT INTO {SQLITE_TABLES[table]} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+            f"ON CONFLICT({', '.join(keys)}) DO UPDATE SET {sets}"
+        )
+        with self.lock, self.conn:
+            self.conn.execute(sql, tuple(key) + tuple(values))
+
+    def delete_record(self, table: str, key: tuple) -> bool:
+        keys, _ = TABLE_SCHEMAS[table]
+        where = " AND ".join(f"{k} = ?" for k in keys)
+        with self.lock, self.conn:
+            cur = self.conn.execute(f"DELETE FROM {SQLITE_TABLES[table]} WHERE {where}", tuple(key))
+        return cur.rowcount > 0
+
+    # Mirror
+    def mirror_to(self, sheets: "SheetsBackend") -> Dict[str, int]:
+        """Copy local changes to Google Sheets.
+
+        History rows are appended once each (tracked by the last mirrored id in
+        `meta`); users are added if missing; Theory/Checklist/QuizWeights/Review rows
+        are upserted with one upsert_records per table.
+        """
+        out = {"history": 0, "users": 0, "records": 0, "failed": 0}
+        last = self._query("SELECT value FROM meta WHERE key = 'mirror_history_id'")
+        last_id = int(last[0]["value"]) if last else 0
+        rows = self._query(f"SELECT id, {', '.join(HISTORY_COLS)} FROM history WHERE id > ? ORDER BY id", (last_id,))
+        if rows:
+            sheets.ws_history.append_rows([[r[c] for c in HISTORY_COLS] for r in rows])
+            with self.lock, self.conn:
+                self.conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('mirror_history_id', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (str(rows[-1]["id"]),),
+                )
+            out["history"] = len(rows)
+
+        known = set(sheets.ws_users.col_values(1))
+        for u in self._query("SELECT username, password FROM users ORDER BY rowid"):
+            if u["username"] not in known:
+                sheets.add_user(u["username"], u["password"])
+                out["users"] += 1
+
+        for table in SQLITE_TABLES:
+            keys, vals = TABLE_SCHEMAS[table]
+            items = {tuple(r[k] for k in keys): [r[v] for v in vals] for r in self.load_records(table)}
+            if items:
+                res = sheets.upsert_records(table, items)
+                out["records"] += sum(1 for r in res.values() if r in ("added", "updated"))
+                out["failed"] += sum(1 for r in res.values() if r == "failed")
+        return out
+
+
+@st.cache_resource
+def _sqlite_backend(path: str) -> SQLiteBackend:
+    """One connection per process (the schema script runs once, not per session)."""
+    return SQLiteBackend(path)
+
+
+def make_storage(key_file: str = "service_account.json", sheet_name: str = "Berklee_DB") -> Optional[StorageBackend]:
+    if STORAGE_BACKEND == "sqlite":
+        return _sqlite_backend(SQLITE_PATH)
+    if gspread is None:
+        return None
+    return SheetsBackend(_sheets_pool(key_file, sheet_name))
+
+
+@traced_methods
+class StatManager:
+    def __init__(self, key_file="service_account.json", sheet_name="Berklee_DB", store: Optional[StorageBackend] = None):
+        self.current_user = None
+        self.key_file = key_file
+        self.sheet_name = sheet_name
+        self.synced_at = 0.0
+        self.data = []
+        self.review: Optional[ReviewScheduler] = None
+        # (table, future, settle) of writes still queued when their rerun ended
+        self.writes: List[tuple] = []
+        # the last store outage a call ran into, until the page has shown it
+        self.degraded: Optional[str] = None
+
+        # the store is opened on first use, so the login page paints before gspread loads;
+        # a failed open is retried SHEETS_BREAKER_OPEN_SEC later
+        self._store = store
+        self._store_failed_at: Optional[float] = None
+
+    @property
+    def store(self) -> Optional[StorageBackend]:
+        if self._store is None and (self._store_failed_at is None
+                                    or time.time() - self._store_failed_at >= SHEETS_BREAKER_OPEN_SEC):
+            try:
+                self._store = make_storage(self.key_file, self.sheet_name)
+            except Exception:
+                self._store = None
+            self._store_failed_at = time.time() if self._store is None else None
+        return self._store
+
+    @property
+    def connected(self) -> bool:
+        return self.store is not None
+
+    @contextmanager
+    def _store_call(self):
+        """Turn a store outage into `degraded` (the caller then falls back); other errors are bugs and propagate."""
+        try:
+            yield
+        except Exception as e:
+            if not _store_failure(e):
+                raise
+            self.degraded = f"{type(e).__name__}: {e}"
+
+    def login_user(self, username: str, password: str) -> bool:
+        if not self.connected:
+            return False
+        with self._store_call():
+            stored = self.store.password_hash(username)
+            if stored and stored == hashlib.sha256(password.encode()).hexdigest():
+                self.current_user = username
+                SHEETS_USAGE.attribute(username, "Login")
+                self.load_user_data()
+                return True
+        return False
+
+    def auto_login(self, username: str) -> bool:
+        if not self.connected:
+            return False
+        with self._store_call():
+            if self.store.user_exists(username):
+                self.current_user = username
+                SHEETS_USAGE.attribute(username, "Login")
+                self.load_user_data()
+                return True
+        return False
+
+    def logout(self):
+        self.flush_history()
+        self.flush_review()
+        self.current_user = None
+        self.data = []
+        self.review = None
+
+    def load_user_data(self):
+        if not self.connected:
+            self.data = []
+            return
+        try:
+            self.store.sync_history()
+            self.data = self.store.user_history(self.current_user)
+            self.synced_at = time.time()
+        except Exception:
+            self.data = []
+
+    def sync_user_data(self, max_age: float = HISTORY_SYNC_SEC):
+        if not self.connected or not self.current_user:
+            return
+        if self.store.history_pending():
+            self.flush_history()
+        elif time.time() - self.synced_at < max_age:
+            return
+        self.load_user_data()
+
+    def cohort_features(self, days: int) -> pd.DataFrame:
+        """Per-user x per-topic features for every student from one History read."""
+        if not self.connected:
+            return pd.DataFrame(columns=COHORT_KEYS + TOPIC_FEATURE_COLS[2:])
+        try:
+            self.store.sync_history()
+            return _cohort_features(self.store.key, self.store.history_version(), int(days), self.store)
+        except Exception:
+            return pd.DataFrame(columns=COHORT_KEYS + TOPIC_FEATURE_COLS[2:])
+
+    def topic_stats(self) -> TopicStats:
+        if not self.connected or not self.current_user:
+            return TopicStats()
+        try:
+            return self.store.topic_stats(self.current_user)
+        except Exception:
+            return TopicStats.from_rows(self.data)
+
+    def record(self, category: str, subcategory: str, is_correct: bool, is_retry: bool):
+        """Buffer one answer; the store's TopicStats are updated at the same time."""
+        if not self.connected or not self.current_user or is_retry:
+            return
+        SHEETS_USAGE.answered()
+        now = datetime.datetime.now()
+        row = [
+            self.current_user,
+            float(now.timestamp()),
+            now.year, now.month, now.day,
+            category, subcategory,
+            1 if is_correct else 0,
+            1
+        ]
+        with self._store_call():
+            self.store.append_history([row])
+
+    def flush_history(self, background: bool = False) -> bool:
+        if not self.connected:
+            return False
+        try:
+            ok = self.store.flush_history(background=background)
+        except Exception:
+            return False
+        # flushed rows reach the index on the next sync, not after max_age
+        self.synced_at = 0.0
+        return ok
+
+    def flush_history_if_due(self):
+        if self.connected and self.store.history_due():
+            self.flush_history(background=True)
+
+    def _write(self, fn, table: str, *args, queued=True, done=None, settle=None):
+        """Submit a store write to `table` without waiting for it.
+
+        A write that already finished (SQLite, an idle Sheets writer) returns its
+        result and store errors propagate; otherwise `queued` is returned and
+        finished_writes() reports the outcome on a later rerun. `done(fut)` runs
+        on the writer thread as soon as the write finishes; `settle(result)`
+        runs on the script thread, with the result or the exception.
+        """
+        fut = self.store.submit(fn, table, *args)
+        if done is not None:
+            fut.add_done_callback(done)
+        if not fut.done():
+            self.writes.append((table, fut, settle))
+            return queued
+        if settle is not None:
+            settle(fut.exception() or fut.result())
+        return fut.result()
+
+    def finished_writes(self) -> List[tuple]:
+        """(table, result or exception) of the queued writes that finished since the last call."""
+        out, pending = [], []
+        for table, fut, settle in self.writes:
+            if not fut.done():
+                pending.append((table, fut, settle))
+                continue
+            res = fut.exception() or fut.result()
+            if settle is not None:
+                settle(res)
+            out.append((table, res))
+        self.writes = pending
+        return out
+
+    # Theory
+    def load_theory_df(self) -> pd.DataFrame:
+        cols = ["category","subcategory","content","updated_at","updated_by"]
+        if not self.connected:
+            return pd.DataFrame(columns=cols)
+        with self._store_call():
+            df = pd.DataFrame(self.store.load_records(WS_THEORY))
+            for c in cols:
+                if c not in df.columns:
+                    df[c] = ""
+            return df[cols]
+        return pd.DataFrame(columns=cols)
+
+    def upsert_theory(self, cat: str, sub: str, content: str, by: str) -> bool:
+        if not self.connected:
+            return False
+        try:
+            self._write(self.store.upsert_record, WS_THEORY, (cat, sub), [content, now_iso(), by])
+            return True
+        except Exception:
+            return False
+
+    # Checklist
+    def load_checklist_df(self) -> pd.DataFrame:
+        cols = ["section","item","checked","updated_at","updated_by"]
+        if not self.connected:
+            return pd.DataFrame(columns=cols)
+        with self._store_call():
+            df = pd.DataFrame(self.store.load_records(WS_CHECKLIST))
+            for c in cols:
+                if c not in df.columns:
+                    df[c] = ""
+            df["checked"] = pd.to_numeric(df["checked"], errors="coerce").fillna(0).astype(int)
+            return df[cols]
+        return pd.DataFrame(columns=cols)
+
+    def set_checklist_item(self, section: str, item: str, checked: int, by: str) -> bool:
+        if not self.connected:
+            return False
+        try:
+            self._write(self.store.upsert_record, WS_CHECKLIST, (section, item), [int(checked), now_iso(), by])
+            return True
+        except Exception:
+            return False
+
+    def delete_checklist_item(self, section: str, item: str) -> bool:
+        if not self.connected:
+            return False
+        try:
+            return self._write(self.store.delete_record, WS_CHECKLIST, (section, item))
+        except Exception:
+            return False
+
+    # Weights
+    def _weights_cache(self) -> WeightsCache:
+        return _weights_cache(self.store.key if self.store is not None else "")
+
+    def _weights_records(self) -> List[dict]:
+        return self._weights_cache().refresh(lambda: self.store.load_records(WS_WEIGHTS))
+
+    def weights_map(self) -> Dict[tuple, float]:
+        if not self.connected:
+            return _weights_from_records([])
+        cache = self._weights_cache()
+        try:
+            self._weights_records()
+            with cache.lock:
+                return cache.weights_map()
+        except Exception:
+            return _weights_from_records([])
+
+    def weights_sampler(self) -> AliasSampler:
+        cache = self._weights_cache()
+        if self.connected:
+            try:
+                self._weights_records()
+            except Exception:
+                pass
+        with cache.lock:
+            return cache.sampler()
+
+    def weights_version(self) -> int:
+        return self._weights_cache().version
+
+    def load_weights_df(self) -> pd.DataFrame:
+        cols = ["category","subcategory","weight","updated_at","updated_by"]
+        if not self.connected:
+            return pd.DataFrame(columns=cols)
+        with self._store_call():
+            df = pd.DataFrame(self._weights_records())
+            for c in cols:
+                if c not in df.columns:
+                    df[c] = ""
+            df["weight"] = pd.to_numeric(df["weight"], errors="coerce").fillna(1.0)
+            return df[cols]
+        return pd.DataFrame(columns=cols)
+
+    def upsert_weight(self, cat: str, sub: str, weight: float, by: str) -> bool:
+        if not self.connected:
+            return False
+        try:
+            cache = self._weights_cache()
+            self._write(self.store.upsert_record, WS_WEIGHTS, (cat, sub), [float(weight), now_iso(), by],
+                        done=lambda _f: cache.invalidate())
+            return True
+        except Exception:
+            return False
+        finally:
+            self._weights_cache().invalidate()
+
+    def upsert_weights(self, weights: Dict[tuple, float], by: str) -> Dict[tuple, str]:
+        if not self.connected:
+            return {k: "failed" for k in weights}
+        ts = now_iso()
+        try:
+            items = {(c, s): [float(w), ts, by] for (c, s), w in weights.items()}
+            cache = self._weights_cache()
+            return self._write(self.store.upsert_records, WS_WEIGHTS, items, queued={k: "queued" for k in items},
+                               done=lambda _f: cache.invalidate())
+        except Exception:
+            return {k: "failed" for k in weights}
+        finally:
+            self._weights_cache().invalidate()
+
+    # Spaced review
+    def review_scheduler(self) -> ReviewScheduler:
+        """This user's review items; the Review rows are read once per login (retried if that failed)."""
+        sched = self.review
+        if sched is None or sched.user != self.current_user:
+            sched = self.review = ReviewScheduler(self.current_user)
+        if not sched.loaded and self.connected and self.current_user:
+            try:
+                user = str(self.current_user)
+                sched.load(self.store.user_records(WS_REVIEW, user))
+            except Exception:
+                pass
+        return sched
+
+    def review_answer(self, q: Question, quality: int):
+        """Schedule the next review of q's item (questions not built from a GEN_SPACES entry are skipped)."""
+        if not self.current_user or q.item < 0:
+            return
+        try:
+            self.review_scheduler().answer((q.category, q.subcategory, q.item), quality)
+        except Exception:
+            pass
+
+    def review_quiz(self, limit: int, seed: int) -> List[Question]:
+        return self.review_scheduler().quiz(int(limit), self.weights_sampler(), random.Random(seed))
+
+    def flush_review(self) -> bool:
+        """Save the changed topics' Review rows (one write_records, no read) without waiting for a queued write.
+
+        Topics whose rows fail are marked dirty again once the result is in.
+        """
+        sched = self.review
+        if sched is None or not sched.dirty:
+            return True
+        if not self.connected or not self.review_scheduler().loaded:
+            # saving before the stored rows were merged in would overwrite them
+            return False
+        user = str(sched.user)
+        rows = sched.take_dirty()
+        ts = now_iso()
+        items = {(user,) + t: [enc, ts, user] for t, enc in rows.items()}
+
+        def settle(res):
+            if isinstance(res, Exception):
+                sched.dirty |= set(rows)
+            else:
+                sched.dirty |= {k[1:] for k, r in res.items() if r == "failed"}
+
+        try:
+            res = self._write(self.store.write_records, WS_REVIEW, items, queued={}, settle=settle)
+        except Exception:
+            return False
+        return all(r != "failed" for r in res.values())
+
+    # Mirror (SQLite -> Google Sheets)
+    def mirror_to_sheets(self) -> Optional[Dict[str, int]]:
+        if not hasattr(self.store, "mirror_to"):
+            return None
+        try:
+            if gspread is None:
+                return None
+            return self.store.mirror_to(SheetsBackend(_sheets_pool(self.key_file, self.sheet_name)))
+        except Exception:
+            return None
+
+
+def stat_df_from_history(rows: List[dict], with_user: bool = False) -> pd.DataFrame:
+    cols = (["username"] if with_user else []) + ["ts","category","subcategory","is_correct"]
+    if not rows:
+        return pd.DataFrame(columns=cols)
+    df = pd.DataFrame(rows)
+    if "timestamp" in df.columns:
+        df["ts"] = pd.to_datetime(df["timestamp"], unit="s", errors="coerce")
+    else:
+        df["ts"] = pd.to_datetime(
+            df[["year","month","day"]].astype(str).agg("-".join, axis=1),
+            errors="coerce"
+        )
+    df["is_correct"] = pd.to_numeric(df.get("is_correct", 0), errors="coerce").fillna(0).astype(int)
+    df["category"] = df.get("category", "").astype(str)
+    df["subcategory"] = df.get("subcategory", "").astype(str)
+    if with_user:
+        df["username"] = df.get("username", "").astype(str)
+    return df[cols].dropna(subset=["ts"])
+# ==============================
+# PART B6A — SESSION + LOGIN + QUIZ ENGINE + SIDEBAR
+# ==============================
+
+def init_session_state():
+    if "stat_mgr" not in st.session_state:
+        st.session_state.stat_mgr = StatManager()
+    if "logged_in_user" not in st.session_state:
+        st.session_state.logged_in_user = None
+    if "user_input_buffer" not in st.session_state:
+        st.session_state.user_input_buffer = ""
+    if "wrong_count" not in st.session_state:
+        st.session_state.wrong_count = 0
+    if "wrong_pool" not in st.session_state:
+        st.session_state.wrong_pool = []
+    if "page" not in st.session_state:
+        st.session_state.page = "home"
+    if "quiz" not in st.session_state:
+        st.session_state.quiz = {
+            "active": False,
+            "cat": "",
+            "sub": "",
+            "idx": 0,
+            "score": 0,
+            "limit": 10,
+            "is_retry": False,
+            "seed": None,
+            "questions": [],
+            "q": None
+        }
+
+@st.cache_resource
+def _process_state() -> dict:
+    return {"cold": True}
+
+def _record_startup(page: str):
+    """Log script start -> first paint of `page` once per session; the process' first is "cold"."""
+    if not STARTUP_LOG or st.session_state.get("startup_logged"):
+        return
+    st.session_state.startup_logged = True
+    ps = _process_state()
+    cold, ps["cold"] = ps["cold"], False
+    entry = {
+        "build": BUILD_ID, "at": now_iso(), "page": page, "cold": cold,
+        "ms": round((time.perf_counter() - _SCRIPT_T0) * 1000.0, 1),
+    }
+    try:
+        with open(STARTUP_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+    except Exception:
+        pass
+
+def load_startup_log() -> List[dict]:
+    if not STARTUP_LOG:
+        return []
+    try:
+        with open(STARTUP_LOG, encoding="utf-8") as f:
+            return [json.loads(line) for line in deque((l for l in f if l.strip()), maxlen=STARTUP_LOG_KEEP)]
+    except Exception:
+        return []
+
+def is_owner() -> bool:
+    return str(st.session_state.get("logged_in_user","")) == str(OWNER_USERNAME) and OWNER_USERNAME != ""
+
+def ensure_cookie_manager():
+    if stx is None:
+        return None
+    if "cookie_mgr" not in st.session_state:
+        st.session_state.cookie_mgr = stx.CookieManager()
+    return st.session_state.cookie_mgr
+
+@traced()
+def try_auto_login():
+    cm = ensure_cookie_manager()
+    if cm is None:
+        return
+    if st.session_state.logged_in_user is not None:
+        return
+    user_cookie = cm.get(cookie="berklee_user")
+    if user_cookie and st.session_state.stat_mgr.auto_login(user_cookie):
+        st.session_state.logged_in_user = user_cookie
+
+@traced()
+def render_login():
+    st.title("🎹 Road to Berklee")
+    if stx is None:
+        st.error("extra_streamlit_components가 필요해. requirements.txt에 추가해줘.")
+        st.stop()
+
+    with st.form("login"):
+        u = st.text_input("Username")
+        p = st.text_input("Password", type="password")
+        if st.form_submit_button("Login"):
+            if st.session_state.stat_mgr.login_user(u, p):
+                st.session_state.logged_in_user = u
+                cm = ensure_cookie_manager()
+                if cm:
+                    cm.set("berklee_user", u, expires_at=datetime.datetime.now()+timedelta(days=30))
+                st.rerun()
+            elif st.session_state.stat_mgr.degraded:
+                _render_degraded()
+            else:
+                st.error("Login failed.")
+    _record_startup("login")
+
+def logout():
+    st.session_state.stat_mgr.logout()
+    st.session_state.logged_in_user = None
+    cm = ensure_cookie_manager()
+    if cm:
+        cm.delete("berklee_user")
+    st.rerun()
+
+@traced()
+def start_quiz(cat: str, sub: str, limit: int = 10, is_retry: bool = False, retry_pool: Optional[List[Question]] = None, mode: str = "fixed", seed: Optional[int] = None):
+    if is_retry:
+        seed = None
+        questions = list(retry_pool or [])
+    else:
+        seed = new_quiz_seed() if seed is None else int(seed)
+        if mode == "review":
+            questions = st.session_state.stat_mgr.review_quiz(limit, seed)
+        else:
+            questions = build_quiz(cat, sub, mode, limit, seed)
+    if not questions:
+        st.warning("No questions to ask for this selection.")
+        return
+
+    st.session_state.user_input_buffer = ""
+    st.session_state.wrong_count = 0
+    if not is_retry:
+        st.session_state.wrong_pool = []
+
+    st.session_state.quiz = {
+        "active": True,
+        "cat": cat,
+        "sub": sub,
+        "idx": 0,
+        "score": 0,
+        "limit": len(questions),
+        "is_retry": is_retry,
+        "seed": seed,
+        "questions": questions,
+        "weights_version": st.session_state.stat_mgr.weights_version() if mode != "fixed" else None,
+        "q": questions[0] if questions else None,
+        "mode": mode
+    }
+    st.session_state.page = "quiz"
+    st.rerun()
+
+def next_question():
+    qs = st.session_state.quiz
+    qs["idx"] += 1
+    if qs["idx"] >= qs["limit"]:
+        st.session_state.page = "result"
+        st.rerun()
+
+    qs["q"] = qs["questions"][qs["idx"]]
+    st.session_state.user_input_buffer = ""
+    st.rerun()
+
+@traced()
+def check_answer():
+    qs = st.session_state.quiz
+    q = qs["q"]
+    ok = is_answer_correct(q, st.session_state.user_input_buffer)
+
+    if ok:
+        if not qs["is_retry"]:
+            qs["score"] += 1
+            st.session_state.stat_mgr.review_answer(q, answer_quality(st.session_state.wrong_count, True))
+        st.session_state.stat_mgr.record(q.category, q.subcategory, True, qs["is_retry"])
+        st.session_state.wrong_count = 0
+        next_question()
+    else:
+        st.session_state.wrong_count += 1
+        if st.session_state.wrong_count >= 3:
+            st.session_state.stat_mgr.record(q.category, q.subcategory, False, qs["is_retry"])
+            if not qs["is_retry"]:
+                st.session_state.wrong_pool.append(q)
+                st.session_state.stat_mgr.review_answer(q, answer_quality(st.session_state.wrong_count, False))
+            st.session_state.wrong_count = 0
+            next_question()
+        else:
+            st.session_state.user_input_buffer = ""
+
+def _sheets_io() -> Optional[SheetsIO]:
+    # not isinstance: the store may predate this rerun's class objects
+    pool = getattr(st.session_state.stat_mgr.store, "pool", None)
+    return pool.io if pool is not None else None
+
+def _render_degraded():
+    """One notice per store outage a call of this rerun ran into."""
+    mgr = st.session_state.stat_mgr
+    if mgr.degraded:
+        st.warning("Google Sheets is not answering right now; this page shows what is cached "
+                   "and your answers are kept until it is back. Try again in a minute.")
+        mgr.degraded = None
+
+@traced()
+def _render_quota_alert():
+    """Owner-only: warn before the Sheets budget runs out (saves then queue, reads fall back to caches)."""
+    io = _sheets_io()
+    if io is None:
+        return
+    used = SHEETS_USAGE.last_minute()
+    if io.breaker.is_open():
+        st.error("Google Sheets is failing: reads are served from cache and saves are queued.")
+    elif used >= SHEETS_QUOTA_WARN * SHEETS_QUOTA_PER_MIN:
+        st.warning(f"Sheets quota: {used} of {SHEETS_QUOTA_PER_MIN:.0f} requests in the last minute.")
+
+@traced()
+def sidebar_menu() -> str:
+    with st.sidebar:
+        st.write(f"👤 **{st.session_state.logged_in_user}**")
+        if st.button("Logout"):
+            logout()
+        st.markdown("---")
+        items = ["🏠 Home", "📝 Start Quiz", "📊 Statistics", "📘 Theory", "✅ Checklist", "ℹ️ Credits"]
+        if is_owner():
+            items += ["👥 Cohort", "🧪 Diagnostic", "⚖️ Weights"]
+            _render_quota_alert()
+        return st.radio("Menu", items)
+
+# ==============================
+# PART B6B — PAGES + ROUTER (FINAL)
+# ==============================
+
+@traced()
+def render_home():
+    st.title("🎹 Road to Berklee")
+    st.write("Music theory practice app.")
+
+
+@traced()
+def render_quiz_page():
+    qs = st.session_state.quiz
+    q: Question = qs["q"]
+    st.progress(qs["idx"] / max(1, qs["limit"]))
+    st.write(f"Question {qs['idx']+1} / {qs['limit']}")
+    st.subheader(q.prompt)
+    st.text_input("Answer", value=st.session_state.user_input_buffer, disabled=True)
+
+    if render_keypad_for_question(q):
+        check_answer()
+
+    if st.button("🏠 Quit"):
+        st.session_state.page = "home"
+        st.rerun()
+
+
+@traced()
+def render_result_page():
+    qs = st.session_state.quiz
+    st.session_state.stat_mgr.flush_history(background=True)
+    st.session_state.stat_mgr.flush_review()
+    st.header("Result")
+    st.metric("Score", f"{qs['score']}/{qs['limit']}")
+    if qs.get("seed") is not None:
+        st.caption(f"Quiz seed: {qs['seed']}")
+    if st.session_state.wrong_pool:
+        if st.button("🔄 Retry mistakes", use_container_width=True):
+            start_quiz(qs["cat"], qs["sub"], is_retry=True, retry_pool=st.session_state.wrong_pool)
+    if st.button("⬅️ Back", use_container_width=True):
+        st.session_state.page = "home"
+        st.rerun()
+
+
+@traced()
+def render_start_quiz():
+    st.header("📝 Start Quiz")
+
+    mode_label = st.radio("Mode", ["Selected topic", "Random (Weighted)", "Spaced review"], horizontal=True)
+    limit = st.slider("Number of questions", 5, 50, 10, 5)
+
+    if mode_label == "Selected topic":
+        cat = st.selectbox("Category", list(CATEGORY_INFO.keys()))
+        sub = st.selectbox("Subcategory", CATEGORY_INFO.get(cat, []))
+        if st.button("Start"):
+            start_quiz(cat, sub, limit=limit, mode="fixed")
+    elif mode_label == "Random (Weighted)":
+        st.caption("Weights sheet values control how often each topic appears.")
+        if st.button("Start Random (Weighted)"):
+            start_quiz("(Random)", "(Weighted)", limit=limit, mode="weighted")
+    else:
+        sched = st.session_state.stat_mgr.review_scheduler()
+        st.caption(f"{sched.due_count()} of {len(sched)} practiced questions are due. "
+                   "Due questions come first, then new ones from weighted topics.")
+        if st.button("Start Spaced review"):
+            start_quiz("(Review)", "(Spaced)", limit=limit, mode="review")
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _accuracy_series(user: str, version, today: int, cat_filter: str, days: int, freq: str, _stats: TopicStats) -> pd.DataFrame:
+    """count / correct / acc per period, computed once per (user, data version, filter)."""
+    d = _stats.daily(days, None if cat_filter == "(All)" else cat_filter)
+    if d.empty:
+        return d.assign(acc=pd.Series(dtype=float))
+    g = d.resample(freq).sum()
+    g["acc"] = g["correct"] / g["count"] * 100.0
+    return g
+
+@traced()
+def _render_accuracy_chart(stats: TopicStats, days: int, freq: str, cat_filter: str):
+    series = _accuracy_series(
+        str(st.session_state.logged_in_user), stats.version(), datetime.date.today().toordinal(),
+        cat_filter, int(days), freq, stats,
+    )
+    if series.empty:
+        st.info("No data.")
+        return
+    st.line_chart(series["acc"], x_label="Date", y_label="Accuracy (%)")
+
+TOPIC_FEATURE_COLS = ["category","subcategory","solved","acc","recent_solved","recent_acc","wrong_streak","last_seen_days"]
+
+def _topic_features(df: pd.DataFrame, days: int, keys: Optional[List[str]] = None,
+                    now: Optional[datetime.datetime] = None) -> pd.DataFrame:
+    """Per-topic features; pass keys=["username","category","subcategory"] for a cohort."""
+    keys = keys or ["category","subcategory"]
+    cols = keys + TOPIC_FEATURE_COLS[2:]
+    if df.empty:
+        return pd.DataFrame(columns=cols)
+
+    now = now or datetime.datetime.now()
+    cutoff = now - datetime.timedelta(days=int(days))
+
+    ts = pd.to_datetime(df["ts"], errors="coerce")
+    is_correct = pd.to_numeric(df["is_correct"], errors="coerce").fillna(0).astype(int)
+    valid = ts.notna()
+    d = pd.DataFrame({k: df[k] for k in keys})
+    d["ts"] = ts
+    d["hit_ts"] = ts.where(is_correct != 0)
+    d = d[valid]
+    correct = is_correct[valid].to_numpy()
+
+    # one factorization of the topic keys; everything else is a bincount over ids
+    gb = d.groupby(keys)
+    g = gb.agg(last_ts=("ts", "max"), last_hit=("hit_ts", "max")).reset_index()
+    ids = gb.ngroup().fillna(-1).to_numpy(dtype=int)
+    keep = ids >= 0
+    ids, correct = ids[keep], correct[keep]
+    recent = (d["ts"] >= cutoff).to_numpy()[keep]
+    k = len(g)
+
+    solved = np.bincount(ids, minlength=k)
+    recent_solved = np.bincount(ids, weights=recent, minlength=k).astype(int)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        acc = np.bincount(ids, weights=correct, minlength=k) / solved * 100.0
+        recent_acc = np.bincount(ids, weights=correct * recent, minlength=k) / recent_solved * 100.0
+
+    # wrong_streak: the trailing run of wrong answers = wrong answers after the
+    # topic's last correct one (all of them if it was never answered correctly)
+    last_hit = g["last_hit"].to_numpy("datetime64[ns]")[ids]
+    ts_ns = d["ts"].to_numpy("datetime64[ns]")[keep]
+    trailing = (correct == 0) & ~(ts_ns <= last_hit)
+
+    g["solved"] = solved
+    g["acc"] = np.nan_to_num(acc, nan=0.0)
+    g["recent_solved"] = recent_solved
+    g["recent_acc"] = np.nan_to_num(recent_acc, nan=0.0)
+    g["wrong_streak"] = np.bincount(ids, weights=trailing, minlength=k).astype(int)
+    g["last_seen_days"] = (now - g["last_ts"]).dt.days.fillna(999).astype(int)
+    return g[cols]
+
+COHORT_KEYS = ["username","category","subcategory"]
+
+@st.cache_data(ttl=3600, max_entries=16, show_spinner=False)
+def _cohort_features(store_key: str, version, days: int, _store) -> pd.DataFrame:
+    """Every student's per-topic features; recomputed only when History changes."""
+    return _topic_features(_store.all_history_df(), days, keys=COHORT_KEYS)
+
+# Weight recommendation rules. Within a group the first matching row wins; the
+# groups' deltas are added to the base weight in this order. "gated" groups
+# only apply once a topic has WEIGHT_RULE_PARAMS["min_solved"] answers.
+WEIGHT_RULE_COLS = ["group", "feature", "op", "threshold", "delta"]
+WEIGHT_RULES = [
+    # core weakness by accuracy (recent accuracy if there are enough recent answers)
+    ("accuracy", "eff_acc", "<", 45, 2.0),
+    ("accuracy", "eff_acc", "<", 65, 1.2),
+    ("accuracy", "eff_acc", "<", 80, 0.5),
+    ("accuracy", "eff_acc", ">=", 92, -0.6),
+    ("accuracy", "eff_acc", ">=", 87, -0.3),
+    # volume confidence: more solved -> stronger effect
+    ("volume", "solved_weak", ">=", 60, 0.3),
+    ("volume", "solved_strong", ">=", 60, -0.2),
+    ("volume", "solved_weak", ">=", 30, 0.15),
+    ("volume", "solved_strong", ">=", 30, -0.1),
+    # recent repeated failure
+    ("streak", "wrong_streak", ">=", 4, 0.8),
+    ("streak", "wrong_streak", "==", 3, 0.5),
+    ("streak", "wrong_streak", "==", 2, 0.25),
+    # not seen for a long time: gently boost to avoid forgetting
+    ("recency", "last_seen_days", ">=", 30, 0.35),
+    ("recency", "last_seen_days", ">=", 14, 0.2),
+]
+WEIGHT_RULE_PARAMS = {
+    "min_solved": 8,          # below this, keep near base
+    "recent_min_solved": 5,   # recent_acc is used from this many recent answers
+    "weak_acc": 70,           # volume rules split weak / strong topics here
+    "gated": ["accuracy", "volume"],
+}
+
+_RULE_OPS = {
+    "<": operator.lt, "<=": operator.le, ">": operator.gt,
+    ">=": operator.ge, "==": operator.eq,
+}
+# rule features: the ones _rule_inputs derives, then the TopicStats.frame columns
+RULE_FEATURES = ["eff_acc", "solved_weak", "solved_strong"] + TOPIC_FEATURE_COLS[2:]
+
+def _check_weight_rules(rules) -> list:
+    """Raise ValueError for a rule row _weight_scores could not evaluate."""
+    for row in rules:
+        if len(row) != len(WEIGHT_RULE_COLS):
+            raise ValueError(f"weight rule {row!r}: expected {len(WEIGHT_RULE_COLS)} fields")
+        _, feat, op, th, delta = row
+        if feat not in RULE_FEATURES:
+            raise ValueError(f"weight rule {row!r}: unknown feature {feat!r}")
+        if op not in _RULE_OPS:
+            raise ValueError(f"weight rule {row!r}: unknown op {op!r}")
+        try:
+            float(th), float(delta)
+        except (TypeError, ValueError):
+            raise ValueError(f"weight rule {row!r}: threshold and delta must be numbers") from None
+    return rules
+
+_check_weight_rules(WEIGHT_RULES)
+
+def _rule_inputs(features: pd.DataFrame, params: dict) -> Dict[str, np.ndarray]:
+    """Feature columns as arrays, plus the derived ones the rule table refers to."""
+    cols = {c: features[c].to_numpy(dtype=float) for c in TOPIC_FEATURE_COLS[2:]}
+    eff = np.where(cols["recent_solved"] >= params["recent_min_solved"], cols["recent_acc"], cols["acc"])
+    weak = eff < params["weak_acc"]
+    cols["eff_acc"] = eff
+    cols["solved_weak"] = np.where(weak, cols["solved"], -np.inf)
+    cols["solved_strong"] = np.where(weak, -np.inf, cols["solved"])
+    return cols
+
+def _weight_scores(features: pd.DataFrame, base: float = 1.0, floor: float = 0.0, ceil: float = 5.0,
+                   rules=None, params: Optional[dict] = None) -> np.ndarray:
+    """Recommended weight for every row of `features` in one array pass.
+
+    Rows may come from any number of users; only the feature columns are read.
+    """
+    rules = WEIGHT_RULES if rules is None else rules
+    params = WEIGHT_RULE_PARAMS if params is None else params
+    x = _rule_inputs(features, params)
+    gate = x["solved"] >= params["min_solved"]
+    w = np.full(len(features), float(base))
+    groups = list(dict.fromkeys(r[0] for r in rules))
+    for g in groups:
+        rows = [r for r in rules if r[0] == g]
+        conds = [_RULE_OPS[op](x[feat], float(th)) for _, feat, op, th, _ in rows]
+        delta = np.select(conds, [float(r[4]) for r in rows], default=0.0)
+        if g in params["gated"]:
+            delta = np.where(gate, delta, 0.0)
+        w = w + delta
+    return np.clip(w, floor, ceil)
+
+def _weights_by_topic(features: pd.DataFrame, scores, base: float) -> Dict[tuple, float]:
+    rec = {(c, s): base for c, subs in CATEGORY_INFO.items() for s in subs}
+    for cat, sub, w in zip(features["category"].astype(str), features["subcategory"].astype(str), scores):
+        if (cat, sub) in rec:
+            rec[(cat, sub)] = float(w)
+    return rec
+
+def _recommend_weights(features: pd.DataFrame, base: float = 1.0, floor: float = 0.0, ceil: float = 5.0,
+                       rules=None, params: Optional[dict] = None) -> Dict[tuple, float]:
+    if features.empty:
+        return _weights_by_topic(features, [], base)
+    return _weights_by_topic(features, _weight_scores(features, base, floor, ceil, rules, params), base)
+
+
+@traced()
+def _render_weight_recommendation(stats: TopicStats):
+    st.subheader("Weight recommendation (weakness-aware)")
+
+    days = st.selectbox("Analysis window (days)", [7, 14, 30, 90], index=2, key="wr_days")
+    base = st.slider("Base weight", 0.0, 3.0, 1.0, 0.5, key="wr_base")
+    floor = st.slider("Minimum weight", 0.0, 2.0, 0.0, 0.5, key="wr_floor")
+    ceil = st.slider("Maximum weight", 3.0, 8.0, 5.0, 0.5, key="wr_ceil")
+
+    with st.expander("Rule table"):
+        edited = st.data_editor(
+            pd.DataFrame(WEIGHT_RULES, columns=WEIGHT_RULE_COLS),
+            num_rows="dynamic", use_container_width=True, key="wr_rules",
+            column_config={
+                "op": st.column_config.SelectboxColumn(options=list(_RULE_OPS)),
+                "feature": st.column_config.SelectboxColumn(options=RULE_FEATURES),
+            },
+        )
+    rules = [tuple(r) for r in edited.dropna().itertuples(index=False)]
+    try:
+        _check_weight_rules(rules)
+    except ValueError as e:
+        st.error(str(e))
+        return
+
+    feats = stats.frame(days=int(days))
+    if feats.empty:
+        st.info("No history found yet.")
+        return
+
+    scores = _weight_scores(feats, base=float(base), floor=float(floor), ceil=float(ceil), rules=rules)
+    rec = _weights_by_topic(feats, scores, float(base))
+
+    view = feats.copy()
+    view["recommended_weight"] = scores
+
+    # Prioritize: low effective accuracy + high wrong streak + enough recent attempts
+    eff_acc = _rule_inputs(feats, WEIGHT_RULE_PARAMS)["eff_acc"]
+    view["priority"] = (100.0 - eff_acc) + (view["wrong_streak"] * 8.0) + (view["last_seen_days"].clip(0, 60) * 0.2)
+    view = view.sort_values(["priority","recent_solved","solved"], ascending=[False, False, False])
+
+    st.dataframe(
+        view[["category","subcategory","solved","acc","recent_solved","recent_acc","wrong_streak","last_seen_days","recommended_weight"]],
+        use_container_width=True
+    )
+
+    st.caption("Logic: lower accuracy, higher recent wrong streak, and long time since last practice increase the recommended weight.")
+
+    if not is_owner():
+        st.info("Only the owner can apply these weights to Google Sheets.")
+        return
+
+    c1, c2 = st.columns([1, 2])
+    with c1:
+        if st.button("Apply recommended weights to Google Sheets"):
+            res = st.session_state.stat_mgr.upsert_weights(
+                {k: float(w) for k, w in rec.items()}, st.session_state.logged_in_user
+            )
+            _render_upsert_results(res)
+    with c2:
+        st.caption("Tip: accuracy 낮은 토픽이 자동으로 weight↑, 높은 토픽은 weight↓로 추천돼.")
+
+
+@traced()
+def _render_upsert_results(res: Dict[tuple, str]):
+    failed = [f"{c} / {s}" for (c, s), r in res.items() if r == "failed"]
+    changed = sum(1 for r in res.values() if r in ("added", "updated"))
+    if failed:
+        st.error(f"{len(failed)} failed (check sheet permissions): " + ", ".join(failed))
+    elif any(r == "queued" for r in res.values()):
+        st.info("Google Sheets is throttling requests; the weights are queued and will be written shortly.")
+    else:
+        st.success(f"Applied. {changed} changed, {len(res) - changed} unchanged.")
+
+@traced()
+def render_cohort():
+    st.header("👥 Cohort")
+    days = st.selectbox("Recent window (days)", [7, 14, 30, 90], index=2, key="co_days")
+    feats = st.session_state.stat_mgr.cohort_features(int(days))
+    if feats.empty:
+        st.info("No history found yet.")
+        return
+
+    students = feats.groupby("username")[["solved"]].sum()
+    st.write(f"**{len(students)}** students, **{int(students['solved'].sum())}** answers.")
+
+    metric = st.selectbox(
+        "Matrix value", ["acc", "recent_acc", "solved", "recent_solved", "wrong_streak", "last_seen_days"], key="co_metric"
+    )
+    m = feats.assign(topic=feats["category"] + " / " + feats["subcategory"])
+    matrix = m.pivot_table(index="username", columns="topic", values=metric, aggfunc="first")
+    st.dataframe(matrix, use_container_width=True)
+
+    st.subheader("Weakest topics per student")
+    c1, c2 = st.columns(2)
+    with c1:
+        min_solved = st.number_input("Minimum answers per topic", 1, 100, WEIGHT_RULE_PARAMS["min_solved"], key="co_min")
+    with c2:
+        top_n = st.number_input("Topics per student", 1, 10, 3, key="co_top")
+    w = feats[feats["solved"] >= int(min_solved)].copy()
+    w["eff_acc"] = _rule_inputs(w, WEIGHT_RULE_PARAMS)["eff_acc"] if not w.empty else []
+    w = w.sort_values(["username", "eff_acc", "wrong_streak"], ascending=[True, True, False])
+    st.dataframe(
+        w.groupby("username").head(int(top_n))[["username","category","subcategory","eff_acc","solved","wrong_streak","last_seen_days"]],
+        use_container_width=True, hide_index=True
+    )
+
+
+@traced()
+def render_statistics():
+    st.header("📊 Statistics")
+    st.session_state.stat_mgr.sync_user_data()
+    stats = st.session_state.stat_mgr.topic_stats()
+
+    solved, correct = stats.totals()
+    acc = (correct / solved * 100.0) if solved else 0.0
+
+    st.markdown(f"### {solved} steps to Berklee College of Music")
+    st.write(f"Total Accuracy: **{acc:.1f}%**")
+
+    if not solved:
+        return
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        days = st.selectbox("Period", [7, 14, 30, 90, 365], index=2)
+    with c2:
+        freq = st.selectbox("Graph unit", [("Daily","D"),("Weekly","W"),("Monthly","ME")], index=1, format_func=lambda x: x[0])[1]
+    with c3:
+        cat_filter = st.selectbox("Category filter", ["(All)"] + list(CATEGORY_INFO.keys()))
+
+    st.subheader("Accuracy over time")
+    _render_accuracy_chart(stats, days, freq, cat_filter)
+
+    st.subheader("By category")
+    per_cat: Dict[str, list] = {}
+    for (cat, _), (n, c) in stats.window(days).items():
+        if n and cat_filter in ("(All)", cat):
+            tot = per_cat.setdefault(cat, [0, 0])
+            tot[0] += n
+            tot[1] += c
+    by = pd.DataFrame.from_dict(per_cat, orient="index", columns=["count","sum"]).sort_index()
+    by.index.name = "category"
+    by["acc"] = (by["sum"] / by["count"] * 100.0).fillna(0.0)
+    st.dataframe(by.rename(columns={"count":"solved","sum":"correct","acc":"accuracy%"}), use_container_width=True)
+    _render_weight_recommendation(stats)
+
+
+
+# session frames holding a table's rows; dropped (so reloaded) when a queued write to it fails
+_TABLE_FRAMES = {WS_THEORY: "theory_df", WS_CHECKLIST: "checklist_df"}
+
+def _patch_frame(table: str, key: dict, values: Optional[dict] = None):
+    """Apply a submitted write to the session's copy of `table` (values=None deletes).
+
+    A queued write lands after the rerun, so reading the sheet back now would show the old row.
+    """
+    name = _TABLE_FRAMES[table]
+    df = st.session_state.get(name)
+    if df is None:
+        return
+    m = pd.Series(True, index=df.index)
+    for c, v in key.items():
+        m &= df[c].astype(str) == str(v)
+    if values is None:
+        df = df[~m].reset_index(drop=True)
+    elif m.any():
+        df = df.copy()
+        for c, v in values.items():
+            df.loc[m, c] = v
+    else:
+        df = pd.concat([df, pd.DataFrame([{**key, **values}])], ignore_index=True)
+    st.session_state[name] = df
+
+def _render_write_results():
+    """Outcome of the saves that were still queued when their rerun ended."""
+    for table, res in st.session_state.stat_mgr.finished_writes():
+        failed = isinstance(res, Exception) or res is False or (
+            isinstance(res, dict) and any(r == "failed" for r in res.values()))
+        if failed:
+            st.session_state.pop(_TABLE_FRAMES.get(table, ""), None)
+            st.toast(f"⚠️ Saving to {table} failed; reload and try again.")
+        elif table != WS_REVIEW:
+            st.toast(f"✅ {table} saved.")
+
+
+@traced()
+def render_theory():
+    st.header("📘 Theory")
+    if "theory_df" not in st.session_state:
+        st.session_state.theory_df = st.session_state.stat_mgr.load_theory_df()
+    df = st.session_state.theory_df
+
+    cat = st.selectbox("Category", list(CATEGORY_INFO.keys()), key="th_cat")
+    sub = st.selectbox("Subcategory", CATEGORY_INFO.get(cat, []), key="th_sub")
+
+    content = ""
+    if not df.empty:
+        m = (df["category"].astype(str) == str(cat)) & (df["subcategory"].astype(str) == str(sub))
+        if m.any():
+            content = str(df[m].iloc[0]["content"] or "")
+
+    if is_owner():
+        new = st.text_area("Owner editor", value=content, height=260)
+        c1, c2 = st.columns([1,2])
+        with c1:
+            if st.button("💾 Save"):
+                ok = st.session_state.stat_mgr.upsert_theory(cat, sub, new, st.session_state.logged_in_user)
+                if ok:
+                    _patch_frame(WS_THEORY, {"category": cat, "subcategory": sub},
+                                 {"content": new, "updated_at": now_iso(), "updated_by": st.session_state.logged_in_user})
+                    st.success("Saved.")
+                else:
+                    st.error("Save failed.")
+        with c2:
+            if st.button("🔄 Reload"):
+                st.session_state.theory_df = st.session_state.stat_mgr.load_theory_df()
+                st.rerun()
+    else:
+        if content.strip():
+            st.markdown(content)
+        else:
+            st.info("No notes yet.")
+
+
+@traced()
+def render_checklist():
+    st.header("✅ Checklist")
+    if "checklist_df" not in st.session_state:
+        st.session_state.checklist_df = st.session_state.stat_mgr.load_checklist_df()
+    df = st.session_state.checklist_df
+
+    if df.empty:
+        st.info("No checklist items yet.")
+    else:
+        for section in df["section"].astype(str).unique():
+            st.subheader(section)
+            subdf = df[df["section"].astype(str) == str(section)]
+            for _, r in subdf.iterrows():
+                item = str(r["item"])
+                checked = int(r["checked"]) == 1
+                key = f"chk_{section}_{item}"
+                new_val = st.checkbox(item, value=checked, key=key)
+                if new_val != checked:
+                    if st.session_state.stat_mgr.set_checklist_item(section, item, 1 if new_val else 0, st.session_state.logged_in_user):
+                        _patch_frame(WS_CHECKLIST, {"section": section, "item": item}, {"checked": 1 if new_val else 0})
+                        st.rerun()
+                    st.error("Save failed.")
+
+    if is_owner():
+        st.markdown("---")
+        st.subheader("Owner: Add / Delete")
+        sec = st.text_input("Section", key="chk_sec")
+        item = st.text_input("Item", key="chk_item")
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button("➕ Add"):
+                if sec.strip() and item.strip():
+                    if st.session_state.stat_mgr.set_checklist_item(sec.strip(), item.strip(), 0, st.session_state.logged_in_user):
+                        _patch_frame(WS_CHECKLIST, {"section": sec.strip(), "item": item.strip()}, {"checked": 0})
+                    st.rerun()
+        with c2:
+            if st.button("🗑️ Delete"):
+                if sec.strip() and item.strip():
+                    if st.session_state.stat_mgr.delete_checklist_item(sec.strip(), item.strip()):
+                        _patch_frame(WS_CHECKLIST, {"section": sec.strip(), "item": item.strip()})
+                    st.rerun()
+
+
+@traced()
+def _render_trace_panel():
+    """Span timings of every session in this process, and this session's previous rerun."""
+    st.subheader("Rerun timing")
+    c1, c2 = st.columns(2)
+    with c1:
+        if st.button("⏹️ Stop recording" if TRACER.enabled else "⏺️ Record timings (all sessions)"):
+            TRACER.enabled = not TRACER.enabled
+            st.rerun()
+    with c2:
+        if st.button("🧹 Reset timings"):
+            TRACER.reset()
+    spans = TRACER.snapshot()
+    last = st.session_state.get("last_trace") or []
+    if not spans:
+        st.caption("No spans recorded." if TRACER.enabled else "Recording is off.")
+        return
+    st.caption(f"Since {datetime.datetime.fromtimestamp(TRACER.since):%Y-%m-%d %H:%M:%S}; "
+               f"percentiles over the last {TRACER.window} calls per span")
+    st.dataframe(pd.DataFrame(spans).round(2), use_container_width=True, hide_index=True)
+    if last:
+        st.write("Previous rerun of this session")
+        tree = [{"span": "· " * t["depth"] + t["span"], "ms": t["ms"], "own_ms": t["own_ms"]} for t in last]
+        st.dataframe(pd.DataFrame(tree), use_container_width=True, hide_index=True)
+    doc = {"build": BUILD_ID, "at": now_iso(), "since": TRACER.since, "window": TRACER.window,
+           "spans": spans, "last_rerun": last}
+    st.download_button("⬇️ Export timings JSON", json.dumps(doc, ensure_ascii=False, indent=2),
+                       file_name=f"timings_{BUILD_ID}.json", mime="application/json")
+
+
+@traced()
+def _render_sheets_usage():
+    """Sheets requests per minute against the quota, and who/what spends them."""
+    st.subheader("Google Sheets quota")
+    io = _sheets_io()
+    summary = SHEETS_USAGE.summary()
+    used = SHEETS_USAGE.last_minute()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Last 60 s", f"{used} / {SHEETS_QUOTA_PER_MIN:.0f}")
+    per = summary["calls_per_answer"]
+    c2.metric("Calls per answer", f"{per:.2f}" if per is not None else "–")
+    c3.metric("Failed calls", summary["errors"])
+    c4.metric("Queued writes", io.pending() if io is not None else 0)
+    if used >= SHEETS_QUOTA_WARN * SHEETS_QUOTA_PER_MIN:
+        st.warning(f"Above {SHEETS_QUOTA_WARN:.0%} of the quota: further requests wait for the rate limiter.")
+    if io is not None and io.breaker.is_open():
+        st.error("Circuit breaker open: reads come from cache, writes wait in the queue.")
+    st.caption(f"Since {datetime.datetime.fromtimestamp(summary['since']):%Y-%m-%d %H:%M:%S}: "
+               f"{summary['calls']} requests, {summary['answers']} answers, {summary['views']} page views"
+               + (f", {io.backoffs} backoffs" if io is not None else ""))
+    series = pd.DataFrame(SHEETS_USAGE.per_minute(), columns=["minute", "requests"]).set_index("minute")
+    series["quota"] = SHEETS_QUOTA_PER_MIN
+    st.line_chart(series, y_label="Requests / min")
+    by_page, by_method, by_user = st.columns(3)
+    with by_page:
+        st.write("By page")
+        st.dataframe(pd.DataFrame(SHEETS_USAGE.pages()), use_container_width=True, hide_index=True)
+    with by_method:
+        st.write("By method and worksheet")
+        st.dataframe(pd.DataFrame(SHEETS_USAGE.breakdown("method", "worksheet")), use_container_width=True, hide_index=True)
+    with by_user:
+        st.write("By user")
+        st.dataframe(pd.DataFrame(SHEETS_USAGE.breakdown("user")), use_container_width=True, hide_index=True)
+    errors = SHEETS_USAGE.failures()
+    if errors:
+        st.write("Failures")
+        st.dataframe(pd.DataFrame(errors), use_container_width=True, hide_index=True)
+    c1, c2 = st.columns(2)
+    with c1:
+        doc = {"build": BUILD_ID, "at": now_iso(), "quota_per_min": SHEETS_QUOTA_PER_MIN, **summary,
+               "pages": SHEETS_USAGE.pages(), "calls": SHEETS_USAGE.breakdown(*SheetsUsage.FIELDS), "errors": errors,
+               "per_minute": [{"minute": m.isoformat(), "requests": n} for m, n in SHEETS_USAGE.per_minute()]}
+        st.download_button("⬇️ Export usage JSON", json.dumps(doc, ensure_ascii=False, indent=2),
+                           file_name=f"sheets_usage_{BUILD_ID}.json", mime="application/json")
+    with c2:
+        if st.button("🧹 Reset usage counters"):
+            SHEETS_USAGE.reset()
+            st.rerun()
+
+
+@traced()
+def render_diagnostic():
+    st.header("🧪 Diagnostic")
+    if not is_owner():
+        st.warning("Owner only.")
+        return
+    if hasattr(st.session_state.stat_mgr.store, "mirror_to"):
+        if st.button("🔁 Mirror SQLite → Google Sheets"):
+            res = st.session_state.stat_mgr.mirror_to_sheets()
+            if res is None:
+                st.error("Mirror failed (check Google credentials).")
+            else:
+                st.success(f"Mirrored {res['history']} history rows, {res['users']} users, {res['records']} changed records.")
+                if res["failed"]:
+                    st.warning(f"{res['failed']} records failed; mirror again to retry them.")
+    startup = load_startup_log()
+    if startup:
+        st.subheader("Startup (script start → login page painted)")
+        sdf = pd.DataFrame(startup)
+        summary = sdf.groupby(["build", "cold"])["ms"].agg(["count", "median", "max"]).reset_index()
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+    _render_trace_panel()
+    _render_sheets_usage()
+    cat = st.selectbox("Category", list(CATEGORY_INFO.keys()), key="dg_cat")
+    sub = st.selectbox("Subcategory", CATEGORY_INFO.get(cat, []), key="dg_sub")
+    if st.button("🎲 Generate"):
+        st.session_state.dg_q = generate_question(cat, sub)
+    q = st.session_state.get("dg_q")
+    if q:
+        st.subheader(q.prompt)
+        st.write(f"kind: `{q.kind}`  | sep: `{q.sep}`")
+        st.code(", ".join(q.answers))
+
+    st.markdown("---")
+    st.subheader("Replay a quiz from its seed")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        seed = st.number_input("Seed", min_value=0, max_value=2**32 - 1, value=0, step=1, key="dg_seed")
+    with c2:
+        mode = st.radio("Mode", ["fixed", "weighted"], horizontal=True, key="dg_mode")
+    with c3:
+        limit = st.number_input("Questions", min_value=1, max_value=200, value=10, step=1, key="dg_limit")
+    if st.button("🔁 Rebuild"):
+        qs = build_quiz(cat, sub, mode, int(limit), int(seed))
+        rows = [{"#": i + 1, "category": x.category, "subcategory": x.subcategory, "prompt": x.prompt,
+                 "answers": ", ".join(x.answers), "kind": x.kind} for i, x in enumerate(qs)]
+        st.dataframe(pd.DataFrame(rows), use_container_width=True)
+        st.download_button("⬇️ Export JSON", json.dumps(rows, ensure_ascii=False, indent=2),
+                           file_name=f"quiz_{int(seed)}_{mode}.json", mime="application/json")
+
+
+@traced()
+def render_weights():
+    st.header("⚖️ Weights")
+    if not is_owner():
+        st.warning("Owner only.")
+        return
+    df = st.session_state.stat_mgr.load_weights_df()
+    weights = {}
+    for cat, subs in CATEGORY_INFO.items():
+        for sub in subs:
+            weights[(cat, sub)] = 1.0
+    if not df.empty:
+        for _, r in df.iterrows():
+            weights[(str(r["category"]), str(r["subcategory"]))] = float(r["weight"])
+
+    cat = st.selectbox("Category", list(CATEGORY_INFO.keys()), key="wg_cat")
+    changed = False
+    for sub in CATEGORY_INFO.get(cat, []):
+        key = f"w_{cat}_{sub}"
+        new = st.slider(sub, 0.0, 5.0, float(weights[(cat, sub)]), 0.5, key=key)
+        if float(new) != float(weights[(cat, sub)]):
+            weights[(cat, sub)] = float(new)
+            changed = True
+
+    if st.button("💾 Save weights"):
+        res = st.session_state.stat_mgr.upsert_weights(
+            {(cat, sub): weights[(cat, sub)] for sub in CATEGORY_INFO.get(cat, [])},
+            st.session_state.logged_in_user
+        )
+        _render_upsert_results(res)
+
+@traced()
+def route():
+    if st.session_state.logged_in_user is None:
+        SHEETS_USAGE.view(None, "Login")
+        # paint the form first: the cookie component pulls in pandas inside Streamlit
+        render_login()
+        try_auto_login()
+        if st.session_state.logged_in_user is not None:
+            st.rerun()
+        _render_degraded()
+        st.stop()
+
+    menu = sidebar_menu()
+    page = f"{menu} ({st.session_state.page})" if menu == "📝 Start Quiz" else menu
+    SHEETS_USAGE.view(st.session_state.logged_in_user, page)
+    st.session_state.stat_mgr.flush_history_if_due()
+    _render_write_results()
+    _render_degraded()
+
+    if menu == "🏠 Home":
+        render_home()
+    elif menu == "📝 Start Quiz":
+        if st.session_state.page == "quiz":
+            render_quiz_page()
+        elif st.session_state.page == "result":
+            render_result_page()
+        else:
+            render_start_quiz()
+    elif menu == "📊 Statistics":
+        render_statistics()
+    elif menu == "📘 Theory":
+        render_theory()
+    elif menu == "✅ Checklist":
+        render_checklist()
+    elif menu == "👥 Cohort":
+        render_cohort()
+    elif menu == "🧪 Diagnostic":
+        render_diagnostic()
+    elif menu == "⚖️ Weights":
+        render_weights()
+    elif menu == "ℹ️ Credits":
+        st.header("ℹ️ Credits")
+        st.write("### Road to Berklee")
+        st.write("Developed by: Oh Seung-yeol")
+    _render_degraded()
+
+
+
+def main():
+    st.set_page_config(
+        page_title="Road to Berklee",
+        page_icon="🎹",
+        layout="wide"
+    )
+    st.caption(f"BUILD-ID: {BUILD_ID}")
+    with TRACER.rerun(st.session_state):
+        init_session_state()
+        route()
+
+
+if __name__ == "__main__":
+    main()
+
+
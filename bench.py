@@ -0,0 +1,302 @@
+"""Headless benchmarks for Road_to_Berklee: no Streamlit server, no Google Sheets
+(the Sheets code path runs against fake_gspread).
+
+    python bench.py                                  # run, write bench_results.json
+    python bench.py --out bench_baseline.json        # record a baseline
+    python bench.py --baseline bench_baseline.json   # run + compare, exit 1 on regressions
+    python bench.py --quick --only grade/            # smaller sizes, one group
+    python bench.py --only analytics/ --history-sizes 1000000   # one large history
+
+Every result is the best of --repeat timed batches, stored as seconds per
+operation; a result regresses when it is more than --tolerance slower than
+the baseline entry of the same name.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import streamlit.logger as st_logger
+
+os.environ.setdefault("BERKLEE_STORAGE_BACKEND", "fake")
+# measure the app, not SheetsIO's 60/min token bucket
+os.environ.setdefault("BERKLEE_SHEETS_QUOTA_PER_MIN", "1e9")
+import Road_to_Berklee as app  # noqa: E402
+import fake_gspread  # noqa: E402
+
+# bare-mode Streamlit warns about the missing runtime on every cached call
+st_logger.set_log_level("error")
+
+HISTORY_SIZES = (1_000, 10_000, 100_000)
+QUICK_HISTORY_SIZES = (1_000, 10_000)
+
+
+def _timeit(fn: Callable[[], object], repeat: int, min_time: float) -> tuple:
+    """(best seconds per call, calls per batch); the batch grows until it lasts min_time."""
+    n = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        dt = time.perf_counter() - t0
+        if dt >= min_time or n >= 1 << 20:
+            break
+        n = max(n * 2, int(n * min_time / max(dt, 1e-9)))
+    best = dt / n
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / n)
+    return best, n
+
+
+class Suite:
+    def __init__(self, repeat: int, min_time: float, only: Optional[str]):
+        self.repeat = repeat
+        self.min_time = min_time
+        self.only = only
+        self.results: Dict[str, dict] = {}
+
+    def wanted(self, name: str) -> bool:
+        # a group prefix ("stat_mgr/") is wanted if --only names something inside it
+        return self.only is None or name.startswith(self.only) or self.only.startswith(name)
+
+    def run(self, name: str, fn: Callable[[], object], per: int = 1, unit: str = "op"):
+        """Time fn(); one call does `per` units of work (rows, answers, ...)."""
+        if not self.wanted(name):
+            return
+        sec, n = _timeit(fn, self.repeat, self.min_time)
+        self.results[name] = {"sec_per_op": sec / per, "ops_per_sec": per / sec if sec else None, "unit": unit, "calls": n}
+        print(f"{name:<48} {sec / per * 1e6:12.2f} us/{unit}")
+
+
+def bench_generators(s: Suite):
+    for (cat, sub), fn in app.GEN_DISPATCH.items():
+        random.seed(0)
+        s.run(f"gen/{cat}/{sub}", fn, unit="question")
+
+
+def bench_grading(s: Suite, per_kind: int = 200):
+    rng = random.Random(0)
+    pools: Dict[str, list] = {}
+    for space in app.GEN_SPACES.values():
+        for q in space.sample_without_replacement(min(per_kind, len(space)), rng):
+            pools.setdefault(q.kind, []).append(q)
+    for kind, qs in sorted(pools.items()):
+        qs = qs[:per_kind]
+        # half right (the answer key as a student types it), half wrong (another question's key)
+        cases = []
+        for i, q in enumerate(qs):
+            src = q if i % 2 == 0 else qs[(i + 1) % len(qs)]
+            cases.append((q, (q.sep + " ").join(src.answers) if q.sep else src.answers[0]))
+
+        def grade(cases=cases):
+            for q, text in cases:
+                app.is_answer_correct(q, text)
+        s.run(f"grade/{kind}", grade, per=len(cases), unit="answer")
+    topic = next(iter(app.GEN_SPACES))
+    s.run("grade/build_question", lambda: app.GEN_SPACES[topic][0], unit="question")
+
+
+def bench_tracing(s: Suite):
+    """A @traced call with tracing off (the deployed default) and on, against a plain call."""
+    def noop():
+        return None
+    traced = app.traced("bench/noop")(noop)
+    was = app.TRACER.enabled
+    s.run("trace/plain_call", noop, unit="call")
+    for on in (False, True):
+        app.TRACER.enabled = on
+        s.run(f"trace/traced_call_{'on' if on else 'off'}", traced, unit="call")
+    app.TRACER.enabled = was
+    app.TRACER.reset()
+
+
+def bench_review(s: Suite):
+    """Spaced-review scheduler with every GEN_SPACES item tracked (the largest possible user)."""
+    rng = random.Random(0)
+    now = time.time()
+    keys = [t + (i,) for t, space in app.GEN_SPACES.items() for i in range(len(space))]
+    sched = app.ReviewScheduler("bench")
+    for k in keys:
+        sched.answer(k, rng.choice((1, 3, 4, 5)), now - rng.random() * 30 * 86400)
+    sampler = app.AliasSampler.from_map(app._weights_from_records([]))
+    it = iter(range(1 << 30))
+
+    def answer():
+        sched.answer(keys[next(it) % len(keys)], 4, now)
+    s.run(f"review/answer/{len(keys)}", answer, unit="answer")
+    s.run(f"review/next_keys_20/{len(keys)}", lambda: sched.next_keys(20, now))
+    s.run(f"review/quiz_20/{len(keys)}", lambda: sched.quiz(20, sampler, rng, now), per=20, unit="question")
+    s.run(f"review/due_count/{len(keys)}", lambda: sched.due_count(now))
+    rows = [{"username": "bench", "category": c, "subcategory": sub, "items": sched.encode_topic((c, sub))}
+            for c, sub in sched.topics]
+    s.run(f"review/encode_all/{len(keys)}", lambda: [sched.encode_topic(t) for t in sched.topics], per=len(keys), unit="item")
+    s.run(f"review/load_all/{len(keys)}", lambda: app.ReviewScheduler("bench").load(rows), per=len(keys), unit="item")
+
+
+def synthetic_history(n: int, users: int = 20, seed: int = 0) -> List[dict]:
+    """History rows in the sheet's shape, spread over the last 180 days."""
+    rng = random.Random(seed)
+    topics = [(c, sub) for c, subs in app.CATEGORY_INFO.items() for sub in subs]
+    now = time.time()
+    rows = []
+    for _ in range(n):
+        ts = now - rng.random() * 180 * 86400
+        d = datetime.datetime.fromtimestamp(ts)
+        c, sub = rng.choice(topics)
+        rows.append({"username": f"u{rng.randrange(users)}", "timestamp": ts, "year": d.year, "month": d.month,
+                     "day": d.day, "category": c, "subcategory": sub,
+                     "is_correct": int(rng.random() < 0.7), "count": 1})
+    return rows
+
+
+def bench_analytics(s: Suite, sizes=HISTORY_SIZES, days: int = 30):
+    for n in sizes:
+        rows = synthetic_history(n)
+        s.run(f"analytics/stat_df_from_history/{n}", lambda: app.stat_df_from_history(rows), per=n, unit="row")
+        df = app.stat_df_from_history(rows, with_user=True)
+        s.run(f"analytics/topic_features/{n}", lambda: app._topic_features(df, days), per=n, unit="row")
+        s.run(f"analytics/cohort_features/{n}", lambda: app._topic_features(df, days, keys=app.COHORT_KEYS),
+              per=n, unit="row")
+        feats = app._topic_features(df, days)
+        s.run(f"analytics/recommend_weights/{n}", lambda: app._recommend_weights(feats))
+        s.run(f"analytics/topic_stats_from_rows/{n}", lambda: app.TopicStats.from_rows(rows), per=n, unit="row")
+
+
+def _bench_manager(n: int) -> "app.StatManager":
+    """A logged-in StatManager over an in-memory SQLite store holding n History rows."""
+    store = app.SQLiteBackend(":memory:")
+    store.add_user("bench", "x")
+    store.append_history([["bench"] + [r[c] for c in app.HISTORY_COLS[1:]] for r in synthetic_history(n, users=1)])
+    mgr = app.StatManager(store=store)
+    mgr.current_user = "bench"
+    mgr.load_user_data()
+    return mgr
+
+
+def bench_stat_manager(s: Suite, n: int = 2_000):
+    """StatManager over in-memory SQLite (the deployed SQLite code path, minus the disk)."""
+    topics = [(c, sub) for c, subs in app.CATEGORY_INFO.items() for sub in subs]
+    writer = _bench_manager(0)
+    it = iter(range(1 << 30))
+
+    def record():
+        c, sub = topics[next(it) % len(topics)]
+        writer.record(c, sub, True, False)
+    s.run("stat_mgr/record", record, unit="answer")
+
+    mgr = _bench_manager(n)
+    s.run("stat_mgr/load_user_data", mgr.load_user_data)
+    s.run("stat_mgr/topic_stats", mgr.topic_stats)
+    s.run("stat_mgr/topic_stats_frame", lambda: mgr.topic_stats().frame(30))
+    s.run("stat_mgr/weights_map", mgr.weights_map)
+    s.run("stat_mgr/weights_sampler_draw", lambda: mgr.weights_sampler().draw(random))
+    s.run("stat_mgr/upsert_weight", lambda: mgr.upsert_weight(*topics[0], 1.5, "bench"))
+
+
+def bench_sheets_store(s: Suite, n: int = 2_000):
+    """StatManager over the Sheets backend with fake_gspread (no latency): app-side cost per call."""
+    if app.STORAGE_BACKEND != "fake":
+        return
+    mgr = app.StatManager(sheet_name="bench")
+    mgr.store.add_user("bench", hashlib.sha256(b"x").hexdigest())
+    mgr.store.ws_history.append_rows([["bench"] + [r[c] for c in app.HISTORY_COLS[1:]]
+                                      for r in synthetic_history(n, users=1)])
+    mgr.current_user = "bench"
+    mgr.load_user_data()
+    topics = [(c, sub) for c, subs in app.CATEGORY_INFO.items() for sub in subs]
+    it = iter(range(1 << 30))
+
+    def record_flush():
+        c, sub = topics[next(it) % len(topics)]
+        mgr.record(c, sub, True, False)
+        mgr.flush_history()
+    s.run("sheets_fake/record_flush", record_flush, unit="answer")
+    s.run("sheets_fake/sync_user_data", lambda: mgr.sync_user_data(max_age=0))
+    s.run("sheets_fake/topic_stats", mgr.topic_stats)
+    s.run("sheets_fake/load_theory_df", mgr.load_theory_df)
+    s.run("sheets_fake/upsert_theory", lambda: mgr.upsert_theory(*topics[0], "notes", "bench"))
+    s.run("sheets_fake/login_user", lambda: mgr.login_user("bench", "x"))
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Print current vs baseline per name; returns the names that regressed."""
+    regressed = []
+    print(f"\n{'name':<48} {'base us':>12} {'now us':>12} {'ratio':>7}")
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = cur["sec_per_op"] / base["sec_per_op"] if base["sec_per_op"] else float("inf")
+        flag = "  REGRESSED" if ratio > 1 + tolerance else ("  faster" if ratio < 1 - tolerance else "")
+        print(f"{name:<48} {base['sec_per_op'] * 1e6:12.2f} {cur['sec_per_op'] * 1e6:12.2f} {ratio:7.2f}{flag}")
+        if flag == "  REGRESSED":
+            regressed.append(name)
+    return regressed
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--baseline", help="results file to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--min-time", type=float, default=0.05, help="seconds per timed batch")
+    ap.add_argument("--quick", action="store_true", help="smaller histories, fewer repeats")
+    ap.add_argument("--only", help="run only benchmarks whose name starts with this")
+    ap.add_argument("--history-sizes", type=lambda v: tuple(int(x) for x in v.split(",")),
+                    help="comma-separated History row counts for analytics/ (overrides --quick)")
+    args = ap.parse_args(argv)
+
+    s = Suite(3 if args.quick else args.repeat, args.min_time, args.only)
+    bench_generators(s)
+    bench_grading(s)
+    bench_tracing(s)
+    if s.wanted("review/"):
+        bench_review(s)
+    bench_analytics(s, args.history_sizes or (QUICK_HISTORY_SIZES if args.quick else HISTORY_SIZES))
+    if s.wanted("stat_mgr/"):
+        bench_stat_manager(s)
+    if s.wanted("sheets_fake/"):
+        bench_sheets_store(s)
+
+    doc = {
+        "meta": {
+            "build_id": app.BUILD_ID,
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": app.np.__version__,
+            "pandas": app.pd.__version__,
+            "quick": args.quick,
+            "storage_backend": app.STORAGE_BACKEND,
+            "fake_api_calls": fake_gspread.SERVER.stats()["calls"],
+        },
+        "results": s.results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=1, sort_keys=True)
+    print(f"\nwrote {len(s.results)} results to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressed = compare(s.results, baseline, args.tolerance)
+        if regressed:
+            print(f"\n{len(regressed)} regressed beyond {args.tolerance:.0%}: " + ", ".join(regressed))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+"""In-process stand-in for the part of gspread Road_to_Berklee uses.
+
+Selected with STORAGE_BACKEND = "fake": the app keeps its Google Sheets code
+path (SheetsPool, SheetsIO, HistoryWriter, ...) but every request lands in
+FakeServer, a process-wide dict of spreadsheets. The server can add latency,
+answer 429 once a per-minute quota is spent, fail a share of requests (or the
+next n) and counts every call per (worksheet, method):
+
+    server = fake_gspread.SERVER
+    server.configure(latency_ms=80, jitter_ms=40, quota_per_min=60, fail_rate=0.01)
+    server.fail_next(3, status=503)
+    server.stats()  # {"calls": ..., "throttled": ..., "failed": ..., "by_method": {...}}
+
+Values are stored as written. Reads render them the way the Sheets API
+does for the call in question: get_all_records numericises, get() with
+UNFORMATTED_VALUE returns raw values, and col_values/row_values/cell return
+strings.
+"""
+from __future__ import annotations
+
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+import gspread
+from gspread.cell import Cell
+from gspread.utils import numericise_all, rowcol_to_a1
+
+_RANGE_RE = re.compile(r"([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?")
+
+
+def _col_index(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _col_letters(col: int) -> str:
+    return rowcol_to_a1(1, col).rstrip("0123456789")
+
+
+class _Response:
+    """Just enough of requests.Response for gspread.exceptions.APIError."""
+    def __init__(self, code: int, message: str, status: str):
+        self.status_code = code
+        self._error = {"code": code, "message": message, "status": status}
+        self.text = message
+
+    def json(self):
+        return {"error": self._error}
+
+
+def api_error(code: int, message: str = "", status: str = "") -> gspread.exceptions.APIError:
+    return gspread.exceptions.APIError(_Response(code, message or f"HTTP {code}", status))
+
+
+class FakeServer:
+    """The fake Sheets API: spreadsheets, fault injection and call counters."""
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.spreadsheets: Dict[str, "FakeSpreadsheet"] = {}
+        # worksheets (title -> rows) a spreadsheet starts with when first opened
+        self.template: Dict[str, List[list]] = {}
+        self.latency_sec = 0.0
+        self.jitter_sec = 0.0
+        self.quota_per_min = 0.0
+        self.fail_rate = 0.0
+        self.fail_status = 503
+        self._scheduled: deque = deque()
+        self._window: deque = deque()
+        self.calls: Counter = Counter()
+        self.throttled = 0
+        self.failed = 0
+
+    def configure(self, latency_ms: Optional[float] = None, jitter_ms: Optional[float] = None,
+                  quota_per_min: Optional[float] = None, fail_rate: Optional[float] = None,
+                  fail_status: Optional[int] = None):
+        """Set any of the fault knobs; 0 disables latency / quota / random failures."""
+        with self.lock:
+            if latency_ms is not None:
+                self.latency_sec = latency_ms / 1000.0
+            if jitter_ms is not None:
+                self.jitter_sec = jitter_ms / 1000.0
+            if quota_per_min is not None:
+                self.quota_per_min = quota_per_min
+            if fail_rate is not None:
+                self.fail_rate = fail_rate
+            if fail_status is not None:
+                self.fail_status = fail_status
+
+    def fail_next(self, n: int = 1, status: int = 503, exc: Optional[Exception] = None):
+        """Fail the next n requests with an HTTP `status` APIError, or with `exc`."""
+        with self.lock:
+            self._scheduled.extend([exc or status] * n)
+
+    def reset(self, data: bool = True):
+        """Clear counters and pending faults (and every spreadsheet when `data`)."""
+        with self.lock:
+            if data:
+                self.spreadsheets = {}
+            self._scheduled.clear()
+            self._window.clear()
+            self.calls = Counter()
+            self.throttled = 0
+            self.failed = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "calls": sum(self.calls.values()),
+                "throttled": self.throttled,
+                "failed": self.failed,
+                "by_method": {f"{t}.{m}": n for (t, m), n in sorted(self.calls.items())},
+            }
+
+    def request(self, title: str, method: str):
+        """Account one API request; sleeps for the latency, then may raise the injected fault."""
+        delay = self.latency_sec + (random.random() * self.jitter_sec if self.jitter_sec else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        with self.lock:
+            self.calls[(title, method)] += 1
+            if self._scheduled:
+                fault = self._scheduled.popleft()
+                self.failed += 1
+                if isinstance(fault, Exception):
+                    raise fault
+                raise api_error(fault)
+            if self.quota_per_min:
+                now = time.monotonic()
+                while self._window and now - self._window[0] >= 60.0:
+                    self._window.popleft()
+                if len(self._window) >= self.quota_per_min:
+                    self.throttled += 1
+                    raise api_error(429, "Quota exceeded for quota metric 'Read requests'", "RESOURCE_EXHAUSTED")
+                self._window.append(now)
+            if self.fail_rate and random.random() < self.fail_rate:
+                self.failed += 1
+                raise api_error(self.fail_status)
+
+    def spreadsheet(self, name: str) -> "FakeSpreadsheet":
+        with self.lock:
+            sh = self.spreadsheets.get(name)
+            if sh is None:
+                sh = self.spreadsheets[name] = FakeSpreadsheet(self, name)
+                for title, rows in self.template.items():
+                    sh.sheets[title] = FakeWorksheet(self, title, [list(r) for r in rows])
+            return sh
+
+
+class FakeClient:
+    """gspread.Client stand-in; every client of one server sees the same data."""
+    def __init__(self, server: Optional[FakeServer] = None):
+        self.server = server or SERVER
+
+    def open(self, name: str) -> "FakeSpreadsheet":
+        self.server.request("*", "open")
+        return self.server.spreadsheet(name)
+
+
+class FakeSpreadsheet:
+    def __init__(self, server: FakeServer, title: str):
+        self.server = server
+        self.title = title
+        self.sheets: Dict[str, FakeWorksheet] = {}
+
+    def worksheets(self) -> List["FakeWorksheet"]:
+        self.server.request("*", "worksheets")
+        with self.server.lock:
+            return list(self.sheets.values())
+
+    def worksheet(self, title: str) -> "FakeWorksheet":
+        self.server.request(title, "worksheet")
+        with self.server.lock:
+            if title not in self.sheets:
+                raise gspread.exceptions.WorksheetNotFound(title)
+            return self.sheets[title]
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, **kwargs) -> "FakeWorksheet":
+        self.server.request(title, "add_worksheet")
+        with self.server.lock:
+            if title in self.sheets:
+                raise api_error(400, f'A sheet with the name "{title}" already exists.', "INVALID_ARGUMENT")
+            ws = self.sheets[title] = FakeWorksheet(self.server, title, [])
+            return ws
+
+
+class FakeWorksheet:
+    def __init__(self, server: FakeServer, title: str, rows: List[list]):
+        self.server = server
+        self.title = title
+        self.rows = rows
+
+    @property
+    def row_count(self) -> int:
+        return len(self.rows)
+
+    def _call(self, method: str):
+        self.server.request(self.title, method)
+
+    # reads
+    def get_all_records(self, **kwargs) -> List[dict]:
+        self._call("get_all_records")
+        with self.server.lock:
+            if not self.rows:
+                return []
+            header = [str(h) for h in self.rows[0]]
+            out = []
+            for r in self.rows[1:]:
+                vals = numericise_all([str(v) for v in r] + [""] * (len(header) - len(r)), default_blank="")
+                out.append(dict(zip(header, vals)))
+            return out
+
+    def get(self, range_name: Optional[str] = None, value_render_option=None, **kwargs) -> List[list]:
+        self._call("get")
+        m = _RANGE_RE.fullmatch(range_name or "A1")
+        c0 = _col_index(m.group(1))
+        r0 = int(m.group(2) or 1)
+        c1 = _col_index(m.group(3)) if m.group(3) else c0
+        r1 = int(m.group(4)) if m.group(4) else None
+        raw = str(value_render_option or "").upper().endswith("UNFORMATTED_VALUE")
+        with self.server.lock:
+            out = []
+            for r in self.rows[r0 - 1:r1]:
+                cells = list(r[c0 - 1:c1])
+                while cells and cells[-1] in ("", None):
+                    cells.pop()
+                out.append(cells if raw else [str(v) for v in cells])
+            while out and not out[-1]:
+                out.pop()
+            return out
+
+    def row_values(self, row: int, **kwargs) -> List[str]:
+        self._call("row_values")
+        with self.server.lock:
+            return [str(v) for v in self.rows[row - 1]] if row <= len(self.rows) else []
+
+    def col_values(self, col: int, **kwargs) -> List[str]:
+        self._call("col_values")
+        with self.server.lock:
+            vals = [str(r[col - 1]) if len(r) >= col else "" for r in self.rows]
+            while vals and vals[-1] == "":
+                vals.pop()
+            return vals
+
+    def cell(self, row: int, col: int, **kwargs) -> Cell:
+        self._call("cell")
+        with self.server.lock:
+            r = self.rows[row - 1] if row <= len(self.rows) else []
+            return Cell(row, col, str(r[col - 1]) if len(r) >= col else "")
+
+    def find(self, query, **kwargs) -> Optional[Cell]:
+        self._call("find")
+        with self.server.lock:
+            for i, r in enumerate(self.rows, start=1):
+                for j, v in enumerate(r, start=1):
+                    if str(v) == str(query):
+                        return Cell(i, j, str(v))
+            return None
+
+    # writes
+    def _put(self, row: int, col: int, values: List[list]):
+        for i, vals in enumerate(values):
+            while len(self.rows) < row + i:
+                self.rows.append([])
+            target = self.rows[row + i - 1]
+            for j, v in enumerate(vals):
+                while len(target) < col + j:
+                    target.append("")
+                target[col + j - 1] = v
+
+    def append_row(self, values: list, **kwargs) -> dict:
+        self._call("append_row")
+        return self._append([values])
+
+    def append_rows(self, values: List[list], **kwargs) -> dict:
+        self._call("append_rows")
+        return self._append(values)
+
+    def _append(self, values: List[list]) -> dict:
+        with self.server.lock:
+            start = len(self.rows) + 1
+            self.rows.extend(list(v) for v in values)
+            width = max((len(v) for v in values), default=1)
+            rng = f"'{self.title}'!A{start}:{_col_letters(width)}{start + len(values) - 1}"
+            return {"updates": {"updatedRange": rng, "updatedRows": len(values)}}
+
+    def update(self, values=None, range_name=None, **kwargs) -> dict:
+        self._call("update")
+        if isinstance(values, str):
+            # the old (range, values) argument order, still accepted by gspread 6
+            values, range_name = range_name, values
+        with self.server.lock:
+            self._update(range_name or "A1", values)
+        return {"updatedRange": f"'{self.title}'!{range_name}"}
+
+    def _update(self, range_name: str, values: List[list]):
+        m = _RANGE_RE.fullmatch(range_name)
+        self._put(int(m.group(2) or 1), _col_index(m.group(1)), values)
+
+    def batch_update(self, data: List[dict], **kwargs) -> dict:
+        self._call("batch_update")
+        with self.server.lock:
+            for d in data:
+                self._update(d["range"], d["values"])
+        return {"totalUpdatedRanges": len(data)}
+
+    def delete_rows(self, start_index: int, end_index: Optional[int] = None) -> dict:
+        self._call("delete_rows")
+        with self.server.lock:
+            del self.rows[start_index - 1:end_index or start_index]
+        return {}
+
+
+SERVER = FakeServer()
@@ -0,0 +1,281 @@
+"""Concurrent-session load test: N simulated students against one app process.
+
+Each student is a Streamlit AppTest session (the server's script runner
+without the browser) that goes login -> Start Quiz -> answers -> Statistics
+against STORAGE_BACKEND = "fake". The sessions share the process-wide caches
+(SheetsPool, History index, weights), like students on one deployed server.
+
+    python loadtest.py --users 20 --answers 10
+    python loadtest.py --users 50 --latency-ms 120 --quota 300 --out load.json
+
+Reports p50/p95/p99 rerun latency per step, session-state size per session,
+process RSS growth per session and fake Sheets API calls per answered
+question. With --trace the app records its rerun spans (BERKLEE_TRACE) and
+the report adds the slowest spans by own time, summed over every session
+(from the last rerun of each step: login's spans are the page after st.rerun()).
+
+AppTest is not thread-safe (every run installs and then clears a global
+Runtime), so reruns take a process-wide lock: sessions interleave the way
+they would on one saturated script thread. `latency` includes the wait for
+that lock, while `exec` is the rerun alone. Background work (History
+write-behind, the SheetsIO writer) still overlaps. One warm-up session runs
+first, so imports and process caches do not count against the measured ones.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Road_to_Berklee.py")
+PASSWORD = "pw"
+# Streamlit release whose AppTest internals _share_script_cache was checked against
+STREAMLIT_CHECKED = "1.65"
+RUN_LOCK = threading.Lock()
+
+
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # peak, not current, off Linux
+
+
+def _share_script_cache() -> bool:
+    """Compile the script once for all sessions, as a server does (AppTest compiles it on every run).
+
+    This swaps a private name in streamlit.testing, checked against Streamlit
+    STREAMLIT_CHECKED; if it is gone the test runs uncached, which inflates `exec`.
+    """
+    import streamlit
+    if not streamlit.__version__.startswith(STREAMLIT_CHECKED + "."):
+        print(f"warning: loadtest was checked against streamlit {STREAMLIT_CHECKED}, running {streamlit.__version__}",
+              file=sys.stderr)
+    try:
+        from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+        from streamlit.testing.v1 import local_script_runner
+    except ImportError as e:
+        print(f"warning: script cache not shared ({e}); every rerun recompiles the app", file=sys.stderr)
+        return False
+    if not hasattr(local_script_runner, "ScriptCache"):
+        print("warning: script cache not shared (local_script_runner.ScriptCache is gone); "
+              "every rerun recompiles the app", file=sys.stderr)
+        return False
+    shared = ScriptCache()
+    local_script_runner.ScriptCache = lambda: shared
+    return True
+
+
+def _percentile(xs: List[float], p: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, max(0, int(round(p / 100.0 * len(xs) + 0.5)) - 1))]
+
+
+def _deep_size(obj, seen=None) -> int:
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _deep_size(vars(obj), seen)
+    return size
+
+
+class Student:
+    """One simulated session; `latency` / `exec` map step -> rerun seconds."""
+    def __init__(self, name: str, answers: int, accuracy: float, think_sec: float, seed: int):
+        self.name = name
+        self.answers = answers
+        self.accuracy = accuracy
+        self.think_sec = think_sec
+        self.rng = random.Random(seed)
+        self.latency: Dict[str, List[float]] = {}
+        self.exec: Dict[str, List[float]] = {}
+        self.answered = 0
+        self.errors: List[str] = []
+        self.state_bytes = 0
+        self.spans: Dict[str, List[float]] = {}
+
+    def _step(self, step: str, at):
+        if self.think_sec:
+            time.sleep(self.rng.random() * 2 * self.think_sec)
+        t0 = time.perf_counter()
+        with RUN_LOCK:
+            t1 = time.perf_counter()
+            at.run()
+        t2 = time.perf_counter()
+        self.latency.setdefault(step, []).append(t2 - t0)
+        self.exec.setdefault(step, []).append(t2 - t1)
+        for t in (at.session_state["last_trace"] if "last_trace" in at.session_state else []):
+            self.spans.setdefault(t["span"], []).append(t["own_ms"])
+        if at.exception:
+            raise RuntimeError(f"{step}: {at.exception[0].message}")
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(APP, default_timeout=120)
+        try:
+            self._step("first_paint", at)
+            at.text_input[0].input(self.name)
+            at.text_input[1].input(PASSWORD)
+            at.button[0].click()
+            self._step("login", at)
+            at.sidebar.radio[0].set_value("📝 Start Quiz")
+            self._step("open_quiz", at)
+            at.radio[0].set_value("Random (Weighted)")
+            at.slider[0].set_value(self.answers)
+            self._step("open_quiz", at)
+            next(b for b in at.button if b.label.startswith("Start Random")).click()
+            self._step("start", at)
+            while at.session_state.page == "quiz":
+                q = at.session_state.quiz["q"]
+                text = (q.sep + " ").join(q.answers) if q.sep else q.answers[0]
+                at.session_state.user_input_buffer = text if self.rng.random() < self.accuracy else "?"
+                next(b for b in at.button if b.label == "✅").click()
+                self._step("answer", at)
+                self.answered += 1
+            at.sidebar.radio[0].set_value("📊 Statistics")
+            self._step("statistics", at)
+            self.state_bytes = _deep_size(at.session_state.to_dict())
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--users", type=int, default=10)
+    ap.add_argument("--answers", type=int, default=10, help="questions per quiz (5..50, step 5)")
+    ap.add_argument("--accuracy", type=float, default=0.7)
+    ap.add_argument("--think-ms", type=float, default=0.0, help="mean pause before each action")
+    ap.add_argument("--ramp-sec", type=float, default=0.0, help="spread session starts over this long")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="fake Sheets latency per call")
+    ap.add_argument("--quota", type=float, default=0.0, help="fake Sheets requests/min before 429 (0 = none)")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="share of fake Sheets calls that fail")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--trace", action="store_true", help="record the app's rerun spans (the last rerun of each step) and report the slowest")
+    ap.add_argument("--out", help="write the report as JSON")
+    args = ap.parse_args(argv)
+    answers = min(50, max(5, 5 * round(args.answers / 5)))
+
+    names = [f"student{i}" for i in range(args.users)]
+    os.environ.update({
+        "BERKLEE_STORAGE_BACKEND": "fake",
+        "BERKLEE_FAKE_SHEETS_USERS": ",".join(f"{n}:{PASSWORD}" for n in names),
+        "BERKLEE_FAKE_SHEETS_LATENCY_MS": str(args.latency_ms),
+        "BERKLEE_FAKE_SHEETS_QUOTA_PER_MIN": str(args.quota),
+        "BERKLEE_FAKE_SHEETS_FAIL_RATE": str(args.fail_rate),
+        "BERKLEE_STARTUP_LOG": os.devnull,
+        "STREAMLIT_LOGGER_LEVEL": "error",
+        "BERKLEE_TRACE": "1" if args.trace else "0",
+    })
+    sys.path.insert(0, os.path.dirname(APP))
+    import streamlit.logger as st_logger
+    import fake_gspread
+    st_logger.set_log_level("error")
+    _share_script_cache()
+
+    warm = Student(names[0], 5, 1.0, 0.0, -1)
+    warm.run()
+    if warm.errors:
+        print("warm-up failed:", warm.errors[0])
+        return 1
+    fake_gspread.SERVER.reset(data=False)
+
+    students = [Student(n, answers, args.accuracy, args.think_ms / 1000.0, args.seed + i) for i, n in enumerate(names)]
+    rss0 = _rss_kb()
+    t0 = time.perf_counter()
+
+    def launch(i_s):
+        i, s = i_s
+        if args.ramp_sec and args.users > 1:
+            time.sleep(args.ramp_sec * i / (args.users - 1))
+        s.run()
+    with ThreadPoolExecutor(max_workers=args.users, thread_name_prefix="student") as ex:
+        list(ex.map(launch, enumerate(students)))
+    wall = time.perf_counter() - t0
+    rss1 = _rss_kb()
+
+    def by_step(attr: str) -> Dict[str, dict]:
+        steps: Dict[str, List[float]] = {}
+        for s in students:
+            for k, v in getattr(s, attr).items():
+                steps.setdefault(k, []).extend(v)
+        steps = dict([("all", [x for v in steps.values() for x in v])] + sorted(steps.items()))
+        return {step: {"n": len(v), "p50": _percentile(v, 50) * 1e3, "p95": _percentile(v, 95) * 1e3,
+                       "p99": _percentile(v, 99) * 1e3, "max": max(v, default=0.0) * 1e3}
+                for step, v in steps.items()}
+    answered = sum(s.answered for s in students)
+    api = fake_gspread.SERVER.stats()
+    report = {
+        "config": dict(vars(args), answers=answers),
+        "wall_sec": wall,
+        "threads_alive": threading.active_count(),
+        "sessions_ok": sum(1 for s in students if not s.errors),
+        "errors": [f"{s.name}: {e}" for s in students for e in s.errors],
+        "latency_ms": by_step("latency"),
+        "exec_ms": by_step("exec"),
+        "memory_kb": {
+            "session_state_mean": sum(s.state_bytes for s in students) / max(1, len(students)) / 1024,
+            "session_state_max": max((s.state_bytes for s in students), default=0) / 1024,
+            "rss_per_session": (rss1 - rss0) / max(1, len(students)),
+            "rss_total": rss1,
+        },
+        "answered": answered,
+        "sheets_calls": api["calls"],
+        "sheets_calls_per_answer": api["calls"] / answered if answered else None,
+        "sheets_throttled": api["throttled"],
+        "sheets_failed": api["failed"],
+        "sheets_by_method": api["by_method"],
+    }
+    if args.trace:
+        spans: Dict[str, List[float]] = {}
+        for s in students:
+            for k, v in s.spans.items():
+                spans.setdefault(k, []).extend(v)
+        report["spans_own_ms"] = sorted(
+            ({"span": k, "n": len(v), "total": sum(v), "p50": _percentile(v, 50), "p95": _percentile(v, 95)}
+             for k, v in spans.items()), key=lambda r: r["total"], reverse=True)
+
+    print(f"{args.users} sessions, {answered} answers in {wall:.1f}s; {report['sessions_ok']} ok")
+    for kind in ("latency_ms", "exec_ms"):
+        print(f"\n{kind:<12} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+        for step, r in report[kind].items():
+            print(f"{step:<12} {r['n']:>6} {r['p50']:9.1f} {r['p95']:9.1f} {r['p99']:9.1f} {r['max']:9.1f}")
+    m = report["memory_kb"]
+    print(f"\nsession_state {m['session_state_mean']:.0f} KB mean / {m['session_state_max']:.0f} KB max; "
+          f"RSS +{m['rss_per_session']:.0f} KB per session ({m['rss_total'] / 1024:.0f} MB total)")
+    per = report["sheets_calls_per_answer"]
+    print(f"Sheets calls: {api['calls']} ({per:.2f} per answer), {api['throttled']} throttled, {api['failed']} failed"
+          if per is not None else f"Sheets calls: {api['calls']}")
+    if args.trace:
+        print(f"\n{'span (own time, ms)':<40} {'n':>6} {'total':>10} {'p50':>9} {'p95':>9}")
+        for r in report["spans_own_ms"][:15]:
+            print(f"{r['span']:<40} {r['n']:>6} {r['total']:10.1f} {r['p50']:9.2f} {r['p95']:9.2f}")
+    for e in report["errors"][:10]:
+        print("ERROR", e)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
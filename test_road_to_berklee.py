@@ -0,0 +1,725 @@
+"""Unit tests for the app's pure-Python building blocks (no Streamlit server,
+no Google Sheets: the Sheets paths run against fake_gspread).
+
+    python -m pytest -q
+"""
+from __future__ import annotations
+
+import datetime
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+import pandas as pd
+import pytest
+import streamlit.logger as st_logger
+
+os.environ.setdefault("BERKLEE_STORAGE_BACKEND", "fake")
+# fake Sheets calls are free; don't wait on SheetsIO's 60/min token bucket
+os.environ.setdefault("BERKLEE_SHEETS_QUOTA_PER_MIN", "1e9")
+import Road_to_Berklee as app  # noqa: E402
+
+# bare-mode Streamlit warns about the missing runtime on every cached call
+st_logger.set_log_level("error")
+
+
+# Alias sampler
+def test_alias_sampler_frequencies():
+    weights = {"a": 1.0, "b": 2.0, "c": 0.0, "d": 5.0}
+    s = app.AliasSampler(list(weights), list(weights.values()))
+    rng = random.Random(7)
+    n = 80_000
+    got = Counter(s.draw_k(n, rng))
+    assert got["c"] == 0
+    total = sum(weights.values())
+    for k, w in weights.items():
+        assert got[k] / n == pytest.approx(w / total, abs=0.01)
+
+
+def test_alias_sampler_all_zero_is_uniform():
+    s = app.AliasSampler(["a", "b"], [0, 0])
+    rng = random.Random(1)
+    got = Counter(s.draw(rng) for _ in range(4000))
+    assert got["a"] / 4000 == pytest.approx(0.5, abs=0.03)
+
+
+def test_alias_sampler_without_replacement_deals_every_item_once_per_round():
+    s = app.AliasSampler(["a", "b", "c", "z"], [1, 3, 5, 0])
+    out = s.sample_without_replacement(7, random.Random(3))
+    assert sorted(out[:3]) == ["a", "b", "c"]
+    assert len(set(out[3:6])) == 3 and "z" not in out
+
+
+# History write-behind
+@pytest.fixture
+def history_ws():
+    import fake_gspread
+    server = fake_gspread.FakeServer()
+    return server, fake_gspread.FakeClient(server).open("t").add_worksheet(app.WS_HISTORY)
+
+
+def test_history_writer_spills_failed_batch_and_replays_it_first(history_ws, tmp_path, monkeypatch):
+    server, ws = history_ws
+    monkeypatch.setattr(app, "HISTORY_RETRY_DELAYS", [0.0])
+    spill = tmp_path / "spill.jsonl"
+    unsent = []
+    w = app.HistoryWriter(ws, spill_path=str(spill), on_unsent=unsent.extend)
+    w.add([1])
+    w.add([2])
+    server.fail_next(2)
+    assert w.flush() is False
+    assert ws.rows == [] and spill.exists()
+    assert unsent == [[1], [2]]
+
+    w.add([3])
+    assert w.flush() is True
+    assert ws.rows == [[1], [2], [3]]
+    assert not spill.exists()
+
+
+def test_history_writer_background_flushes_do_not_duplicate(history_ws, tmp_path, monkeypatch):
+    server, ws = history_ws
+    monkeypatch.setattr(app, "HISTORY_RETRY_DELAYS", [0.0])
+    server.configure(latency_ms=20)
+    w = app.HistoryWriter(ws, spill_path=str(tmp_path / "spill.jsonl"))
+    server.fail_next(2)
+    w.add([0])
+    w.flush()
+    for i in range(1, 30):
+        w.add([i])
+        w.flush(background=True)
+    assert w.flush() is True
+    assert sorted(r[0] for r in ws.rows) == list(range(30))
+
+
+def test_history_writer_keeps_the_spill_file_until_the_resend_lands(history_ws, tmp_path, monkeypatch):
+    server, ws = history_ws
+    monkeypatch.setattr(app, "HISTORY_RETRY_DELAYS", [0.0])
+    spill = tmp_path / "spill.jsonl"
+    w = app.HistoryWriter(ws, spill_path=str(spill))
+    w.add([1])
+    server.fail_next(2)
+    assert w.flush() is False
+
+    def die(rows):  # the process goes away mid-send
+        raise SystemExit
+
+    monkeypatch.setattr(ws, "append_rows", die)
+    w.add([2])
+    with pytest.raises(SystemExit):
+        w.flush()
+    assert w._spill_read()[0] == [[1]]
+
+    rows, size = w._spill_read()
+    w._spill_put([[3]])                 # spilled by another session during the resend
+    w._spill_drop(size)
+    assert w._spill_read()[0] == [[3]]
+
+
+def test_history_flusher_sends_due_buffers_between_reruns(history_ws, tmp_path, monkeypatch):
+    _, ws = history_ws
+    flusher = app.HistoryFlusher(tick=3600)
+    w = app.HistoryWriter(ws, spill_path=str(tmp_path / "spill.jsonl"), flusher=flusher)
+    w.add([1])
+    flusher.run_once()                  # not due yet
+    assert ws.rows == [] and w in flusher.writers
+
+    monkeypatch.setattr(app, "HISTORY_FLUSH_SEC", 0)
+    flusher.run_once()
+    w._inflight.join()
+    assert ws.rows == [[1]] and w not in flusher.writers
+
+
+# Key -> row index for Theory / Checklist / QuizWeights / Review
+def test_row_index_build_append_delete():
+    idx = app.RowIndex()
+    idx.build([{"section": "A", "item": "x"}, {"section": "B", "item": "y"}, {"section": "A", "item": "x"}],
+              ["section", "item"])
+    assert idx.rows == {("A", "x"): 2, ("B", "y"): 3}  # first row wins for a duplicated key
+    assert idx.first_col == ["section", "A", "B", "A"]
+
+    idx.appended([("C", "z")], {"updates": {"updatedRange": "Checklist!A5:E5"}})
+    assert idx.valid and idx.rows[("C", "z")] == 5
+
+    idx.deleted(3)
+    assert idx.rows == {("A", "x"): 2, ("C", "z"): 4}
+    assert idx.first_col == ["section", "A", "A", "C"]
+
+    idx.appended([("D", "w")], {"updates": {"updatedRange": "Checklist!A9:E9"}})
+    assert not idx.valid  # the sheet put the row somewhere else: rebuild before trusting it
+
+
+def test_sheets_backend_upserts_and_deletes_through_the_index():
+    store = app.SheetsBackend(app._sheets_pool("service_account.json", "pytest_row_index"))
+    store.upsert_record(app.WS_CHECKLIST, ("A", "x"), [0, "t", "o"])
+    store.upsert_record(app.WS_CHECKLIST, ("B", "y"), [0, "t", "o"])
+    store.upsert_record(app.WS_CHECKLIST, ("A", "x"), [1, "t", "o"])
+    assert store.delete_record(app.WS_CHECKLIST, ("A", "x")) is True
+    assert store.delete_record(app.WS_CHECKLIST, ("A", "x")) is False
+    store.upsert_record(app.WS_CHECKLIST, ("B", "y"), [1, "t", "o"])
+    res = store.upsert_records(app.WS_CHECKLIST, {("B", "y"): [1, "t", "o"], ("C", "z"): [0, "t", "o"]})
+    assert res == {("B", "y"): "unchanged", ("C", "z"): "added"}
+    rows = [(r["section"], r["item"], r["checked"]) for r in store.load_records(app.WS_CHECKLIST)]
+    assert rows == [("B", "y", 1), ("C", "z", 0)]
+
+
+# Sheets connection pool
+def test_sheets_pool_connects_once_and_creates_missing_tabs():
+    import fake_gspread
+    pool = app.SheetsPool("service_account.json", "pytest_pool")
+    threads = [threading.Thread(target=pool.ensure) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert pool.generation == 1
+    sheets = fake_gspread.SERVER.spreadsheet("pytest_pool").sheets
+    for title, (keys, vals) in app.TABLE_SCHEMAS.items():
+        assert sheets[title].rows == [keys + vals]
+    other = app.SheetsPool("service_account.json", "pytest_pool")
+    other.ensure()   # the tabs exist now; adding one again would be a 400
+    assert set(other.handles) == set(pool.handles)
+
+
+def test_sheets_pool_reconnects_on_auth_failure_once_per_generation():
+    import fake_gspread
+    pool = app.SheetsPool("service_account.json", "pytest_pool_reconnect")
+    store = app.SheetsBackend(pool)
+    store.upsert_record(app.WS_CHECKLIST, ("A", "x"), [0, "t", "o"])
+    gen = pool.generation
+
+    fake_gspread.SERVER.fail_next(1, status=401)   # a read reconnects, then is retried
+    assert [r["item"] for r in store.load_records(app.WS_CHECKLIST)] == ["x"]
+    assert pool.generation == gen + 1
+
+    fake_gspread.SERVER.fail_next(1, status=401)   # a write reconnects but is not resent
+    with pytest.raises(app.gspread.exceptions.APIError):
+        store.upsert_record(app.WS_CHECKLIST, ("B", "y"), [0, "t", "o"])
+    assert pool.generation == gen + 2
+    assert [r["item"] for r in store.load_records(app.WS_CHECKLIST)] == ["x"]
+
+    pool.reconnect(seen_generation=gen)   # another thread already reconnected past `gen`
+    pool.reconnect()                      # and the last reconnect was moments ago
+    assert pool.generation == gen + 2
+
+
+# SQLite backend
+def test_sqlite_backend_users_history_and_records():
+    db = app.SQLiteBackend(":memory:")
+    db.add_user("u", "h1")
+    db.add_user("u", "h2")
+    assert db.user_exists("u") and db.password_hash("u") == "h2" and db.password_hash("w") is None
+
+    v0 = db.history_version()
+    db.append_history([["u", 2.0, 2026, 1, 1, "A", "a", 1, 1], ["w", 1.0, 2026, 1, 1, "A", "a", 0, 1],
+                       ["u", 1.0, 2026, 1, 1, "B", "b", 0, 1]])
+    assert db.history_version() != v0
+    assert [(r["timestamp"], r["category"]) for r in db.user_history("u")] == [(1.0, "B"), (2.0, "A")]
+    assert sorted(db.all_history_df()["username"]) == ["u", "u", "w"]
+
+    assert db.upsert_records(app.WS_CHECKLIST, {("A", "x"): [0, "t", "o"], ("B", "y"): [1, "t", "o"]}) == \
+        {("A", "x"): "added", ("B", "y"): "added"}
+    res = db.upsert_records(app.WS_CHECKLIST, {("A", "x"): [1, "t2", "o"], ("B", "y"): [1, "t2", "o"]})
+    assert res == {("A", "x"): "updated", ("B", "y"): "unchanged"}   # audit columns are not compared
+    assert db.delete_record(app.WS_CHECKLIST, ("B", "y")) is True
+    assert db.delete_record(app.WS_CHECKLIST, ("B", "y")) is False
+    assert [(r["section"], r["item"], r["checked"]) for r in db.load_records(app.WS_CHECKLIST)] == [("A", "x", 1)]
+
+
+def test_sqlite_mirror_copies_each_change_once():
+    db = app.SQLiteBackend(":memory:")
+    db.add_user("m", "h")
+    db.append_history([_answer(1.0, True, user="m"), _answer(2.0, False, user="m")])
+    db.upsert_record(app.WS_WEIGHTS, ("A", "a"), [2.0, "t", "o"])
+    sheets = app.SheetsBackend(app._sheets_pool("service_account.json", "pytest_mirror"))
+    assert db.mirror_to(sheets) == {"history": 2, "users": 1, "records": 1, "failed": 0}
+    assert db.mirror_to(sheets) == {"history": 0, "users": 0, "records": 0, "failed": 0}
+    db.append_history([_answer(3.0, True, user="m")])
+    assert db.mirror_to(sheets)["history"] == 1
+    assert [r["timestamp"] for r in sheets.ws_history.get_all_records()] == [1.0, 2.0, 3.0]
+
+
+def test_sqlite_rebuilds_topic_stats_of_an_older_layout(tmp_path):
+    path = str(tmp_path / "old.db")
+    db = app.SQLiteBackend(path)
+    db.append_history([_answer(float(i), i % 2) for i in range(4)])
+    assert db.topic_stats("u").totals() == (4, 2)
+    db.conn.executescript("DROP TABLE topic_stats; CREATE TABLE topic_stats (username TEXT, category TEXT, solved INTEGER);")
+    db.conn.close()
+    db = app.SQLiteBackend(path)
+    assert db.topic_stats("u").totals() == (4, 2)
+
+
+# Question spaces
+@pytest.mark.parametrize("n", [1, 2, 3, 7, 64, 1000, 4685])
+def test_index_permutation_is_a_bijection(n):
+    perm = app.IndexPermutation(n, random.Random(n))
+    assert sorted(perm) == list(range(n))
+    with pytest.raises(IndexError):
+        perm[n]
+
+
+def test_question_space_decodes_mixed_radix_params():
+    space = app.QuestionSpace(lambda a, b: app.Question("C", "S", f"{a}{b}", [f"{a}{b}"], "text"), "xy", [1, 2, 3])
+    assert len(space) == 6
+    assert [space.params(i) for i in range(6)] == [("x", 1), ("x", 2), ("x", 3), ("y", 1), ("y", 2), ("y", 3)]
+    assert space[4].prompt == "y2" and space[4].item == 4
+
+
+def test_question_space_sample_has_no_repeats_until_exhausted():
+    space = app.GEN_SPACES[("Warming up", "Solfege")]
+    qs = space.sample_without_replacement(len(space) + 3, random.Random(5))
+    first = [q.item for q in qs[:len(space)]]
+    assert sorted(first) == list(range(len(space)))
+    assert len(set(q.item for q in qs[len(space):])) == 3
+
+
+def test_question_space_empty_stream_ends():
+    space = app.QuestionSpace(lambda a: app.Question("C", "S", a, [a], "text"), [])
+    assert len(space) == 0
+    assert space.sample_without_replacement(5) == []
+
+
+def test_question_builds_are_traced_per_topic_on_every_path(monkeypatch):
+    monkeypatch.setattr(app, "TRACER", app.Tracer(enabled=True))
+    topic = ("Cycle of 5th", "P5 up")
+    app.GEN_SPACES[topic].sample_without_replacement(3, random.Random(0))
+    app.ReviewScheduler("u").quiz(2, app.AliasSampler([topic], [1.0]), random.Random(1))
+    app.generate_question(*topic)
+    assert app.TRACER.calls == {"gen/Cycle of 5th/P5 up": 6}
+
+
+# Sheets rate limiting
+def test_token_bucket_spends_the_burst_then_paces():
+    bucket = app.TokenBucket(per_min=600, capacity=2)  # 10 tokens/s
+    t0 = time.monotonic()
+    bucket.acquire()
+    bucket.acquire()
+    assert time.monotonic() - t0 < 0.05
+    for _ in range(3):
+        bucket.acquire()
+    assert 0.25 <= time.monotonic() - t0 < 1.0
+    assert bucket.available() < 1.0
+
+
+def test_circuit_breaker_opens_then_lets_one_trial_through():
+    br = app.CircuitBreaker(threshold=2, open_sec=0.1)
+    br.record(False)
+    assert br.allow() and not br.is_open()
+    br.record(False)
+    assert br.is_open() and not br.allow()
+
+    time.sleep(0.12)
+    assert br.allow()          # half-open: one trial call
+    assert not br.allow()      # ... and only one
+    br.record(False)           # trial failed: open again
+    assert br.is_open()
+
+    time.sleep(0.12)
+    assert br.allow()
+    br.record(True)            # trial succeeded: closed
+    assert not br.is_open() and br.allow() and br.failures == 0
+
+
+def test_sheets_io_retries_transport_errors(monkeypatch):
+    monkeypatch.setattr(app, "SHEETS_BACKOFF_BASE_SEC", 0.0)
+    io = app.SheetsIO()
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionResetError("reset by peer")   # an OSError without an HTTP status
+        return "ok"
+
+    assert io.call(flaky) == "ok" and len(calls) == 2
+
+    def append_rows():                  # may have landed before the connection dropped
+        calls.append(1)
+        raise ConnectionResetError("reset by peer")
+
+    with pytest.raises(ConnectionResetError):
+        io.call(append_rows)
+    assert len(calls) == 3
+
+
+def test_queued_write_waits_for_the_breaker_instead_of_failing():
+    io = app.SheetsIO()
+    io.breaker = app.CircuitBreaker(threshold=1, open_sec=0.2)
+    io.breaker.record(False)
+    assert io.breaker.is_open() and io.breaker.retry_in() > 0
+    fut = io.submit(io.call, lambda: "written")
+    assert fut.result(timeout=5) == "written"
+    assert not io.breaker.is_open()
+
+
+def test_store_outages_degrade_and_bugs_propagate(monkeypatch):
+    mgr = app.StatManager(store=app.SQLiteBackend(":memory:"))
+
+    def down(table):
+        raise app.SheetsUnavailable("breaker open")
+
+    monkeypatch.setattr(mgr.store, "load_records", down)
+    assert mgr.load_theory_df().empty and mgr.degraded
+
+    def bug(table):
+        raise KeyError(table)
+
+    monkeypatch.setattr(mgr.store, "load_records", bug)
+    with pytest.raises(KeyError):
+        mgr.load_checklist_df()
+
+
+# Answer grading
+def _canon(kind: str, s: str, spelled: bool = False) -> str:
+    return app.canonical_answer(kind, app.normalize_user_input(s), spelled)
+
+
+@pytest.mark.parametrize("kind, spellings", [
+    ("pitch", ["C#", "c#", "Db"]),
+    ("pitch", ["Gb", "f#"]),
+    ("chord", ["DbM7", "Dbmaj7", "C#maj7"]),
+    ("chord", ["Gb/A#", "F#/Bb"]),
+    ("degree", ["IV-7", "IVm7"]),
+    ("degree", ["#IVø", "#IVm7b5"]),
+    ("interval", ["A4", "+4"]),
+    ("interval", ["P.5", "p5", "P5"]),
+    ("tension", ["+11", "#11"]),
+    ("solfege", ["so", "SOL", "Sol"]),
+    ("number", ["07", "7"]),
+    ("text", ["YES", "yes"]),
+])
+def test_canonical_answer_equates_spellings(kind, spellings):
+    assert len({_canon(kind, s) for s in spellings}) == 1
+
+
+def test_canonical_answer_keeps_distinct_answers_apart():
+    assert _canon("pitch", "C#") != _canon("pitch", "D")
+    assert _canon("chord", "C7") != _canon("chord", "Cmaj7")
+    assert _canon("interval", "m3") != _canon("interval", "M3")
+
+
+def test_canonical_answer_folds_only_black_key_pairs():
+    for odd, plain in [("B#", "C"), ("Cb", "B"), ("E#", "F"), ("Fb", "E"), ("C##", "D"), ("Dbb", "C")]:
+        assert _canon("pitch", odd) != _canon("pitch", plain)
+    assert _canon("chord", "Cbmaj7") != _canon("chord", "Bmaj7")
+    assert _canon("pitch", "C#", spelled=True) != _canon("pitch", "Db", spelled=True)
+    assert _canon("pitch", "c#", spelled=True) == _canon("pitch", "C#", spelled=True)
+
+
+def _question(key, prompt):
+    return next(q for q in app.GEN_SPACES[key] if q.prompt == prompt)
+
+
+@pytest.mark.parametrize("key, prompt, wrong, right", [
+    (("Warming up", "Chord tones"), "What are the Chord tones of Cmaj7?", "B#, E, G, B", "c, e, g, b"),
+    (("Intervals", "Tracking"), "From C, what is m2?", "C#", "Db"),
+    (("Warming up", "Key signatures"), "What major key has (####)?", "Fb", "E"),
+    (("Cycle of 5th", "P5 down"), "P5 down from C is?", "E#", "F"),
+])
+def test_wrong_spellings_are_rejected(key, prompt, wrong, right):
+    q = _question(key, prompt)
+    assert not app.is_answer_correct(q, wrong)
+    assert app.is_answer_correct(q, right)
+
+
+def test_canonical_answer_table_matches_the_slow_path():
+    for kind, table in app._ANSWER_CANON.items():
+        for token, canon in table.items():
+            assert app._CANON_SLOW[kind](token) == canon, (kind, token)
+    assert app.canonical_answer("chord", "Xyz") == "Xyz"  # unparsable input is compared as typed
+
+
+def test_every_generated_question_accepts_its_own_answers():
+    for key, space in app.GEN_SPACES.items():
+        for q in space:
+            typed = (q.sep + " ").join(q.answers) if q.sep else q.answers[0]
+            assert app.is_answer_correct(q, typed), (key, q.prompt, q.answers)
+
+
+# Spaced review
+def test_indexed_min_heap_order_after_updates():
+    rng = random.Random(11)
+    heap, ref = app.IndexedMinHeap(), {}
+    for step in range(2000):
+        key = rng.randrange(200)
+        if key in ref and rng.random() < 0.3:
+            heap.remove(key)
+            del ref[key]
+        else:
+            pri = rng.random()
+            heap.push(key, pri)
+            ref[key] = pri
+        if step % 97 == 0:
+            ordered = sorted(ref.items(), key=lambda kv: kv[1])
+            assert heap.nsmallest(10) == ordered[:10]
+            assert heap.count_upto(0.5) == sum(1 for p in ref.values() if p <= 0.5)
+    assert len(heap) == len(ref)
+    popped = [heap.pop() for _ in range(len(heap))]
+    assert popped == sorted(ref.items(), key=lambda kv: kv[1])
+    assert heap.peek() is None
+
+
+def test_sm2_schedule():
+    sched = app.ReviewScheduler("u")
+    key, now, day = ("Warming up", "Solfege", 0), 1_000_000.0, 86400
+    sched.answer(key, 5, now)
+    it = sched.get(key)
+    assert (it.reps, it.interval, it.due) == (1, 1, now + day)
+    assert it.ef == pytest.approx(2.6)
+    sched.answer(key, 4, now)
+    assert (it.reps, it.interval) == (2, 6)
+    assert it.ef == pytest.approx(2.6)
+    sched.answer(key, 3, now)
+    assert (it.reps, it.interval) == (3, round(6 * 2.6))  # the interval grows by the ef before the answer
+    assert it.ef == pytest.approx(2.46)
+
+    sched.answer(key, app.answer_quality(0, solved=False), now)
+    assert (it.reps, it.interval, it.lapses) == (0, 0, 1)
+    assert it.due == now + app.REVIEW_RELEARN_MIN * 60
+    for _ in range(20):
+        sched.answer(key, 1, now)
+    assert it.ef == app.REVIEW_EF_MIN
+
+
+def test_review_scheduler_due_order_new_keys_and_round_trip():
+    sched = app.ReviewScheduler("u")
+    topic = ("Warming up", "Solfege")
+    now = 1_000_000.0
+    for i, q in enumerate([5, 1, 4, 1]):
+        sched.answer(topic + (i,), q, now - 3600 * (4 - i))
+    due, ahead = sched.next_keys(10, now)
+    assert due == [topic + (1,), topic + (3,)]  # the two misses, most overdue first
+    assert ahead == [topic + (0,), topic + (2,)]
+    assert sched.due_count(now) == 2
+
+    new = sched.new_keys(50, app.AliasSampler([topic], [1.0]), random.Random(2))
+    assert len(new) == len(set(new)) == len(app.GEN_SPACES[topic]) - 4
+    assert not set(new) & {topic + (i,) for i in range(4)}
+
+    rows = sched.take_dirty()
+    assert list(rows) == [topic] and not sched.dirty
+    back = app.ReviewScheduler("u")
+    back.load([{"category": topic[0], "subcategory": topic[1], "items": rows[topic]}])
+    assert back.next_keys(10, now) == (due, ahead)
+
+
+@pytest.mark.parametrize("tracked", [4, 9])   # redraws while most items are free, a list once few are
+def test_review_new_keys_are_uniform_over_untracked_items(tracked):
+    topic = ("Cycle of 5th", "P5 up")
+    sched = app.ReviewScheduler("u")
+    for i in range(tracked):
+        sched.answer(topic + (i,), 5, 0.0)
+    sampler, rng = app.AliasSampler([topic], [1.0]), random.Random(3)
+    draws = Counter(k[2] for _ in range(6000) for k in sched.new_keys(1, sampler, rng))
+    free = len(app.GEN_SPACES[topic]) - tracked
+    assert set(draws) == set(range(tracked, tracked + free))
+    assert all(abs(c / 6000 * free - 1) < 0.15 for c in draws.values())
+
+
+def test_review_rows_come_from_the_row_index_and_saves_skip_the_diff_read():
+    pool = app._sheets_pool("service_account.json", "pytest_review_rows")
+    store = app.SheetsBackend(pool)
+    ws = pool.worksheet(app.WS_REVIEW)._ws
+    orig, reads = ws.get_all_records, []
+    ws.get_all_records = lambda *a, **kw: reads.append(1) or orig(*a, **kw)
+    try:
+        res = store.write_records(app.WS_REVIEW, {("u", "A", "a"): ["v1 1", "t", "u"], ("w", "A", "a"): ["v1 2", "t", "w"]})
+        assert res == {("u", "A", "a"): "added", ("w", "A", "a"): "added"}
+        assert store.write_records(app.WS_REVIEW, {("u", "A", "a"): ["v1 3", "t", "u"]}) == {("u", "A", "a"): "updated"}
+        store.upsert_record(app.WS_REVIEW, ("u", "B", "b"), ["v1 4", "t", "u"])
+        assert [(r["subcategory"], r["items"]) for r in store.user_records(app.WS_REVIEW, "u")] == [("a", "v1 3"), ("b", "v1 4")]
+        assert len(reads) == 1   # the row index's first build
+    finally:
+        del ws.get_all_records
+    fresh = [r for r in store.load_records(app.WS_REVIEW) if r["username"] == "u"]
+    assert store.user_records(app.WS_REVIEW, "u") == fresh
+
+    sqlite = app.SQLiteBackend(":memory:")
+    sqlite.write_records(app.WS_REVIEW, {("u", "A", "a"): ["v1 1", "t", "u"], ("w", "A", "a"): ["v1 2", "t", "w"]})
+    assert [r["items"] for r in sqlite.user_records(app.WS_REVIEW, "u")] == ["v1 1"]
+
+
+# Per-topic statistics
+def _history_rows(now, n=600, seed=5):
+    rng = random.Random(seed)
+    now_ts = (now - datetime.datetime(1970, 1, 1)).total_seconds()
+    cutoff_ts = now_ts - 30 * 86400
+    topics = [("Intervals", "Tracking"), ("Tritones", "Pitch"), ("Minor", "Pitch")]
+    rows = []
+    for i in range(n):
+        ts = now_ts - rng.uniform(0, 60 * 86400)
+        if i % 10 == 0:
+            ts = cutoff_ts + rng.choice([-1.0, 1.0]) * rng.uniform(1, 3600)  # the window edge's day
+        cat, sub = rng.choice(topics)
+        rows.append(["u", ts, 0, 0, 0, cat, sub, int(rng.random() < 0.6), 1])
+    # a trailing wrong run that arrives before the correct answer preceding it
+    rows.append(["u", now_ts - 10, 0, 0, 0, "Tritones", "Pitch", 0, 1])
+    rows.append(["u", now_ts - 20, 0, 0, 0, "Tritones", "Pitch", 1, 1])
+    rng.shuffle(rows)
+    return rows
+
+
+def _assert_same_features(stats, rows, now, days=30):
+    recs = [dict(zip(app.HISTORY_COLS, r)) for r in rows]
+    want = app._topic_features(app.stat_df_from_history(recs), days, now=now).reset_index(drop=True)
+    got = stats.frame(days, now=now)
+    pd.testing.assert_frame_equal(got, want, check_dtype=False)
+    assert app._recommend_weights(got) == app._recommend_weights(want)
+
+
+def test_topic_features_by_hand():
+    now = datetime.datetime(2026, 3, 1, 12, 0)
+    day = datetime.timedelta(days=1)
+    df = pd.DataFrame([
+        # A: old hit, then (listed out of order) a hit and two trailing misses in the window
+        ("u", now - 40 * day, "A", "a", 1),
+        ("u", now - 2 * day, "A", "a", 0),
+        ("u", now - 3 * day, "A", "a", 1),
+        ("u", now - 1 * day, "A", "a", 0),
+        ("w", now - 5 * day, "A", "a", 1),
+        # B: never right, last seen 20 days ago; a row without a time is ignored
+        ("u", now - 20 * day, "B", "b", 0),
+        ("u", pd.NaT, "B", "b", 1),
+    ], columns=["username", "ts", "category", "subcategory", "is_correct"])
+    got = app._topic_features(df, 7, now=now).set_index(["category", "subcategory"])
+    assert got.loc[("A", "a")].to_dict() == {"solved": 5, "acc": 60.0, "recent_solved": 4, "recent_acc": 50.0,
+                                             "wrong_streak": 2, "last_seen_days": 1}
+    assert got.loc[("B", "b")].to_dict() == {"solved": 1, "acc": 0.0, "recent_solved": 0, "recent_acc": 0.0,
+                                             "wrong_streak": 1, "last_seen_days": 20}
+
+    cohort = app._topic_features(df, 7, keys=app.COHORT_KEYS, now=now).set_index(app.COHORT_KEYS)
+    assert cohort.loc[("u", "A", "a"), "solved"] == 4 and cohort.loc[("w", "A", "a"), "wrong_streak"] == 0
+    assert list(app._topic_features(df.iloc[:0], 7).columns) == app.TOPIC_FEATURE_COLS
+
+
+def test_weight_scores_apply_each_rule_group():
+    feats = pd.DataFrame([
+        ("A", "a", 100, 40.0, 10, 30.0, 5, 40),   # weak: recent accuracy, volume, streak and recency all add
+        ("B", "b", 4, 0.0, 4, 0.0, 3, 14),        # too few answers: accuracy and volume are gated off
+        ("C", "c", 70, 95.0, 2, 0.0, 0, 0),       # strong; too few recent answers to use recent_acc
+    ], columns=app.TOPIC_FEATURE_COLS)
+    assert app._weight_scores(feats) == pytest.approx([4.45, 1.7, 0.2])
+    assert app._weight_scores(feats, ceil=4.0, floor=0.5) == pytest.approx([4.0, 1.7, 0.5])
+    assert app._weight_scores(feats, rules=[("x", "acc", "<", 50, -5.0)]) == pytest.approx([0.0, 0.0, 1.0])
+    assert set(app._recommend_weights(feats.iloc[:0], base=2.0).values()) == {2.0}   # no history: every topic at base
+
+    for bad in [("x", "acc", "<", 50), ("x", "nope", "<", 50, 1), ("x", "acc", "~", 50, 1), ("x", "acc", "<", "hi", 1)]:
+        with pytest.raises(ValueError):
+            app._check_weight_rules([bad])
+
+
+def test_topic_stats_match_topic_features():
+    now = datetime.datetime(2026, 3, 1, 15, 30)
+    rows = _history_rows(now)
+    recs = [dict(zip(app.HISTORY_COLS, r)) for r in rows]
+    _assert_same_features(app.TopicStats.from_rows(recs), rows, now)
+    _assert_same_features(app.TopicStats.from_rows(recs).copy(), rows, now, days=7)
+
+
+def test_history_index_and_sqlite_topic_stats_match_topic_features():
+    now = datetime.datetime(2026, 3, 1, 15, 30)
+    rows = _history_rows(now)
+    idx = app.HistoryIndex()
+    idx.reset(app.HISTORY_COLS)
+    idx.add_local(rows[:50])            # recorded here, then read back from the sheet
+    idx.ingest(rows[:400])
+    _assert_same_features(idx.user_stats("u"), rows[:400], now)
+    idx.ingest(rows[400:])
+    _assert_same_features(idx.user_stats("u").copy(), rows, now)
+
+    db = app.SQLiteBackend(":memory:")
+    db.append_history(rows[:300])
+    db.topic_stats("u")                 # built from history, then bumped per append
+    db.append_history(rows[300:])
+    _assert_same_features(db.topic_stats("u"), rows, now)
+
+
+def _answer(ts, ok, topic=("Intervals", "Tracking"), user="u"):
+    return [user, ts, 0, 0, 0, topic[0], topic[1], int(ok), 1]
+
+
+def test_history_index_counts_local_rows_once_and_drops_unsent_ones():
+    idx = app.HistoryIndex()
+    idx.reset(app.HISTORY_COLS)
+    a, b = _answer(1000.0, True), _answer(2000.0, False)
+    idx.add_local([a, b])
+    assert idx.topic_stats("u").totals() == (2, 1)
+    idx.ingest([a])                     # read back from the sheet
+    assert idx.topic_stats("u").totals() == (2, 1)
+    assert idx.user_stats("u").totals() == (1, 1)
+    idx.drop_local([b])                 # its write was spilled
+    assert idx.topic_stats("u").totals() == (1, 1) and idx.local["u"] == {}
+
+
+def test_sheets_topic_stats_are_saved_and_only_rows_past_the_checkpoint_are_counted(monkeypatch):
+    monkeypatch.setattr(app, "TOPIC_STATS_SAVE_SEC", 0)
+    app._history_index.clear()
+    pool = app._sheets_pool("service_account.json", "pytest_topic_stats")
+    store = app.SheetsBackend(pool)
+    now = time.time()
+    store.append_history([_answer(now - 60 + i, i % 2) for i in range(6)])
+    assert store.flush_history()
+    store.sync_history()
+    pool.io.submit(lambda: None).result()   # the save is queued on the writer
+    saved = store.load_records(app.WS_TOPIC_STATS)
+    assert [(r["username"], r["solved"], r["correct"], r["history_row"]) for r in saved] == [("u", 6, 3, 7)]
+
+    # a restarted process takes the saved counts and only counts the rows after them
+    pool.worksheet(app.WS_TOPIC_STATS).update("D2", [[100]])
+    app._history_index.clear()
+    store.append_history([_answer(now, True)])
+    assert store.flush_history()
+    store.sync_history()
+    assert store.topic_stats("u").totals() == (101, 4)
+    pool.io.submit(lambda: None).result()
+
+    # rows deleted before the checkpoint: the topic is counted from History again
+    pool.worksheet(app.WS_HISTORY).delete_rows(2)
+    app._history_index.clear()
+    store.sync_history()
+    assert store.topic_stats("u").totals() == (6, 4)
+
+
+def test_sync_history_reads_without_the_index_lock_and_rereads_after_a_race():
+    app._history_index.clear()
+    pool = app._sheets_pool("service_account.json", "pytest_history_sync")
+    store = app.SheetsBackend(pool)
+    now = time.time()
+    store.append_history([_answer(now - 10 + i, True) for i in range(3)])
+    assert store.flush_history()
+    store.sync_history()
+    idx = app._history_index(store.key)
+    assert idx.hwm == 4
+
+    ws = pool.worksheet(app.WS_HISTORY)._ws
+    orig_get = ws.get
+    free = []
+
+    def racing_get(rng, **kw):
+        t = threading.Thread(target=lambda: free.append(idx.lock.acquire(timeout=1) and not idx.lock.release()))
+        t.start()
+        t.join()
+        if len(free) == 1:
+            # another session appends a row and syncs it while this read is in flight
+            ws.append_rows([_answer(now, True)])
+            out = orig_get(rng, **kw)
+            store.sync_history()
+            return out
+        return orig_get(rng, **kw)
+
+    ws.get = racing_get
+    try:
+        store.sync_history()
+    finally:
+        del ws.get
+    assert free and all(free)
+    assert idx.hwm == 5 and len(idx.user_rows("u")) == 4
+    assert store.topic_stats("u").totals() == (4, 4)
+
+    # the last consumed row was edited: the index is rebuilt from the sheet
+    ws.update("H5", [[0]])
+    store.sync_history()
+    assert idx.hwm == 5 and store.topic_stats("u").totals() == (4, 3)